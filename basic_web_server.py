@@ -1,35 +1,55 @@
-import uasyncio as asyncio
-import json
 import time
 import machine
 
 from wifi import WiFi
+from http_server import HTTPServer
+from config import Config
+from template import Template
+import trace
 
 class BasicWebServer(object):
     """@brief Responsible for providing a basic web server to serve files from
               flash."""
 
+    TCP_PORT           = 80                # The TCP port to present the web server on.
     WEB_ROOT_FOLDER    = '/webroot/'       # The folder in which all the files served by this server sit.
-    GET_REQUEST        = 1                 # An identifier for an HTTP GET.
-    POST_REQUEST       = 2                 # An identifier for an HTTP POST.
-    GET_REQUEST_STRING = 'GET'             # The String that must be present in an http GET request.
     FAVICON            = '/favicon.ico'    # The favicon file for the server.
     ROOT_FILE          = '/'               # The match for a root folder in an http request where no file is specified.
     INDEX_HTML         = 'index.html'      # The default http file served by the server.
     SETUP_HTML         = 'setup.html'      # The file served by the web server when in WiFi setup mode.
     PRODUCT_HTML       = 'product.html'    # The file served by the web server when not in WiFi setup mode.
     SETUP_WIFI_HTML    = 'setup_wifi.html' # The file served to the user when the WiFi setup is complete.
-    WIFI_NETWORKS_STRING = '$WIFINETWORKS' # The text in the setup.html file that is replaced with the WiFi networks found.
-
-    def __init__(self, uo):
-        """@brief Constructor"""
+    WIFI_NETWORKS_SLOT = 'WIFINETWORKS'    # The slot ($WIFINETWORKS) in the setup.html file that is replaced with the WiFi networks found.
+    TEMPLATE_FILE_TYPES = ('.html', '.css', '.js') # Files that may hold slots (see template.py). Other files are sent as they are.
+    BUFFER_SIZE        = 512               # The size of the buffer files are read through if no BufferPool is used.
+
+    def __init__(self, uo, httpServer=None, bufferPool=None, config=None):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user.
+           @param httpServer The HTTPServer instance that the web server is added to. If None
+                             the web server creates its own HTTPServer instance.
+           @param bufferPool A BufferPool instance (memory.py) holding the buffers that files are
+                             sent through. If None files without slots are read whole.
+           @param config The Config instance that the WiFi configuration is saved to. If None
+                         the config is loaded from flash."""
         self._uo = uo
+        self._config = config
+        if self._config is None:
+            self._config = Config(uo)
+        self._bufferPool = bufferPool
+        self._httpServer = httpServer
+        if self._httpServer is None:
+            self._httpServer = HTTPServer(uo)
         self._setup_wifi_mode = True
         self._wifiNetworkList = []
         self._wifi_networks_string = ""
+        # The template of each file served (None if the file has no slots).
+        self._templateDict = {}
+        self._slotProviderDict = {}
+        self.addSlotProvider(BasicWebServer.WIFI_NETWORKS_SLOT, self._get_wifi_networks)
 
-        #If we have a Wifi config file then the user has already setup the WiFi
-        wifiCfgDict = WiFi.GetWifiCfgDict()
+        #If we have a Wifi config then the user has already setup the WiFi
+        wifiCfgDict = self._config.getSection(WiFi.WIFI_CFG_SECTION)
         if wifiCfgDict:
             self._setup_wifi_mode = False
 
@@ -40,143 +60,159 @@ class BasicWebServer(object):
         self._wifi_networks_string = wifi_networks_string
 
     def start(self):
-        """@brief start the web server running."""
-        asyncio.create_task(asyncio.start_server(self._serve_client, "0.0.0.0", 80))
-
-    def _get_request_element_list(self, request_string):
-        """@brief Get a list of request elements.
-           @param request_string The string containing the HTTP request.
-           @return A list of strings that compose the HTTP request."""
-        return request_string.split()
-
-    def is_get_request(self, request_elements):
-        """@brief Determine if the request is a get request.
-           @param request_elements A list of strings in the HTTP request.
-           @return True if the request == HTTP GET."""
-        get_request = False
-        if len(request_elements) > 0:
-            req_type_string = request_elements[0]
-            if req_type_string.startswith(BasicWebServer.GET_REQUEST_STRING):
-                get_request = True
-            return get_request
-        else:
-            raise Exception('{} is an invalid HTTP request.'.format( str(request_elements) ))
-
-    def get_file(self, request_elements):
-        """@brief get the file in the HTTP request.
-           @param request_elements A list of strings in the HTTP request.
-           @return The file in the HTTP request."""
-        if len(request_elements) >= 1:
-            return request_elements[1]
-        else:
-            raise Exception('{} is an invalid HTTP request.'.format( str(request_elements) ))
-
-    def _get_file_contents(self, the_file):
-        """@brief Get the contents of a file from flash.
-           @param the_file The file to read."""
-        fd = open(the_file, 'rb')
-        file_contents = fd.read()
-        fd.close()
-        file_contents = self.process_file_contents(the_file, file_contents)
-        return file_contents
-
-    def process_file_contents(self, the_file, file_contents):
-        """@brief Process the contents of a file. This method does nothing but return
-                  the contents as passed. However it allows BasicWebServer subclasses
-                  to change the contents of the file as requried. Typically this involves
-                  replacing text in the file to create dynamic web pages.
-           @param the_file The absolute path to the file in flash.
-           @param file_contents The contents of the file in flash.
-           @return The process file contents."""
+        """@brief start the web server running.
+                  Files are served for all requests that are not handled by another
+                  server (E.G the REST server) added to the HTTPServer."""
+        self._httpServer.setDefaultHandler(self._serve_request)
+        self._httpServer.listen(BasicWebServer.TCP_PORT)
+
+    def addSlotProvider(self, name, provider):
+        """@brief Add a slot to the web pages. Each $<name> in a served file is replaced by the
+                  value returned by the provider when the file is served. Subclasses add
+                  their slots using this method to create dynamic web pages.
+           @param name The slot name (upper case letters, digits and _ characters, E.G UNIT_NAME).
+           @param provider A function that takes no arguments and returns the slot value (str or bytes)."""
+        self._slotProviderDict[name] = provider
+        # The cached templates only hold the slots known when they were created.
+        self._templateDict = {}
+
+    def _get_wifi_networks(self):
+        """@brief Get the value of the WIFINETWORKS slot.
+           @return The known WiFi networks."""
+        return self._wifi_networks_string
+
+    def _get_buffer(self):
+        """@brief Get a buffer to read a file through.
+           @return A bytearray."""
+        if self._bufferPool:
+            return self._bufferPool.get()
+        return bytearray(BasicWebServer.BUFFER_SIZE)
+
+    def _put_buffer(self, buf):
+        """@brief Return a buffer obtained by _get_buffer().
+           @param buf The bytearray."""
+        if self._bufferPool:
+            self._bufferPool.put(buf)
+
+    def _get_template(self, abs_file, fd):
+        """@brief Get the template of a file. Each file is split into static chunks and
+                  slots the first time it is served and the result is held.
+           @param abs_file The absolute path to the file in flash.
+           @param fd The open file.
+           @return A Template instance or None if the file has no slots."""
+        if abs_file in self._templateDict:
+            return self._templateDict[abs_file]
+        buf = self._get_buffer()
         try:
-            c = file_contents.decode()
-            if c.find(BasicWebServer.WIFI_NETWORKS_STRING) >= 0:
-                c = c.replace(BasicWebServer.WIFI_NETWORKS_STRING, self._wifi_networks_string)
-            return c.encode()
-        except:
-            return file_contents
-
-    def _serve_file(self, the_file, writer):
+            template = Template(fd, buf, self._slotProviderDict)
+        finally:
+            self._put_buffer(buf)
+        fd.seek(0)
+        # Files with no slots are sent as they are.
+        if not template.slots:
+            template = None
+        self._templateDict[abs_file] = template
+        return template
+
+    async def _serve_file(self, the_file, request):
         """@brief serve the file to the client from mthe web root folder.
            @param the_file The file to server to the client.
-           @param writer The instance to use to send data back to the client."""
+           @param request The HTTPRequest instance used to send data back to the client."""
         abs_file = '{}{}'.format(BasicWebServer.WEB_ROOT_FOLDER, the_file)
         self._uo.debug("Serve file: {}".format(abs_file))
         try:
-            file_contents = self._get_file_contents(abs_file)
-            if the_file.endswith('.css'):
-                mime_type = "text/css"
-
-            elif the_file.endswith('.js'):
-                mime_type = "application/javascript"
+            trace.begin("web.open", request.track)
+            fd = open(abs_file, 'rb')
+            trace.end("web.open", request.track)
+        except OSError:
+            await request.send_response("text/html", "", status=HTTPServer.STATUS_NOT_FOUND)
+            return
 
-            elif the_file.endswith('.ico'):
-                mime_type = "image/x-icon"
+        if the_file.endswith('.css'):
+            mime_type = "text/css"
 
-            elif the_file.endswith('.png'):
-                mime_type = "image/png"
+        elif the_file.endswith('.js'):
+            mime_type = "application/javascript"
 
-            elif the_file.endswith('.jpg'):
-                mime_type = "image/jpg"
+        elif the_file.endswith('.ico'):
+            mime_type = "image/x-icon"
 
-            else:
-                # Default to a text file
-                mime_type = "text/html"
-            writer.write('HTTP/1.0 200 OK\r\nContent-type: {}\r\n\r\n'.format(mime_type))
-            writer.write(file_contents)
-
-        except:
-            raise
-            writer.write('HTTP/1.0 404 {} file not found.\r\nContent-type: text/html\r\n\r\n'.format(abs_file))
+        elif the_file.endswith('.png'):
+            mime_type = "image/png"
 
-    def _serve_client(self, reader, writer):
-        self._uo.debug("Client connected")
+        elif the_file.endswith('.jpg'):
+            mime_type = "image/jpg"
 
+        else:
+            # Default to a text file
+            mime_type = "text/html"
+        try:
+            template = None
+            if the_file.endswith(BasicWebServer.TEMPLATE_FILE_TYPES):
+                template = self._get_template(abs_file, fd)
+            if template:
+                await self._send_template(template, fd, mime_type, request)
+            elif self._bufferPool:
+                await self._send_file(fd, mime_type, request)
+            else:
+                await request.send_response(mime_type, fd.read())
+        finally:
+            fd.close()
+
+    async def _send_template(self, template, fd, mime_type, request):
+        """@brief Send a file with the value of each slot in place of the slot.
+           @param template The Template instance of the file.
+           @param fd The open file.
+           @param mime_type The content type of the file.
+           @param request The HTTPRequest instance used to send data back to the client."""
+        buf = self._get_buffer()
+        try:
+            request.start_response(mime_type)
+            await template.send(fd, buf, request, self._slotProviderDict)
+        finally:
+            self._put_buffer(buf)
+
+    async def _send_file(self, fd, mime_type, request):
+        """@brief Send a file through a pooled buffer so that the file is not read whole.
+           @param fd The open file.
+           @param mime_type The content type of the file.
+           @param request The HTTPRequest instance used to send data back to the client."""
+        buf = self._bufferPool.get()
+        try:
+            mv = memoryview(buf)
+            request.start_response(mime_type)
+            while True:
+                count = fd.readinto(buf)
+                if not count:
+                    break
+                await request.write(mv[:count])
+        finally:
+            self._bufferPool.put(buf)
+
+    async def _serve_request(self, request):
+        """@brief Serve a request for a file or a POST of the WiFi configuration.
+           @param request The HTTPRequest instance."""
         reboot = False
 
-        request_line = await reader.readline()
-        # Get a list of the elements in the HTTP request.
-        request_elements = self._get_request_element_list(request_line.decode())
-        self._uo.debug("request_elements={}".format(request_elements))
-        # Read headers
-        header_lines= []
-        while True:
-            header_line = await reader.readline()
-            # If the end of the header lines
-            if header_line == b"\r\n" or header_line == b"":
-                break
-            header_line = header_line.decode()
-            header_lines.append(header_line)
-            self._uo.debug("header_line=<{}>".format(header_line))
-
-        self._uo.debug('http request: {}'.format( str(request_elements) ))
-
-        if request_elements[0] == 'GET':
-            if self.is_get_request(request_elements):
-                http_file = self.get_file(request_elements)
-                # Expand the root folder to the index.html file or if index.html requested
-                if http_file == BasicWebServer.ROOT_FILE or http_file == BasicWebServer.INDEX_HTML:
-                    # Return the root html file for the current mode.
-                    if self._setup_wifi_mode:
-                        self._serve_file(BasicWebServer.SETUP_HTML, writer)
-                    # If not in WiFi setup mode serve the html file for the product
-                    else:
-                        self._serve_file(BasicWebServer.PRODUCT_HTML, writer)
+        self._uo.debug('http request: {} {}'.format(request.method, request.target))
 
+        if request.method == 'GET':
+            http_file = request.path
+            # Expand the root folder to the index.html file or if index.html requested
+            if http_file == BasicWebServer.ROOT_FILE or http_file == BasicWebServer.INDEX_HTML:
+                # Return the root html file for the current mode.
+                if self._setup_wifi_mode:
+                    await self._serve_file(BasicWebServer.SETUP_HTML, request)
+                # If not in WiFi setup mode serve the html file for the product
                 else:
-                    self._serve_file(http_file, writer)
-
-        elif request_elements[0] == 'POST':
-            readCount=0
-            for line in header_lines:
-                line=line.strip("\r\n")
-                if line.find("Content-Length: ") >= 0:
-                    elems = line.split(":")
-                    if len(elems) > 1:
-                        readCount = int(elems[1].strip())
-            self._uo.debug("readCount={}".format( readCount ))
-            if readCount > 0:
-                data = await reader.read(readCount)
+                    await self._serve_file(BasicWebServer.PRODUCT_HTML, request)
+
+            else:
+                await self._serve_file(http_file, request)
+
+        elif request.method == 'POST':
+            data = await request.read_body()
+            if len(data) > 0:
                 dataStr = data.decode()
                 self._uo.debug("dataStr={}".format( dataStr ))
                 elems = dataStr.split("&")
@@ -190,24 +226,21 @@ class BasicWebServer(object):
                         elif elem.startswith('pass='):
                             wifiDict["pass"]=elem.replace('pass=', '')
 
-                    # If we have the WiFi configuration save it to the cfg file.
+                    # If we have the WiFi configuration save it now as the unit is rebooted.
                     if len( list(wifiDict.keys()) ) == 3 and \
                        "mode" in wifiDict and \
                        "ssid" in wifiDict and \
                        "pass" in wifiDict:
-                        fd = open(WiFi.WIFI_CFG_FILE, 'w')
-                        fd.write( json.dumps(wifiDict)  )
-                        fd.close()
-                        reboot = True
+                        self._config.setSection(WiFi.WIFI_CFG_SECTION, wifiDict)
+                        reboot = self._config.save()
 
-            response = 'HTTP/1.1 200 OK\r\n'
-            writer.write(response)
             if reboot:
-                self._serve_file(BasicWebServer.SETUP_WIFI_HTML, writer)
+                await self._serve_file(BasicWebServer.SETUP_WIFI_HTML, request)
+            else:
+                await request.send_response("text/html", "")
 
-        await writer.drain()
-        await writer.wait_closed()
-        self._uo.debug("Client disconnected")
+        else:
+            await request.send_response("text/html", "", status=HTTPServer.STATUS_BAD)
 
         if reboot:
             self._uo.info("Rebooting to run new WiFi configuration.")
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+
+from uo import UOBase
+
+class Config(UOBase):
+    """@brief Responsible for holding the unit configuration. All the settings are
+              held in one file in flash that is read once at startup. The settings
+              are then read from RAM. The settings are held in sections (E.G wifi,
+              ydev, temperature), each of which is a dict.
+
+              Changes are saved by update() once no further change has been made
+              for SAVE_DELAY_MS so that several changes result in one flash write.
+              The file is saved atomically. The new settings are written to a
+              temporary file which then replaces the config file so that a reset
+              while saving leaves either the old or the new settings."""
+
+    CONFIG_FILE         = "/config.json"    # The file in flash holding the settings.
+    TMP_FILE_SUFFIX     = ".tmp"            # Added to the config file name for the file written while saving.
+    SAVE_DELAY_MS       = 2000              # Changes are saved once none have been made for this long.
+    POLL_PERIOD_MS      = 500               # The period at which update() should be called.
+    SECRET_KEYS         = ("pass",)         # The keys whose values are hidden by getPublic().
+    HIDDEN_VALUE        = "********"        # Replaces the value of secret keys.
+    # The files that held settings before the config file was used. If the config file does not hold
+    # the section the file is loaded into it and removed.
+    LEGACY_FILES        = {"wifi":          "/wifi.cfg",
+                           "temperature":   "/temperature_cal.json"}
+
+    def __init__(self, uo=None, config_file=CONFIG_FILE):
+        """@brief Constructor. The settings are loaded from flash.
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param config_file The file in flash holding the settings."""
+        super().__init__(uo=uo)
+        self._configFile = config_file
+        self._tmpFile = config_file + Config.TMP_FILE_SUFFIX
+        self._cfgDict = {}
+        self._dirty = False
+        self._changeTicks = 0
+        self._saves = 0
+        self._saveErrors = 0
+        self.load()
+
+    def load(self):
+        """@brief Load the settings from flash. Unsaved changes are lost."""
+        self._cfgDict = {}
+        try:
+            with open(self._configFile, "r") as read_file:
+                self._cfgDict = json.load(read_file)
+        except:
+            pass
+        # A temporary file is only left if a reset occurred while saving.
+        try:
+            os.remove(self._tmpFile)
+        except OSError:
+            pass
+
+        migrated = []
+        for section in Config.LEGACY_FILES:
+            if section not in self._cfgDict:
+                try:
+                    with open(Config.LEGACY_FILES[section], "r") as read_file:
+                        self._cfgDict[section] = json.load(read_file)
+                    migrated.append(Config.LEGACY_FILES[section])
+                except:
+                    pass
+        self._dirty = False
+        if migrated:
+            if self.save():
+                for legacy_file in migrated:
+                    os.remove(legacy_file)
+                    self._info("Moved {} to {}".format(legacy_file, self._configFile))
+            else:
+                # The legacy files are kept and update() retries the save.
+                self._dirty = True
+                self._changeTicks = time.ticks_ms()
+
+    def get(self, section, key, default=None):
+        """@brief Get a setting.
+           @param section The section name.
+           @param key The key in the section.
+           @param default The value returned if the setting is not present.
+           @return The value."""
+        return self._cfgDict.get(section, {}).get(key, default)
+
+    def getSection(self, section):
+        """@brief Get all the settings in a section.
+           @param section The section name.
+           @return A copy of the section dict or None if not present."""
+        sectionDict = self._cfgDict.get(section)
+        if sectionDict is None:
+            return None
+        return dict(sectionDict)
+
+    def _changed(self):
+        """@brief Record that the settings have changed so that they are saved by update()."""
+        self._dirty = True
+        self._changeTicks = time.ticks_ms()
+
+    def set(self, section, key, value):
+        """@brief Change a setting. This is saved to flash by update().
+           @param section The section name. This is created if not present.
+           @param key The key in the section.
+           @param value The value (a type that can be written to a JSON file)."""
+        sectionDict = self._cfgDict.setdefault(section, {})
+        if key not in sectionDict or sectionDict[key] != value:
+            sectionDict[key] = value
+            self._changed()
+
+    def setSection(self, section, sectionDict):
+        """@brief Replace all the settings in a section. This is saved to flash by update().
+           @param section The section name.
+           @param sectionDict The settings dict."""
+        if self._cfgDict.get(section) != sectionDict:
+            self._cfgDict[section] = dict(sectionDict)
+            self._changed()
+
+    def removeSection(self, section):
+        """@brief Remove all the settings in a section. This is saved to flash by update().
+           @param section The section name."""
+        if section in self._cfgDict:
+            del self._cfgDict[section]
+            self._changed()
+
+    def update(self):
+        """@brief Save the settings if they have changed and no change has been made
+                  for SAVE_DELAY_MS. This should be called every POLL_PERIOD_MS."""
+        if self._dirty and time.ticks_diff(time.ticks_ms(), self._changeTicks) >= Config.SAVE_DELAY_MS:
+            self.save()
+
+    def save(self):
+        """@brief Save the settings to flash now (E.G before a reset).
+           @return True if saved."""
+        try:
+            with open(self._tmpFile, "w") as write_file:
+                write_file.write(json.dumps(self._cfgDict))
+            os.rename(self._tmpFile, self._configFile)
+            self._dirty = False
+            self._saves += 1
+            return True
+        except OSError as ex:
+            self._saveErrors += 1
+            self._info("Failed to save {}: {}".format(self._configFile, ex))
+        return False
+
+    def getPublic(self):
+        """@brief Get all the settings with the values of secret keys (E.G the WiFi password) hidden.
+           @return A dict of section dicts."""
+        publicDict = {}
+        for section in self._cfgDict:
+            sectionDict = dict(self._cfgDict[section])
+            for key in Config.SECRET_KEYS:
+                if key in sectionDict:
+                    sectionDict[key] = Config.HIDDEN_VALUE
+            publicDict[section] = sectionDict
+        return publicDict
+
+    def getStats(self):
+        """@brief Get the config statistics.
+           @return A dict holding the number of saves, the number that failed and
+                   True if there are unsaved changes."""
+        return {"saves": self._saves,
+                "save_errors": self._saveErrors,
+                "unsaved": self._dirty}
@@ -0,0 +1,358 @@
+import time
+import _thread
+from array import array
+import machine
+
+from uo import UOBase
+from shared_adc import SharedADC
+
+# The counters and sequence numbers updated on core1 wrap to 0 after this value so
+# that they stay small ints (a larger int is allocated on the heap). Sequence numbers
+# must be compared using seq_diff().
+SEQ_MAX = 0x3fffffff
+
+def seq_inc(value):
+    """@brief Increment a counter or sequence number. This does not allocate memory.
+       @param value The value (0 - SEQ_MAX).
+       @return The next value, wrapping to 0 after SEQ_MAX."""
+    if value < SEQ_MAX:
+        return value + 1
+    return 0
+
+def seq_diff(seq1, seq2):
+    """@brief Get the number of values between two sequence numbers allowing for wrap around.
+       @param seq1 The later sequence number.
+       @param seq2 The earlier sequence number.
+       @return The difference (negative if seq2 is after seq1)."""
+    diff = (seq1 - seq2) & SEQ_MAX
+    if diff > SEQ_MAX // 2:
+        diff -= SEQ_MAX + 1
+    return diff
+
+class SampleRing(object):
+    """@brief A preallocated ring buffer of time stamped values written by one core
+              and read by the other. A lock protects the ring so that a reader never
+              sees a partly written entry."""
+
+    def __init__(self, size, typecode):
+        """@brief Constructor
+           @param size The number of values held before the oldest are overwritten.
+           @param typecode The array typecode of the values (E.G 'H')."""
+        self._size = size
+        self._ticks = array('I', [0] * size)
+        self._values = array(typecode, [0] * size)
+        # The sequence number (wraps after SEQ_MAX) that the next value is given and its index in the ring.
+        self._seq = 0
+        self._index = 0
+        # The number of values held.
+        self._count = 0
+        self._lock = _thread.allocate_lock()
+
+    def put(self, ticks_us, value):
+        """@brief Add a value. This does not allocate memory.
+           @param ticks_us The time of the value.
+           @param value The value."""
+        self._lock.acquire()
+        index = self._index
+        self._ticks[index] = ticks_us
+        self._values[index] = value
+        index += 1
+        if index >= self._size:
+            index = 0
+        self._index = index
+        if self._count < self._size:
+            self._count += 1
+        self._seq = seq_inc(self._seq)
+        self._lock.release()
+
+    def getNextSeq(self):
+        """@brief Get the sequence number that the next value will be given.
+           @return The sequence number (0 - SEQ_MAX)."""
+        return self._seq
+
+    def getLatest(self):
+        """@brief Get the latest value.
+           @return The value or None if no value has been added."""
+        self._lock.acquire()
+        value = None
+        if self._count > 0:
+            value = self._values[(self._index - 1) % self._size]
+        self._lock.release()
+        return value
+
+    def get(self, since):
+        """@brief Copy out the values added since a sequence number.
+           @param since The sequence number of the first value the client has not seen.
+           @return A tuple containing
+                   A list of the values. Each is a list of [seq, value, ticks_us].
+                   The number of values lost because they were overwritten.
+                   The sequence number to pass as since to get the values that follow."""
+        values = []
+        self._lock.acquire()
+        seq = self._seq
+        count = seq_diff(seq, since & SEQ_MAX)
+        # A since value after the latest value returns no values.
+        if count < 0:
+            count = 0
+        lost = 0
+        if count > self._count:
+            lost = count - self._count
+            count = self._count
+        index = (self._index - count) % self._size
+        s = (seq - count) & SEQ_MAX
+        for _ in range(count):
+            values.append([s, self._values[index], self._ticks[index]])
+            s = seq_inc(s)
+            index += 1
+            if index >= self._size:
+                index = 0
+        self._lock.release()
+        return (values, lost, s)
+
+class ByteRing(object):
+    """@brief A preallocated ring buffer of bytes (E.G received UART data) written by
+              one core and read by the other."""
+
+    def __init__(self, size):
+        """@brief Constructor
+           @param size The number of bytes held before the oldest are overwritten."""
+        self._size = size
+        self._buf = bytearray(size)
+        self._head = 0
+        self._count = 0
+        self._overflows = 0
+        self._lock = _thread.allocate_lock()
+
+    def write(self, data, length):
+        """@brief Add bytes. This does not allocate memory.
+           @param data The buffer holding the bytes.
+           @param length The number of bytes in the buffer to add."""
+        self._lock.acquire()
+        for i in range(length):
+            self._buf[(self._head + self._count) % self._size] = data[i]
+            if self._count < self._size:
+                self._count += 1
+            else:
+                self._head = (self._head + 1) % self._size
+                self._overflows = seq_inc(self._overflows)
+        self._lock.release()
+
+    def read(self):
+        """@brief Copy out and remove all the bytes held.
+           @return The bytes."""
+        self._lock.acquire()
+        end = self._head + self._count
+        if end <= self._size:
+            data = bytes(self._buf[self._head:end])
+        else:
+            data = bytes(self._buf[self._head:]) + bytes(self._buf[:end - self._size])
+        self._head = 0
+        self._count = 0
+        self._lock.release()
+        return data
+
+    def getOverflows(self):
+        """@brief Get the number of bytes lost because the ring was full.
+           @return The number of bytes."""
+        return self._overflows
+
+class Core1Worker(UOBase):
+    """@brief Responsible for the time critical peripheral work, run on the second
+              RP2040 core (core1) so that its timing does not depend on the load on
+              the uasyncio loop (core0). Core1
+              - Samples ADC channels at a fixed period.
+              - Reads received UART data into a buffer before the UART FIFO overflows.
+              - Polls GPIO input pins and records their edges.
+              The data is held in preallocated locked ring buffers. The network side
+              (core0) only copies out the results. The core1 loop does not allocate
+              memory so it is not held up by the garbage collector on core0."""
+
+    DEFAULT_ADC_PERIOD_US   = 1000      # The default ADC sample period.
+    DEFAULT_ADC_RING_SIZE   = 256       # The default number of samples held for each ADC channel.
+    DEFAULT_UART_RING_SIZE  = 1024      # The default number of received bytes held for each UART.
+    DEFAULT_EDGE_RING_SIZE  = 64        # The default number of GPIO edges held.
+    LOOP_PERIOD_US          = 100       # The core1 loop period. This is the GPIO edge time resolution.
+    UART_CHUNK_SIZE         = 32        # The max number of bytes read from a UART each loop.
+    ADC_CHANNELS            = (0, 1, 2, 3, 4)
+    # The RP2040 SIO register holding the input state of GPIO 0 - 29.
+    SIO_GPIO_IN             = 0xd0000004
+
+    def __init__(self,
+                 uo=None,
+                 adc_period_us=DEFAULT_ADC_PERIOD_US,
+                 adc_ring_size=DEFAULT_ADC_RING_SIZE,
+                 uart_ring_size=DEFAULT_UART_RING_SIZE,
+                 edge_ring_size=DEFAULT_EDGE_RING_SIZE,
+                 gpio_mask=0):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param adc_period_us The ADC sample period.
+           @param adc_ring_size The number of samples held for each ADC channel.
+           @param uart_ring_size The number of received bytes held for each UART.
+           @param edge_ring_size The number of GPIO edges held.
+           @param gpio_mask The GPIO input pins whose edges are recorded (bit n = GPIO n)."""
+        super().__init__(uo=uo)
+        self._adcPeriodUs = adc_period_us
+        self._adcRingSize = adc_ring_size
+        self._uartRingSize = uart_ring_size
+        self._gpioMask = gpio_mask
+        self._adcDict = {}
+        self._adcList = []
+        self._uartDict = {}
+        self._uartList = []
+        self._edgeRing = SampleRing(edge_ring_size, 'B')
+        self._uartBuf = bytearray(Core1Worker.UART_CHUNK_SIZE)
+        # Held while the list of UARTs is changed or polled.
+        self._uartLock = _thread.allocate_lock()
+        self._running = False
+        self._loops = 0
+        self._adcSamples = 0
+        self._adcLate = 0
+        self._maxLoopUs = 0
+
+    def addADC(self, adc):
+        """@brief Add an ADC channel to be sampled. All ADC channels must be added before start() is called.
+           @param adc The ADC channel (0 - 4)."""
+        if self._running:
+            raise Exception("ADC channels must be added before core1 is started.")
+        if adc not in Core1Worker.ADC_CHANNELS:
+            raise ValueError("{} is an invalid ADC channel.".format(adc))
+        if adc not in self._adcDict:
+            ring = SampleRing(self._adcRingSize, 'H')
+            self._adcDict[adc] = ring
+            self._adcList.append((SharedADC(adc), ring))
+
+    def hasADC(self, adc):
+        """@brief Determine if an ADC channel is sampled by core1.
+           @param adc The ADC channel.
+           @return True if sampled by core1."""
+        return adc in self._adcDict
+
+    def addUART(self, uart, uartInstance):
+        """@brief Add a UART whose received data is buffered by core1. This may be
+                  called while core1 is running (E.G when a UART is setup).
+           @param uart The UART number.
+           @param uartInstance The machine.UART instance."""
+        ring = ByteRing(self._uartRingSize)
+        self._uartLock.acquire()
+        self._uartDict[uart] = ring
+        self._uartList = [item for item in self._uartList if item[0] != uart]
+        self._uartList.append((uart, uartInstance, ring))
+        self._uartLock.release()
+
+    def hasUART(self, uart):
+        """@brief Determine if a UART is read by core1.
+           @param uart The UART number.
+           @return True if read by core1."""
+        return uart in self._uartDict
+
+    def start(self):
+        """@brief Start the worker on core1."""
+        if not self._running:
+            self._running = True
+            _thread.start_new_thread(self._run, ())
+            self._info("Core1 worker started.")
+
+    def stop(self):
+        """@brief Stop the worker. The core1 loop exits within LOOP_PERIOD_US."""
+        self._running = False
+
+    def _run(self):
+        """@brief The core1 loop."""
+        nextAdcUs = time.ticks_us()
+        lastGpios = machine.mem32[Core1Worker.SIO_GPIO_IN] & self._gpioMask
+        while self._running:
+            startUs = time.ticks_us()
+
+            if self._adcList and time.ticks_diff(startUs, nextAdcUs) >= 0:
+                for adc, ring in self._adcList:
+                    ring.put(startUs, adc.read_u16())
+                self._adcSamples = seq_inc(self._adcSamples)
+                nextAdcUs = time.ticks_add(nextAdcUs, self._adcPeriodUs)
+                # If more than a period late skip the missed samples rather than
+                # taking them in a burst.
+                if time.ticks_diff(startUs, nextAdcUs) >= 0:
+                    self._adcLate = seq_inc(self._adcLate)
+                    nextAdcUs = time.ticks_add(startUs, self._adcPeriodUs)
+
+            if self._uartList:
+                self._uartLock.acquire()
+                for _, uartInstance, ring in self._uartList:
+                    if uartInstance.any():
+                        count = uartInstance.readinto(self._uartBuf)
+                        if count:
+                            ring.write(self._uartBuf, count)
+                self._uartLock.release()
+
+            if self._gpioMask:
+                gpios = machine.mem32[Core1Worker.SIO_GPIO_IN] & self._gpioMask
+                changed = gpios ^ lastGpios
+                if changed:
+                    pin = 0
+                    while changed:
+                        if changed & 1:
+                            # The pin number and its state after the edge.
+                            self._edgeRing.put(startUs, (pin << 1) | ((gpios >> pin) & 1))
+                        changed >>= 1
+                        pin += 1
+                    lastGpios = gpios
+
+            self._loops = seq_inc(self._loops)
+            loopUs = time.ticks_diff(time.ticks_us(), startUs)
+            if loopUs > self._maxLoopUs:
+                self._maxLoopUs = loopUs
+            if loopUs < Core1Worker.LOOP_PERIOD_US:
+                time.sleep_us(Core1Worker.LOOP_PERIOD_US - loopUs)
+
+    def getADCLatest(self, adc):
+        """@brief Get the latest sample of an ADC channel.
+           @param adc The ADC channel.
+           @return The ADC value (read_u16()) or None if no sample has been taken."""
+        return self._adcDict[adc].getLatest()
+
+    def getADCSamples(self, adc, since):
+        """@brief Get the samples of an ADC channel taken since a sequence number.
+           @param adc The ADC channel.
+           @param since The sequence number of the first sample the client has not seen.
+           @return A tuple containing
+                   A list of samples. Each is a list of [seq, value, ticks_us].
+                   The number of samples lost because they were overwritten.
+                   The sequence number to pass as since to get the samples that follow."""
+        return self._adcDict[adc].get(since)
+
+    def uartRead(self, uart):
+        """@brief Read the data received on a UART.
+           @param uart The UART number.
+           @return The bytes received since the last read."""
+        return self._uartDict[uart].read()
+
+    def getGPIOEvents(self, since):
+        """@brief Get the GPIO edges recorded since a sequence number.
+           @param since The sequence number of the first event the client has not seen.
+           @return A tuple containing
+                   The list of events. Each event is a list of [seq, pin, value, ticks_us].
+                   The number of events lost because they were overwritten.
+                   The sequence number to pass as since to get the events that follow."""
+        entries, lost, next_seq = self._edgeRing.get(since)
+        events = []
+        for seq, value, ticks in entries:
+            events.append([seq, value >> 1, value & 1, ticks])
+        return (events, lost, next_seq)
+
+    def getStats(self):
+        """@brief Get the core1 worker statistics.
+           @return A dict holding the statistics."""
+        uartOverflows = {}
+        for uart in self._uartDict:
+            uartOverflows[uart] = self._uartDict[uart].getOverflows()
+        return {"running": self._running,
+                "loops": self._loops,
+                "max_loop_us": self._maxLoopUs,
+                "adc_period_us": self._adcPeriodUs,
+                "adcs": list(self._adcDict.keys()),
+                "adc_samples": self._adcSamples,
+                "adc_late": self._adcLate,
+                "uart_overflows": uartOverflows,
+                "gpio_mask": self._gpioMask,
+                "gpio_events": self._edgeRing.getNextSeq()}
@@ -0,0 +1,147 @@
+import time
+import machine
+
+from uo import UOBase
+
+class CPUGovernor(UOBase):
+    """@brief Responsible for raising the CPU clock when the unit is busy and
+              dropping it when the unit is idle."""
+
+    MIN_FREQ_HZ          = 48000000    # The min CPU freq in Hz (USB needs a 48 MHz clock).
+    MAX_FREQ_HZ          = 240000000   # The max CPU freq in Hz.
+    DEFAULT_FLOOR_HZ     = 48000000    # The default CPU freq when idle.
+    DEFAULT_CEILING_HZ   = 125000000   # The default CPU freq when busy.
+    DEFAULT_HYSTERESIS_MS = 2000       # The default time the unit must be idle before the CPU freq is dropped.
+    POLL_PERIOD_MS       = 500         # The period at which update() should be called to check the load sources.
+    MAX_DECISIONS        = 16          # The number of CPU freq changes held for reporting.
+
+    def __init__(self,
+                 uo=None,
+                 floor_hz=DEFAULT_FLOOR_HZ,
+                 ceiling_hz=DEFAULT_CEILING_HZ,
+                 hysteresis_ms=DEFAULT_HYSTERESIS_MS,
+                 enabled=False):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param floor_hz The CPU freq when idle.
+           @param ceiling_hz The CPU freq when busy.
+           @param hysteresis_ms The time the unit must be idle before the CPU freq is dropped.
+           @param enabled If True the governor starts changing the CPU freq immediately."""
+        super().__init__(uo=uo)
+        self.configure(floor_hz, ceiling_hz, hysteresis_ms)
+        self._enabled = enabled
+        self._loadSources = []
+        self._lockSources = []
+        self._decisions = []
+        self._lastBusyMs = time.ticks_ms()
+        self._lastChangeMs = self._lastBusyMs
+        self._freqTimeMsDict = {}
+
+    def configure(self, floor_hz, ceiling_hz, hysteresis_ms):
+        """@brief Set the governor parameters.
+           @param floor_hz The CPU freq when idle.
+           @param ceiling_hz The CPU freq when busy.
+           @param hysteresis_ms The time the unit must be idle before the CPU freq is dropped."""
+        if floor_hz < CPUGovernor.MIN_FREQ_HZ or ceiling_hz > CPUGovernor.MAX_FREQ_HZ or floor_hz > ceiling_hz:
+            raise ValueError("Invalid CPU freq range {} - {} Hz (valid = {} - {} Hz).".format(floor_hz, ceiling_hz, CPUGovernor.MIN_FREQ_HZ, CPUGovernor.MAX_FREQ_HZ))
+        if hysteresis_ms < 0:
+            raise ValueError("{} is an invalid hysteresis time.".format(hysteresis_ms))
+        self._floorHz = floor_hz
+        self._ceilingHz = ceiling_hz
+        self._hysteresisMs = hysteresis_ms
+
+    def addLoadSource(self, loadSource):
+        """@brief Add a source of load.
+           @param loadSource A function that returns the number of operations in progress
+                             (E.G requests being served). The CPU freq is raised when any is > 0."""
+        self._loadSources.append(loadSource)
+
+    def addLockSource(self, lockSource):
+        """@brief Add a function that can stop the CPU freq being changed.
+           @param lockSource A function that returns True while the CPU freq must not change
+                             (E.G while PWM outputs, whose freq depends on the CPU freq, are in use)."""
+        self._lockSources.append(lockSource)
+
+    def setEnabled(self, enabled):
+        """@brief Enable/Disable the governor.
+           @param enabled If True the governor changes the CPU freq."""
+        self._enabled = enabled
+
+    def isEnabled(self):
+        """@brief Determine if the governor is enabled.
+           @return True if enabled."""
+        return self._enabled
+
+    def busy(self):
+        """@brief Called when work starts so that the CPU freq is raised before it is done."""
+        self._lastBusyMs = time.ticks_ms()
+        if self._enabled and machine.freq() < self._ceilingHz:
+            self._setFreq(self._ceilingHz, "busy", 1)
+
+    def _isLocked(self):
+        """@brief Determine if the CPU freq must not be changed.
+           @return True if locked."""
+        for lockSource in self._lockSources:
+            if lockSource():
+                return True
+        return False
+
+    def _getLoad(self):
+        """@brief Get the current load.
+           @return The sum of the operations in progress."""
+        load = 0
+        for loadSource in self._loadSources:
+            load += loadSource()
+        return load
+
+    def _setFreq(self, freq_hz, reason, load):
+        """@brief Change the CPU freq and record the decision.
+           @param freq_hz The new CPU freq in Hz.
+           @param reason The reason for the change.
+           @param load The load when the decision was made."""
+        if self._isLocked():
+            return
+        now = time.ticks_ms()
+        oldFreq = machine.freq()
+        self._freqTimeMsDict[oldFreq] = self._freqTimeMsDict.get(oldFreq, 0) + time.ticks_diff(now, self._lastChangeMs)
+        self._lastChangeMs = now
+        machine.freq(freq_hz)
+        self._decisions.append([now, freq_hz, reason, load])
+        if len(self._decisions) > CPUGovernor.MAX_DECISIONS:
+            self._decisions.pop(0)
+        self._debug("CPU freq {} -> {} Hz ({}, load={})".format(oldFreq, freq_hz, reason, load))
+
+    def update(self):
+        """@brief Check the load and change the CPU freq if required.
+                  This should be called every POLL_PERIOD_MS."""
+        if not self._enabled:
+            return
+        load = self._getLoad()
+        now = time.ticks_ms()
+        freq = machine.freq()
+        if load > 0:
+            self._lastBusyMs = now
+            if freq < self._ceilingHz:
+                self._setFreq(self._ceilingHz, "busy", load)
+        elif freq > self._floorHz and time.ticks_diff(now, self._lastBusyMs) >= self._hysteresisMs:
+            self._setFreq(self._floorHz, "idle", load)
+
+    def getState(self):
+        """@brief Get the state of the governor.
+           @return A dict detailing the configuration, the current CPU freq,
+                   the time (ms) spent at each CPU freq and the recent decisions.
+                   Each decision is a list of [ticks_ms, freq, reason, load]."""
+        freqTimeMsDict = {}
+        for freq in self._freqTimeMsDict:
+            freqTimeMsDict[str(freq)] = self._freqTimeMsDict[freq]
+        return {"enabled": self._enabled,
+                "floor": self._floorHz,
+                "ceiling": self._ceilingHz,
+                "hysteresis": self._hysteresisMs,
+                "freq": machine.freq(),
+                "locked": self._isLocked(),
+                "load": self._getLoad(),
+                "now": time.ticks_ms(),
+                "freq_time_ms": freqTimeMsDict,
+                "decisions": self._decisions}
@@ -8,6 +8,11 @@
 # are loaded onto the pico W. pyflakes must be installed  pip install pyflakes)
 # to use this option.
 #
+# Optional mpy. If mpy is used then the python files (apart from main.py) are
+# cross compiled to .mpy files (tools/build_mpy.py) and these are loaded onto the
+# pico W rather than the python source files. mpy-cross must be installed
+# (pip install mpy-cross) and match the MicroPython version on the pico W.
+#
 # This script copies all the files to the picow flash and then runs the main.py
 # program.
 # First delete any files ending ~ in the local webroot folder as we don't want
@@ -18,6 +23,7 @@ rm webroot/*~
 rshell --timing -p /dev/ttyACM$1 --buffer-size 512 rm -rf /pyboard/webroot
 # Remove all the python files from the picow flash
 rshell --timing -p /dev/ttyACM$1 --buffer-size 512 rm -rf /pyboard/*.py
+rshell --timing -p /dev/ttyACM$1 --buffer-size 512 rm -rf /pyboard/*.mpy
 # Command that fail after this point stop the script running
 set -e
 if [[ "$*" == *"pf"* ]]
@@ -25,15 +31,28 @@ then
     echo "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
     echo "!!! Checking python files using pyflakes !!!"
     echo "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
-    pyflakes *.py
+    # pio_programs.py is not checked as the PIO assembler instructions in its
+    # @rp2.asm_pio functions (E.G out, pins, jmp) are only defined while
+    # MicroPython assembles them so pyflakes reports them as undefined names.
+    pyflakes $(ls *.py | grep -v '^pio_programs.py$')
 fi
 
+# Inline the small css and javascript files into the html files and minify them
+# (build/webroot) so that each page is loaded using fewer connections.
+python3 tools/bundle_webroot.py
 # Create the /webroot folder in the picow flash.
 rshell --timing -p /dev/ttyACM$1 --buffer-size 512 mkdir webroot /pyboard/webroot
 # Copy all the html, css and javascript files into the /webroot folder on the picow flash.
-rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp webroot/* /pyboard/webroot
+rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp build/webroot/* /pyboard/webroot
 # Copy all the python src files top the picow flash.
 # The picow will run the main.py file this when it powers up.
-rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp *.py /pyboard
+if [[ "$*" == *"mpy"* ]]
+then
+    python3 tools/build_mpy.py
+    rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp build/mpy/*.mpy /pyboard
+    rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp main.py /pyboard
+else
+    rshell --timing -p /dev/ttyACM$1 --buffer-size 512 cp *.py /pyboard
+fi
 # Run the main.py file on the picow
 rshell --timing -p /dev/ttyACM$1 --buffer-size 512 repl pyboard import main.py
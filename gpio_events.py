@@ -0,0 +1,108 @@
+import time
+from array import array
+import uasyncio as asyncio
+import machine
+
+class GPIOEvents(object):
+    """@brief Responsible for recording GPIO input edges, captured by machine.Pin.irq
+              handlers, in a preallocated ring buffer and notifying waiting clients."""
+
+    DEFAULT_RING_SIZE = 64                                   # The number of edge events held in the ring buffer.
+    IRQ_TRIGGER = machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING # Record both edges on an input pin.
+
+    def __init__(self, ring_size=DEFAULT_RING_SIZE):
+        """@brief Constructor
+           @param ring_size The number of edge events that can be held before the
+                            oldest are overwritten."""
+        self._ring_size = ring_size
+        # Preallocate the ring buffer so that the IRQ handlers never allocate memory.
+        self._ticks = array('I', [0] * ring_size)
+        self._pins = bytearray(ring_size)
+        self._values = bytearray(ring_size)
+        # The sequence number of the next event to be recorded.
+        self._seq = 0
+        self._flag = asyncio.ThreadSafeFlag()
+        self._event = asyncio.Event()
+        self._irqPinDict = {}
+
+    def start(self):
+        """@brief Start the task that wakes clients waiting for edge events."""
+        asyncio.create_task(self._notify())
+
+    def attach(self, pin, pinInstance):
+        """@brief Attach an IRQ handler to an input pin so that its edges are recorded.
+           @param pin The GPIO pin number.
+           @param pinInstance The machine.Pin instance configured as an input."""
+        # Create the handler once here as it holds the pin number.
+        def handler(p, pin=pin):
+            self._record(pin, p.value())
+        pinInstance.irq(handler=handler, trigger=GPIOEvents.IRQ_TRIGGER)
+        self._irqPinDict[pin] = pinInstance
+
+    def detach(self, pin):
+        """@brief Stop recording edges on a pin.
+           @param pin The GPIO pin number."""
+        if pin in self._irqPinDict:
+            self._irqPinDict[pin].irq(handler=None)
+            del self._irqPinDict[pin]
+
+    def getPins(self):
+        """@brief Get the pins that have an IRQ handler attached.
+           @return A list of GPIO pin numbers."""
+        return list(self._irqPinDict.keys())
+
+    def _record(self, pin, value):
+        """@brief Record an edge. This is called from IRQ context.
+           @param pin The GPIO pin number.
+           @param value The pin state after the edge."""
+        index = self._seq % self._ring_size
+        self._ticks[index] = time.ticks_us()
+        self._pins[index] = pin
+        self._values[index] = value
+        self._seq += 1
+        self._flag.set()
+
+    async def _notify(self):
+        """@brief Wake all clients waiting on an edge each time the IRQ handler fires."""
+        while True:
+            await self._flag.wait()
+            event = self._event
+            self._event = asyncio.Event()
+            event.set()
+
+    def getNextSeq(self):
+        """@brief Get the sequence number that the next edge event will be given.
+           @return The sequence number."""
+        return self._seq
+
+    async def waitForEvents(self, since, timeout_ms):
+        """@brief Wait until edge events after a sequence number are available.
+           @param since The sequence number of the first event the client has not seen.
+           @param timeout_ms The maximum time to wait in milliseconds.
+           @return True if events are available."""
+        if self._seq <= since and timeout_ms > 0:
+            try:
+                await asyncio.wait_for_ms(self._event.wait(), timeout_ms)
+            except asyncio.TimeoutError:
+                pass
+        return self._seq > since
+
+    def getEvents(self, since):
+        """@brief Get the edge events recorded since a sequence number.
+           @param since The sequence number of the first event the client has not seen.
+           @return A tuple containing
+                   The list of events. Each event is a list of [seq, pin, value, ticks_us].
+                   The number of events lost because they were overwritten in the ring buffer."""
+        seq = self._seq
+        oldest = seq - self._ring_size
+        if oldest < 0:
+            oldest = 0
+        lost = 0
+        if since < oldest:
+            lost = oldest - since
+            since = oldest
+        events = []
+        for s in range(since, seq):
+            index = s % self._ring_size
+            events.append([s, self._pins[index], self._values[index], self._ticks[index]])
+        return (events, lost)
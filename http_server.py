@@ -0,0 +1,444 @@
+import uasyncio as asyncio
+
+from uo import UOBase
+import trace
+
+class HTTPRequest(object):
+    """@brief Holds the details of an HTTP request received by the HTTPServer and
+              provides methods to read the body and send the response."""
+
+    def __init__(self, reader, writer, request_line, port):
+        """@brief Constructor
+           @param reader The reader object used to receive data.
+           @param writer The writer object used to send data.
+           @param request_line The HTTP request line (E.G GET /adc?adc=0 HTTP/1.1).
+           @param port The TCP port the request was received on."""
+        self.reader = reader
+        self.writer = writer
+        self.request_line = request_line
+        self.port = port
+        self.track = trace.TRACK_MAIN
+        self.method = ""
+        self.target = ""
+        self.path = ""
+        self.args = {}
+        self.headers = {}
+        self.pending = b''
+        elems = request_line.split()
+        if len(elems) >= 2:
+            self.method = elems[0].upper()
+            self.target = elems[1]
+            self._parse_target(elems[1])
+
+    def _parse_target(self, target):
+        """@brief Split the request target into the path and the arguments.
+                  Arguments are key=value pairs that follow the path. These may be
+                  separated by either ? or & characters (E.G /pwm?pin=2?freq=1000
+                  or /pwm?pin=2&freq=1000). Keys are converted to lower case.
+           @param target The request target."""
+        pos = target.find('?')
+        if pos < 0:
+            self.path = target
+            return
+        self.path = target[:pos]
+        for arg_str in target[pos+1:].replace('&', '?').split('?'):
+            # Must be key value pairs separated by the = character
+            arg_elems = arg_str.split("=")
+            if len(arg_elems) == 2:
+                self.args[arg_elems[0].lower()] = arg_elems[1]
+
+    def get_header(self, name, default=None):
+        """@brief Get the value of a request header.
+           @param name The lower case header name.
+           @param default The value returned if the header is not present.
+           @return The header value."""
+        return self.headers.get(name, default)
+
+    async def read_body(self):
+        """@brief Read the request body.
+                  asyncio.TimeoutError is raised if the body is not received within HTTPServer.BODY_TIMEOUT_MS.
+           @return The body bytes (empty if the request has no body)."""
+        length = int(self.headers.get('content-length', 0))
+        # The start of the body may have been read along with the headers.
+        body = self.pending[:length]
+        self.pending = b''
+        if len(body) < length:
+            body += await asyncio.wait_for_ms(self.reader.readexactly(length - len(body)), HTTPServer.BODY_TIMEOUT_MS)
+        return body
+
+    async def write(self, data):
+        """@brief Send data to the client. Large blocks are sent in chunks, waiting
+                  for each to be accepted (drain) before the next is written so that
+                  a slow client does not cause the whole block to be buffered.
+                  asyncio.TimeoutError is raised if the client does not accept a chunk
+                  within HTTPServer.WRITE_TIMEOUT_MS.
+           @param data The data (str or bytes) to send."""
+        if isinstance(data, str):
+            data = data.encode()
+        mv = memoryview(data)
+        pos = 0
+        trace.begin("http.write", self.track)
+        try:
+            while True:
+                self.writer.write(mv[pos:pos+HTTPServer.WRITE_CHUNK_SIZE])
+                await asyncio.wait_for_ms(self.writer.drain(), HTTPServer.WRITE_TIMEOUT_MS)
+                pos += HTTPServer.WRITE_CHUNK_SIZE
+                if pos >= len(data):
+                    break
+        finally:
+            trace.end("http.write", self.track)
+
+    def start_response(self, content_type, status=None, headers=None):
+        """@brief Send the HTTP status line and response headers.
+           @param content_type The content type of the response body.
+           @param status The HTTP status (E.G '404 Not Found'). If None then '200 OK'.
+           @param headers A list of extra header lines (without the trailing CR LF) or None."""
+        if status is None:
+            status = HTTPServer.STATUS_OK
+        hdr = 'HTTP/1.0 {}\r\nContent-type: {}\r\n'.format(status, content_type)
+        if headers:
+            for header in headers:
+                hdr += header + '\r\n'
+        self.writer.write(hdr + '\r\n')
+
+    async def send_response(self, content_type, body, status=None, headers=None):
+        """@brief Send a complete response.
+           @param content_type The content type of the response body.
+           @param body The response body (str or bytes).
+           @param status The HTTP status (E.G '404 Not Found'). If None then '200 OK'.
+           @param headers A list of extra header lines (without the trailing CR LF) or None."""
+        self.start_response(content_type, status=status, headers=headers)
+        await self.write(body)
+
+class HTTPHeaderParser(object):
+    """@brief Responsible for reading the request line and headers of a request through
+              a fixed size buffer so that the memory used per request is bounded."""
+
+    def __init__(self, buffer_size):
+        """@brief Constructor
+           @param buffer_size The size of the receive buffer."""
+        self._buf = bytearray(buffer_size)
+        self._mv = memoryview(self._buf)
+        self.reset(None)
+
+    def reset(self, reader):
+        """@brief Prepare to read a request.
+           @param reader The reader object used to receive data."""
+        self._reader = reader
+        self._data = b''
+        self._pos = 0
+
+    def getPending(self):
+        """@brief Get the data read after the end of the headers (the start of the body).
+           @return The bytes."""
+        return self._data[self._pos:]
+
+    async def readline(self, max_len):
+        """@brief Read a line.
+           @param max_len The max length of the line (this may be larger than the buffer).
+           @return The line without the line terminator or None if the client closed
+                   the connection. ValueError is raised if the line is too long."""
+        line = None
+        while True:
+            pos = self._data.find(b'\n', self._pos)
+            if pos >= 0:
+                end = pos
+                if end > self._pos and self._data[end-1] == 0x0d:
+                    end -= 1
+                part = self._data[self._pos:end]
+                self._pos = pos + 1
+                if line is None:
+                    line = part
+                else:
+                    line += part
+                if len(line) > max_len:
+                    raise ValueError("Line too long")
+                return line
+
+            # Keep the partial line and refill the buffer.
+            part = self._data[self._pos:]
+            if line is None:
+                line = part
+            else:
+                line += part
+            if len(line) > max_len:
+                raise ValueError("Line too long")
+            n = await self._reader.readinto(self._buf)
+            if not n:
+                return None
+            self._data = bytes(self._mv[:n])
+            self._pos = 0
+
+class HTTPServer(UOBase):
+    """@brief Responsible for the connection handling, request parsing and response
+              framing shared by the web and REST servers. These add handlers for the
+              paths they serve. A single instance may listen on several ports."""
+
+    STATUS_OK         = "200 OK"
+    STATUS_BAD        = "400 Bad Request"
+    STATUS_NOT_FOUND  = "404 Not Found"
+    STATUS_TIMEOUT    = "408 Request Timeout"
+    STATUS_URI_TOO_LONG = "414 URI Too Long"
+    STATUS_HEADERS_TOO_LARGE = "431 Request Header Fields Too Large"
+    STATUS_UPGRADE_REQUIRED = "426 Upgrade Required"
+    STATUS_BUSY       = "503 Service Unavailable"
+
+    MAX_CONNECTIONS         = 6        # The default max number of connections served at the same time.
+    MAX_WEBSOCKETS          = 4        # The default max number of WebSocket connections open at the same time.
+    REQUEST_LINE_TIMEOUT_MS = 5000     # The max time (ms) to wait for the request line after a client connects.
+    HEADERS_TIMEOUT_MS      = 5000     # The max time (ms) to wait for all the request headers.
+    BODY_TIMEOUT_MS         = 10000    # The max time (ms) to wait for the request body.
+    WRITE_TIMEOUT_MS        = 10000    # The max time (ms) to wait for the client to accept each chunk of a response.
+    WRITE_CHUNK_SIZE        = 1024     # The max number of bytes written before waiting for them to be sent.
+    HEADER_BUFFER_SIZE      = 512      # The size of the buffer each request is read through. This is the max header line length.
+    MAX_REQUEST_LINE_BYTES  = 4096     # The max length of the request line (this includes the REST command arguments).
+    MAX_HEADER_BYTES        = 4096     # The max total length of the header lines, including those that are not kept.
+    DEFAULT_HEADERS         = ("content-length", "accept-encoding", "if-none-match", "connection") # The headers kept by default.
+
+    def __init__(self, uo=None, max_connections=MAX_CONNECTIONS, max_websockets=MAX_WEBSOCKETS):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param max_connections The max number of connections served at the same time.
+                                  Further connections receive an immediate 503 response.
+           @param max_websockets The max number of WebSocket connections open at the same time.
+                                 These are not counted against max_connections. Further
+                                 upgrade requests receive a 503 response."""
+        super().__init__(uo=uo)
+        self._maxConnections = max_connections
+        self._maxWebSockets = max_websockets
+        self._connections = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._websockets = 0
+        self._rejectedWebSockets = 0
+        self._routeDict = {}
+        self._portDefaultHandlerDict = {}
+        self._defaultHandler = None
+        # The header names (lower case bytes) that are kept, mapped to the header names in HTTPRequest.headers.
+        self._headerDict = {}
+        for name in HTTPServer.DEFAULT_HEADERS:
+            self.addHeader(name)
+        # A parser (and so a receive buffer) is allocated for each connection up front.
+        # An open WebSocket keeps the parser of the connection it was upgraded from.
+        self._parserPool = []
+        for _ in range(max_connections + max_websockets):
+            self._parserPool.append(HTTPHeaderParser(HTTPServer.HEADER_BUFFER_SIZE))
+
+    def addHeader(self, name):
+        """@brief Add a request header that is kept in HTTPRequest.headers. Other headers are discarded.
+           @param name The header name. This is matched without case and is stored in lower case."""
+        name = name.lower()
+        self._headerDict[name.encode()] = name
+
+    def addRoute(self, path, handler):
+        """@brief Add a handler for a path.
+           @param path The path in the request (E.G /adc). Paths are matched without case.
+           @param handler An async function that is passed the HTTPRequest instance and sends the response."""
+        self._routeDict[path.lower()] = handler
+
+    def addWebSocketRoute(self, path, handler):
+        """@brief Add a handler for WebSocket connections to a path. The server completes
+                  the upgrade handshake and passes the connection to the handler.
+                  Once upgraded a WebSocket connection is counted against the max number
+                  of WebSocket connections rather than the max number of connections.
+           @param path The path in the request (E.G /ws).
+           @param handler An async function that is passed the WebSocket instance and the
+                          HTTPRequest instance. The connection is closed when it returns."""
+        self.addHeader("upgrade")
+        self.addHeader("sec-websocket-key")
+        self.addHeader("sec-websocket-version")
+        async def upgrade(request):
+            await self._serve_websocket(request, handler)
+        self.addRoute(path, upgrade)
+
+    async def _serve_websocket(self, request, handler):
+        """@brief Complete the WebSocket upgrade handshake and pass the connection to a handler.
+           @param request The HTTPRequest instance.
+           @param handler The WebSocket handler."""
+        # WebSocket support (and hashlib) is only loaded when a client upgrades a connection.
+        from websocket import WebSocket, get_accept_key
+        key = request.get_header("sec-websocket-key")
+        if request.method != 'GET' or \
+           request.get_header("upgrade", "").lower() != "websocket" or \
+           not key or \
+           request.get_header("sec-websocket-version") != "13":
+            await request.send_response("text/html", "", status=HTTPServer.STATUS_UPGRADE_REQUIRED, headers=["Sec-WebSocket-Version: 13"])
+            return
+        if self._websockets >= self._maxWebSockets:
+            self._rejectedWebSockets += 1
+            self._debug("Rejected WebSocket connection ({} WebSocket connections).".format(self._websockets))
+            await request.send_response("text/html", "", status=HTTPServer.STATUS_BUSY, headers=["Retry-After: 1"])
+            return
+        request.writer.write('HTTP/1.1 101 Switching Protocols\r\n'
+                             'Upgrade: websocket\r\n'
+                             'Connection: Upgrade\r\n'
+                             'Sec-WebSocket-Accept: {}\r\n\r\n'.format(get_accept_key(key)))
+        await asyncio.wait_for_ms(request.writer.drain(), HTTPServer.WRITE_TIMEOUT_MS)
+        webSocket = WebSocket(request.reader, request.writer, request.pending)
+        request.pending = b''
+        # The connection no longer holds one of the HTTP connections so an open
+        # WebSocket does not stop other requests being served.
+        self._connections -= 1
+        self._websockets += 1
+        try:
+            await handler(webSocket, request)
+        finally:
+            await webSocket.close()
+            self._websockets -= 1
+            self._connections += 1
+
+    def setDefaultHandler(self, handler):
+        """@brief Set the handler for requests that do not match a route.
+           @param handler An async function that is passed the HTTPRequest instance and sends the response."""
+        self._defaultHandler = handler
+
+    def listen(self, port, defaultHandler=None):
+        """@brief Start listening for connections on a TCP port.
+           @param port The TCP port.
+           @param defaultHandler If not None the handler for requests received on this port
+                                 that do not match a route. This overrides the server default handler."""
+        if port in self._portDefaultHandlerDict:
+            return
+        self._portDefaultHandlerDict[port] = defaultHandler
+        asyncio.create_task(asyncio.start_server(lambda reader, writer: self._serve_client(reader, writer, port), "0.0.0.0", port))
+
+    def _get_handler(self, request):
+        """@brief Get the handler for a request.
+           @param request The HTTPRequest instance.
+           @return The handler or None if no handler is defined."""
+        handler = self._routeDict.get(request.path.lower())
+        if handler is None:
+            handler = self._portDefaultHandlerDict.get(request.port)
+        if handler is None:
+            handler = self._defaultHandler
+        return handler
+
+    async def _read_headers(self, parser, request):
+        """@brief Read the request headers. Only the headers added using addHeader() are kept.
+                  ValueError is raised if a header line or all the header lines are too long.
+           @param parser The HTTPHeaderParser instance reading the request.
+           @param request The HTTPRequest instance."""
+        header_bytes = 0
+        while True:
+            header_line = await parser.readline(HTTPServer.HEADER_BUFFER_SIZE)
+            # If the end of the header lines
+            if not header_line:
+                break
+            header_bytes += len(header_line)
+            if header_bytes > HTTPServer.MAX_HEADER_BYTES:
+                raise ValueError("Headers too long")
+            pos = header_line.find(b':')
+            if pos > 0:
+                name = self._headerDict.get(header_line[:pos].strip().lower())
+                if name:
+                    request.headers[name] = header_line[pos+1:].strip().decode()
+        request.pending = parser.getPending()
+
+    def getConnections(self):
+        """@brief Get the number of connections being served.
+           @return The number of open connections, not including WebSocket connections
+                   (these are open while waiting for data to send)."""
+        return self._connections
+
+    def getStats(self):
+        """@brief Get the connection statistics.
+           @return A dict detailing the number of open HTTP and WebSocket connections, the
+                   max allowed and the number of connections rejected (503) and timed out (408)."""
+        return {"connections": self._connections,
+                "websockets": self._websockets,
+                "max_connections": self._maxConnections,
+                "max_websockets": self._maxWebSockets,
+                "rejected": self._rejected,
+                "rejected_websockets": self._rejectedWebSockets,
+                "timeouts": self._timeouts}
+
+    async def _send_status(self, writer, status, headers=""):
+        """@brief Send a response with no body, ignoring errors as the client may have gone.
+           @param writer The writer object used to send data.
+           @param status The HTTP status.
+           @param headers Extra header lines (each terminated with CR LF)."""
+        try:
+            writer.write('HTTP/1.0 {}\r\n{}Content-type: text/html\r\n\r\n'.format(status, headers))
+            await asyncio.wait_for_ms(writer.drain(), HTTPServer.WRITE_TIMEOUT_MS)
+        except Exception:
+            pass
+
+    async def _serve_client(self, reader, writer, port):
+        """@brief Read a request and pass it to its handler.
+           @param reader The reader object used to receive data.
+           @param writer The writer object used to send data.
+           @param port The TCP port the connection was received on."""
+        if self._connections >= self._maxConnections:
+            # Reject the connection immediately rather than queueing it so that
+            # a client opening many connections cannot stall the others.
+            self._rejected += 1
+            self._debug("Rejected connection to port {} ({} connections).".format(port, self._connections))
+            await self._send_status(writer, HTTPServer.STATUS_BUSY, "Retry-After: 1\r\n")
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        self._connections += 1
+        self._debug("Client connected to port {}".format(port))
+        parser = self._parserPool.pop()
+        parser.reset(reader)
+        # Each connection has its own trace track as connections are served concurrently.
+        track = trace.new_track()
+        trace.begin("http.connection", track)
+        try:
+            trace.begin("http.request_line", track)
+            try:
+                request_line = await asyncio.wait_for_ms(parser.readline(HTTPServer.MAX_REQUEST_LINE_BYTES), HTTPServer.REQUEST_LINE_TIMEOUT_MS)
+            except ValueError:
+                await self._send_status(writer, HTTPServer.STATUS_URI_TOO_LONG)
+                return
+            finally:
+                trace.end("http.request_line", track)
+            if request_line is None:
+                return
+            try:
+                request_line = request_line.decode()
+            except UnicodeError:
+                await self._send_status(writer, HTTPServer.STATUS_BAD)
+                return
+            request = HTTPRequest(reader, writer, request_line, port)
+            request.track = track
+            self._debug("Request: {}".format(request.request_line))
+            if not request.method:
+                await request.send_response("text/html", "", status=HTTPServer.STATUS_BAD)
+                return
+            trace.begin("http.headers", track)
+            try:
+                await asyncio.wait_for_ms(self._read_headers(parser, request), HTTPServer.HEADERS_TIMEOUT_MS)
+            except ValueError:
+                await self._send_status(writer, HTTPServer.STATUS_HEADERS_TOO_LARGE)
+                return
+            finally:
+                trace.end("http.headers", track)
+            handler = self._get_handler(request)
+            if handler is None:
+                await request.send_response("text/html", "", status=HTTPServer.STATUS_NOT_FOUND)
+            else:
+                trace.begin("http.handler", track)
+                try:
+                    await handler(request)
+                finally:
+                    trace.end("http.handler", track)
+
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            self._info("HTTP client timeout on port {}".format(port))
+            await self._send_status(writer, HTTPServer.STATUS_TIMEOUT)
+
+        except Exception as ex:
+            self._info("HTTP server error: {}".format(ex))
+
+        finally:
+            parser.reset(None)
+            self._parserPool.append(parser)
+            self._connections -= 1
+            writer.close()
+            await writer.wait_closed()
+            trace.end("http.connection", track)
+            self._debug("Client disconnected")
@@ -1,32 +1,298 @@
+import time
+# Boot markers record the time (ticks_ms() since reset) at which each point
+# in the startup is reached. These show the startup time saved by loading
+# .mpy files (see tools/build_mpy.py) or frozen modules.
+BOOT_MARKERS = [("main.py", time.ticks_ms())]
+
 import uasyncio as asyncio
 
+# Only the modules needed in WiFi setup mode are imported here. The other
+# components are imported when they are started (if enabled) to reduce the
+# startup time and the RAM used. In WiFi setup mode
+# - http_server and basic_web_server serve the setup page (WebSocket support is
+#   only loaded when a WebSocket route is used).
+# - scheduler runs the WiFi LED task.
+# - memory allocates the buffers the web pages are sent through.
+# - config holds the WiFi configuration and the component settings below.
+# trace is imported by the servers but only allocates memory when enabled.
 from uo import UO
+from http_server import HTTPServer
 from basic_web_server import BasicWebServer
 from wifi import WiFi
-from rest_server import RestServer
-from ydev import YDevConfig, YDev
+from scheduler import Scheduler
+from memory import MemoryManager
+from config import Config
 
+# The components below are enabled or disabled by these defaults. They may be
+# changed without changing this file using the /config REST command
+# (E.G /config?section=components?key=telemetry?value=true). The key of each
+# component is shown in brackets. The changes are used after the unit is restarted.
+COMPONENTS_SECTION    = "components"    # The config section holding the component settings.
+REST_SERVER_ENABLED   = True            # If True the REST server is started (rest_server).
+YDEV_ENABLED          = True            # If True the device responds to YView
+                                        # discovery (see tools/find_ip.py) (ydev).
+MDNS_ENABLED          = True            # If True the device answers mDNS queries for
+                                        # <unit name>.local and advertises its web
+                                        # services (_http._tcp). Requires YDEV_ENABLED (mdns).
 WIFI_SETUP_BUTTON_PIN = 19              # The GPIO pin that the WiFi setup
                                         # button is connected to GND through.
+CPU_GOVERNOR_ENABLED  = False           # If True the CPU freq is raised while
+                                        # requests are being served and dropped
+                                        # when idle. This can also be enabled
+                                        # using the /cpu_governor REST command (cpu_governor).
+REST_SERVER_PORT      = 8080            # The port on which all requests are REST commands.
+                                        # REST commands are also served on port 80.
+                                        # Set to None to only listen on port 80.
+REST_CACHE_TTL_MS     = None            # A dict mapping read only REST commands (/adc,
+                                        # /temperature, /cpu_freq) to the time (ms) their
+                                        # responses are cached for (0 = not cached).
+                                        # None uses the RestServer defaults.
+TEMPERATURE_UPDATE    = True            # If True the temperature is read and smoothed
+                                        # in the background and /temperature returns
+                                        # the smoothed temperature immediately.
+TELEMETRY_ENABLED     = False           # If True sensor readings are pushed to a collector
+                                        # (see tools/telemetry_collector.py) (telemetry).
+TELEMETRY_HOST        = None            # The address of the telemetry collector.
+TELEMETRY_PORT        = 2935            # The port of the telemetry collector.
+TELEMETRY_PROTOCOL    = "udp"           # udp or tcp (a persistent connection).
+TELEMETRY_PERIOD_MS   = 1000            # The period at which readings are taken.
+TELEMETRY_BATCH       = 10              # The number of readings sent in each frame.
+TELEMETRY_ADCS        = (0, 1, 2)       # The ADC channels read.
+TELEMETRY_TEMPERATURE = True            # If True the temperature is sent.
+TELEMETRY_GPIO_MASK   = 0               # The GPIO pins read (bit n = GPIO n, 0 = none).
+SAMPLE_STORE_ENABLED  = False           # If True a history of the sampled values is kept in
+                                        # flash (/samples) and read using the /samples REST command (sample_store).
+SAMPLE_STORE_ADCS     = (0,)            # The ADC channels sampled (the temperature is also sampled).
+SAMPLE_STORE_NTP      = True            # If True the clock is set using NTP so that samples are time stamped.
+HTTP_MAX_CONNECTIONS  = 6               # The max number of HTTP connections served at
+                                        # the same time. Others get a 503 response.
+HTTP_MAX_WEBSOCKETS   = 4               # The max number of WebSocket connections open at the
+                                        # same time. These do not count against HTTP_MAX_CONNECTIONS.
+CORE1_ENABLED         = False           # If True the second core samples ADC channels, buffers
+                                        # UART RX data and records GPIO edges so that their
+                                        # timing does not depend on the network load (core1).
+CORE1_ADCS            = (0, 1, 2)       # The ADC channels sampled by core1.
+CORE1_ADC_PERIOD_US   = 1000            # The core1 ADC sample period.
+CORE1_GPIO_MASK       = 0               # The GPIO pins whose edges are recorded by core1 (bit n = GPIO n).
+GC_THRESHOLD_DIV      = 4               # An automatic GC runs once 1/n of the free heap has
+                                        # been allocated (0 = MicroPython default).
+GC_IDLE_BYTES         = 8192            # A GC runs when no requests are being served once this
+                                        # many bytes have been allocated.
+IO_BUFFERS            = 4               # The number of I/O buffers allocated at startup.
+IO_BUFFER_SIZE        = 1024            # The size of each I/O buffer.
+WIFI_LED_PERIOD_MS    = 100             # The WiFi LED flash period in WiFi setup mode.
+WIFI_BUTTON_PERIOD_MS = 100             # The period at which the WiFi button is checked while pressed.
+TRACE_ENABLED         = False           # If True spans (E.G the phases of each request) are recorded
+                                        # from startup. This can also be enabled using the
+                                        # /trace REST command (see tools/trace_dump.py) (trace).
+TRACE_EVENTS          = 256             # The number of span events held (8 bytes each).
+
+BOOT_MARKERS.append(("imports", time.ticks_ms()))
+
+def boot_marker(name):
+    """@brief Record the time at which a point in the startup is reached.
+       @param name The name of the point in the startup."""
+    BOOT_MARKERS.append((name, time.ticks_ms()))
+
+def is_enabled(config, name, default):
+    """@brief Determine if a component is enabled.
+       @param config The Config instance.
+       @param name The key of the component in the components config section (E.G rest_server).
+       @param default The value used if the component is not in the config (E.G REST_SERVER_ENABLED).
+       @return True if the component is enabled."""
+    value = config.get(COMPONENTS_SECTION, name, default)
+    # Settings added using the /config REST command are held as strings.
+    if isinstance(value, str):
+        value = value.lower() in ("1", "true")
+    return bool(value)
+
+def show_boot_markers(uo):
+    """@brief Show the time at which each point in the startup was reached.
+       @param uo A UO instance for presenting data to the user."""
+    lastTicks = 0
+    for name, ticks in BOOT_MARKERS:
+        uo.info("Boot: {: <12} {: >6} ms (+{} ms)".format(name, ticks, time.ticks_diff(ticks, lastTicks)))
+        lastTicks = ticks
+
+def start_temperature_sensor(uo, scheduler, config):
+    """@brief Create the on chip temperature sensor used by the REST server, telemetry and sample store.
+       @param uo A UO instance for presenting data to the user.
+       @param scheduler The Scheduler instance.
+       @param config The Config instance holding the calibration offset.
+       @return The TemperatureSensor instance."""
+    from temperature import TemperatureSensor
+    temperatureSensor = TemperatureSensor(uo, config=config)
+    if TEMPERATURE_UPDATE:
+        scheduler.addPeriodic("temperature", temperatureSensor.update, TemperatureSensor.UPDATE_PERIOD_MS)
+    return temperatureSensor
+
+def start_sample_store(uo, scheduler, temperatureSensor):
+    """@brief Start keeping a history of the sampled values in flash.
+       @param uo A UO instance for presenting data to the user.
+       @param scheduler The Scheduler instance.
+       @param temperatureSensor The TemperatureSensor instance.
+       @return The SampleStore instance."""
+    from sample_store import SampleStore
+    from shared_adc import SharedADC
+    if SAMPLE_STORE_NTP:
+        try:
+            import ntptime
+            ntptime.settime()
+        except Exception as ex:
+            uo.error("Failed to set the time using NTP: {}".format(ex))
+    sampleStore = SampleStore(uo)
+    for adc in SAMPLE_STORE_ADCS:
+        sampleStore.addChannel("adc{}".format(adc), SharedADC(adc).read_u16)
+    sampleStore.addChannel("temp_mc", temperatureSensor.get_mc)
+    sampleStore.open()
+    scheduler.addPeriodic("sample_store", sampleStore.update, SampleStore.SAMPLE_PERIOD_MS)
+    boot_marker("sample_store")
+    return sampleStore
+
+def start_core1(uo):
+    """@brief Start the worker on the second core.
+       @param uo A UO instance for presenting data to the user.
+       @return The Core1Worker instance."""
+    from core1 import Core1Worker
+    core1Worker = Core1Worker(uo, adc_period_us=CORE1_ADC_PERIOD_US, gpio_mask=CORE1_GPIO_MASK)
+    for adc in CORE1_ADCS:
+        core1Worker.addADC(adc)
+    core1Worker.start()
+    boot_marker("core1")
+    return core1Worker
+
+def start_rest_server(uo, scheduler, httpServer, temperatureSensor, sampleStore, memoryManager, core1Worker, config):
+    """@brief Start a server to provide a REST interface.
+              The example code allows the ADC's and temperature to be read.
+              Update rest_server.py to add features for your project.
+              The CPU freq governor raises the CPU freq while the REST server is busy.
+       @param uo A UO instance for presenting data to the user.
+       @param scheduler The Scheduler instance.
+       @param httpServer The HTTPServer instance the REST commands are added to.
+       @param temperatureSensor The TemperatureSensor instance.
+       @param sampleStore The SampleStore instance or None if not enabled.
+       @param memoryManager The MemoryManager instance.
+       @param core1Worker The Core1Worker instance or None if not enabled.
+       @param config The Config instance."""
+    from rest_server import RestServer
+    from cpu_governor import CPUGovernor
+    cpuGovernor = CPUGovernor(uo, enabled=is_enabled(config, "cpu_governor", CPU_GOVERNOR_ENABLED))
+    restServer = RestServer(uo,
+                            cpuGovernor=cpuGovernor,
+                            scheduler=scheduler,
+                            httpServer=httpServer,
+                            port=REST_SERVER_PORT,
+                            temperatureSensor=temperatureSensor,
+                            sampleStore=sampleStore,
+                            memoryManager=memoryManager,
+                            core1Worker=core1Worker,
+                            config=config,
+                            cacheTTLDict=REST_CACHE_TTL_MS)
+    restServer.startServer()
+    scheduler.addPeriodic("cpu_governor", cpuGovernor.update, CPUGovernor.POLL_PERIOD_MS)
+    boot_marker("rest_server")
+
+def start_telemetry(uo, scheduler, httpServer, temperatureSensor, config):
+    """@brief Start pushing sensor readings to a telemetry collector.
+       @param uo A UO instance for presenting data to the user.
+       @param scheduler The Scheduler instance.
+       @param httpServer The HTTPServer instance.
+       @param temperatureSensor The TemperatureSensor instance.
+       @param config The Config instance.
+       @return The Telemetry instance."""
+    import gc
+    from telemetry import Telemetry
+    from ydev import YDevConfig
+    if not TELEMETRY_TEMPERATURE:
+        temperatureSensor = None
+    telemetry = Telemetry(uo,
+                          host=TELEMETRY_HOST,
+                          port=TELEMETRY_PORT,
+                          protocol=TELEMETRY_PROTOCOL,
+                          period_ms=TELEMETRY_PERIOD_MS,
+                          batch=TELEMETRY_BATCH,
+                          adcs=TELEMETRY_ADCS,
+                          temperatureSensor=temperatureSensor,
+                          gpio_mask=TELEMETRY_GPIO_MASK,
+                          unit_name=YDevConfig(config).unit_name)
+    # Add the metrics for your project here.
+    telemetry.addMetric("mem_free", gc.mem_free)
+    telemetry.addMetric("http_connections", lambda: httpServer.getStats()["connections"])
+    telemetry.start()
+    scheduler.addPeriodic("telemetry", telemetry.update, TELEMETRY_PERIOD_MS)
+    boot_marker("telemetry")
+    return telemetry
+
+def start_ydev(uo, wifi, telemetry, config):
+    """@brief Start the YView device listener that responds to discovery messages.
+       @param uo A UO instance for presenting data to the user.
+       @param wifi The WiFi instance.
+       @param telemetry The Telemetry instance or None if telemetry is not enabled.
+       @param config The Config instance."""
+    from ydev import YDevConfig, YDev
+    # Read the IP address we have on the WiFi network.
+    ip_address = wifi.getIPAddress()
+    # Define the YView config that defines the capabilities of the device.
+    # The defaults in ydev.py can be changed using the /config REST command.
+    yDevConfig = YDevConfig(config)
+    if telemetry:
+        # Let YView know where this unit sends its telemetry.
+        yDevConfig.service_list += ",{}".format(telemetry.getServiceStr())
+    mdnsResponder = None
+    if is_enabled(config, "mdns", MDNS_ENABLED):
+        from mdns import MDNSResponder
+        mdnsResponder = MDNSResponder(uo, yDevConfig, ip_address)
+    # start Yview device listener using uasyncio
+    yDev = YDev(yDevConfig, ip_address, None, mdnsResponder)
+    asyncio.create_task(yDev.listen())
+    boot_marker("ydev")
 
 # Program entry point
 async def main():
 
     uo = UO(enabled=True, debug_enabled=True)
+
+    # All the settings are loaded from flash once here and read from RAM after this.
+    config = Config(uo)
+
+    if is_enabled(config, "trace", TRACE_ENABLED):
+        import trace
+        trace.enable(TRACE_EVENTS)
+
+    # The memory manager allocates the shared I/O buffers before the heap is
+    # fragmented and runs the garbage collector when no requests are being served.
+    memoryManager = MemoryManager(uo,
+                                  threshold_div=GC_THRESHOLD_DIV,
+                                  idle_bytes=GC_IDLE_BYTES,
+                                  buffers=IO_BUFFERS,
+                                  buffer_size=IO_BUFFER_SIZE)
     wn = WiFi.Get_Wifi_Networks()
 
     # Init the WiFi interface
-    wifi = WiFi(uo, WIFI_SETUP_BUTTON_PIN)
+    wifi = WiFi(uo, WIFI_SETUP_BUTTON_PIN, config=config)
     wifi.setup()
+    boot_marker("wifi")
+
+    # The scheduler runs the periodic tasks (rather than polling them all
+    # from a fixed period loop) and sleeps until the next one is due.
+    scheduler = Scheduler(uo)
+    # Config changes are saved to flash once no more changes are made.
+    scheduler.addPeriodic("config", config.update, Config.POLL_PERIOD_MS)
+
+    # A single HTTP server is shared by the web and REST servers.
+    httpServer = HTTPServer(uo, max_connections=HTTP_MAX_CONNECTIONS, max_websockets=HTTP_MAX_WEBSOCKETS)
+    memoryManager.addLoadSource(httpServer.getConnections)
+    scheduler.addPeriodic("memory", memoryManager.update, MemoryManager.POLL_PERIOD_MS)
 
     # Start a web server using uasyncio.
     # This provides the WiFi setup interface and once the WiFi is setup
     # the product.html file is served which may be customised as required for your project.
     # This can be customised for your project by changing the files in /webroot
     # and the GET/POST handling in basic_web_server.py
-    basicWebServer = BasicWebServer(uo)
+    basicWebServer = BasicWebServer(uo, httpServer, memoryManager.getBufferPool(), config)
     basicWebServer.set_wifi_networks(wn)
     basicWebServer.start()
+    boot_marker("web_server")
 
     # Block at this point if in WiFi setup mode.
     # We enter WiFi setup mode if the user holds down the WiFi button
@@ -36,35 +302,44 @@ async def main():
     # and the opening a browser connection to 192.168.4.1.
     # A web page is then presented that allows the user to configure the WiFi.
     if wifi.isSetupModeActive():
-        while True:
-            wifi.toggleWiFiLED()
-            await asyncio.sleep(0.1)
-
-    # Start a server to provide a REST interface.
-    # The example code allows the ADC's and temperature to be read.
-    # Update reset_server.py to add features for your project.
-    restServer = RestServer(uo)
-    restServer.startServer()
+        show_boot_markers(uo)
+        scheduler.addPeriodic("wifi_led", wifi.toggleWiFiLED, WIFI_LED_PERIOD_MS)
+        await scheduler.run()
 
-    # Read the IP address we have on the WiFi network.
-    ip_address = wifi.getIPAddress()
-    # Define the YView config that defines the capabilities of the device.
-    # These can be updated in ydev.py.
-    yDevConfig = YDevConfig()
-    # start Yview device listener using uasyncio
-    yDev = YDev(yDevConfig, ip_address, None)
-    asyncio.create_task(yDev.listen())
+    temperatureSensor = start_temperature_sensor(uo, scheduler, config)
 
-    # Main loop
-    while True:
-        # Periodically we need to check if the user is holding down the WiFi
-        # button to move to WiFi setup mode.
-        # This should be called at least once a second.
-        wifi.checkWiFiSetupMode()
+    sampleStore = None
+    if is_enabled(config, "sample_store", SAMPLE_STORE_ENABLED):
+        sampleStore = start_sample_store(uo, scheduler, temperatureSensor)
+
+    core1Worker = None
+    if is_enabled(config, "core1", CORE1_ENABLED):
+        core1Worker = start_core1(uo)
+
+    if is_enabled(config, "rest_server", REST_SERVER_ENABLED):
+        start_rest_server(uo, scheduler, httpServer, temperatureSensor, sampleStore, memoryManager, core1Worker, config)
+
+    telemetry = None
+    if is_enabled(config, "telemetry", TELEMETRY_ENABLED):
+        telemetry = start_telemetry(uo, scheduler, httpServer, temperatureSensor, config)
 
-        # Add code here to do stuff for your project as this is the main loop.
+    if is_enabled(config, "ydev", YDEV_ENABLED):
+        start_ydev(uo, wifi, telemetry, config)
 
-        await asyncio.sleep(.1)
+    # We need to check if the user is holding down the WiFi button to move to
+    # WiFi setup mode. The check runs only while the button is pressed. The
+    # button IRQ activates the task and it deactivates itself (returns False)
+    # when the button is released.
+    scheduler.addPeriodic("wifi_button", wifi.checkWiFiSetupMode, WIFI_BUTTON_PERIOD_MS, active=False)
+    wifi.setButtonHandler(lambda pin: scheduler.activate("wifi_button"))
+
+    # Add periodic tasks for your project here using scheduler.addPeriodic()
+    # or scheduler.addOneShot(). The /scheduler REST command reports their timing.
+
+    show_boot_markers(uo)
+
+    # Main loop
+    await scheduler.run()
 
 try:
     asyncio.run(main())
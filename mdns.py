@@ -0,0 +1,270 @@
+import socket
+import struct
+
+from uo import UOBase
+
+class MDNSResponder(UOBase):
+    """@brief A lightweight mDNS (RFC 6762) and DNS-SD (RFC 6763) responder so that
+              the unit can be found by name (<hostname>.local) and its web services
+              browsed (_http._tcp) using standard tools. The response packets are
+              built once when the responder is created. poll() is called from the
+              YDev UDP loop to answer queries."""
+
+    MDNS_ADDRESS        = "224.0.0.251"
+    MDNS_PORT           = 5353
+    RX_BUFFER_SIZE      = 1500
+    TYPE_A              = 1
+    TYPE_PTR            = 12
+    TYPE_TXT            = 16
+    TYPE_SRV            = 33
+    TYPE_ANY            = 255
+    CLASS_IN            = 1
+    CACHE_FLUSH         = 0x8000    # Set in the class of records that only this unit answers.
+    UNICAST_RESPONSE    = 0x8000    # Set in the class of a question if a unicast response is wanted.
+    HOST_TTL            = 120       # The TTL (seconds) of the host name records.
+    SERVICE_TTL         = 4500      # The TTL (seconds) of the service records.
+    HTTP_SERVICE        = "_http._tcp.local"
+    SERVICES_ENUM       = "_services._dns-sd._udp.local"
+    # The socket options used to join the mDNS multicast group.
+    IP_ADD_MEMBERSHIP   = getattr(socket, "IP_ADD_MEMBERSHIP", 0x400)
+    IPPROTO_IP          = getattr(socket, "IPPROTO_IP", 0)
+
+    def __init__(self, uo, yDevConfig, ip_address):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param yDevConfig The YDevConfig instance. The host name is created from the
+                             unit name and each NAME:PORT entry in the service list is
+                             advertised as an _http._tcp service.
+           @param ip_address The IP address of this unit."""
+        super().__init__(uo=uo)
+        self._sock = None
+        self._hostname = MDNSResponder.GetHostname(yDevConfig.unit_name)
+        self._ipBytes = bytes([int(elem) for elem in ip_address.split('.')])
+        self._queries = 0
+        self._responses = 0
+
+        hostRecord = self._get_record(self._hostname, MDNSResponder.TYPE_A, True, MDNSResponder.HOST_TTL, self._ipBytes)
+        self._hostResponse = self._get_packet([hostRecord], [])
+
+        # The service instances (each is a tuple of the lower case name and its response packet).
+        self._instances = []
+        ptrRecords = []
+        instanceRecords = []
+        for name, port in MDNSResponder.GetServices(yDevConfig.service_list):
+            instance = "{} {}.{}".format(yDevConfig.unit_name, name, MDNSResponder.HTTP_SERVICE)
+            ptrRecord = self._get_record(MDNSResponder.HTTP_SERVICE, MDNSResponder.TYPE_PTR, False, MDNSResponder.SERVICE_TTL, self._encode_name(instance))
+            srvRecord = self._get_record(instance, MDNSResponder.TYPE_SRV, True, MDNSResponder.HOST_TTL,
+                                         struct.pack(">HHH", 0, 0, port) + self._encode_name(self._hostname))
+            txtRecord = self._get_record(instance, MDNSResponder.TYPE_TXT, True, MDNSResponder.SERVICE_TTL,
+                                         self._encode_txt(["path=/", "product={}".format(yDevConfig.product_id)]))
+            ptrRecords.append(ptrRecord)
+            instanceRecords += [srvRecord, txtRecord]
+            self._instances.append((instance.lower(), self._get_packet([srvRecord, txtRecord], [hostRecord])))
+        self._serviceResponse = None
+        self._enumResponse = None
+        if ptrRecords:
+            self._serviceResponse = self._get_packet(ptrRecords, instanceRecords + [hostRecord])
+            enumRecord = self._get_record(MDNSResponder.SERVICES_ENUM, MDNSResponder.TYPE_PTR, False, MDNSResponder.SERVICE_TTL,
+                                          self._encode_name(MDNSResponder.HTTP_SERVICE))
+            self._enumResponse = self._get_packet([enumRecord], [])
+
+    @staticmethod
+    def GetHostname(unit_name):
+        """@brief Get the host name (without .local) of a unit. Characters that are not valid
+                  in a host name are replaced with - characters.
+           @param unit_name The unit name.
+           @return The host name (E.G a-unit-name.local)."""
+        hostname = ""
+        for c in unit_name.lower():
+            if not (c.isalpha() or c.isdigit()):
+                c = "-"
+            hostname += c
+        return hostname + ".local"
+
+    @staticmethod
+    def GetServices(service_list):
+        """@brief Get the web services in a YView service list.
+           @param service_list The service list (E.G WEB:80,REST:8080).
+           @return A list of tuples each containing the service name and port."""
+        services = []
+        for service in service_list.split(','):
+            elems = service.split(':')
+            if len(elems) == 2:
+                try:
+                    services.append((elems[0], int(elems[1])))
+                except ValueError:
+                    pass
+        return services
+
+    def _encode_name(self, name):
+        """@brief Encode a DNS name (without compression).
+           @param name The name (E.G picow.local).
+           @return The encoded bytes."""
+        data = b""
+        for label in name.split('.'):
+            label = label.encode()
+            data += bytes([len(label)]) + label
+        return data + b"\x00"
+
+    def _encode_txt(self, strings):
+        """@brief Encode TXT record data.
+           @param strings A list of key=value strings.
+           @return The encoded bytes."""
+        data = b""
+        for string in strings:
+            string = string.encode()
+            data += bytes([len(string)]) + string
+        return data
+
+    def _get_record(self, name, rtype, unique, ttl, rdata):
+        """@brief Encode a resource record.
+           @param name The record name.
+           @param rtype The record type.
+           @param unique True if only this unit answers for the record (sets the cache flush bit).
+           @param ttl The time to live in seconds.
+           @param rdata The record data.
+           @return The encoded bytes."""
+        rclass = MDNSResponder.CLASS_IN
+        if unique:
+            rclass |= MDNSResponder.CACHE_FLUSH
+        return self._encode_name(name) + struct.pack(">HHIH", rtype, rclass, ttl, len(rdata)) + rdata
+
+    def _get_packet(self, answers, additionals):
+        """@brief Create a response packet.
+           @param answers A list of the encoded answer records.
+           @param additionals A list of the encoded additional records.
+           @return The packet bytes."""
+        # ID 0, flags = response, authoritative answer.
+        hdr = struct.pack(">HHHHHH", 0, 0x8400, 0, len(answers), 0, len(additionals))
+        return hdr + b"".join(answers) + b"".join(additionals)
+
+    def open(self):
+        """@brief Open the mDNS socket and announce the unit."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', MDNSResponder.MDNS_PORT))
+            mreq = bytes([int(elem) for elem in MDNSResponder.MDNS_ADDRESS.split('.')]) + self._ipBytes
+            sock.setsockopt(MDNSResponder.IPPROTO_IP, MDNSResponder.IP_ADD_MEMBERSHIP, mreq)
+            sock.setblocking(False)
+        except OSError as ex:
+            # The unit can still be found using YView discovery.
+            sock.close()
+            self._info("mDNS responder not started: {}".format(ex))
+            return
+        self._sock = sock
+        self._info("mDNS responder started for {}".format(self._hostname))
+        self._send(self._hostResponse, None)
+        if self._serviceResponse:
+            self._send(self._serviceResponse, None)
+
+    def _send(self, packet, query_id, address=None):
+        """@brief Send a response.
+           @param packet The response packet.
+           @param query_id The ID of the query for a unicast (legacy) response or None.
+           @param address The address and port to send a unicast response to or None to multicast the response."""
+        if query_id:
+            packet = struct.pack(">H", query_id) + packet[2:]
+        if address is None:
+            address = (MDNSResponder.MDNS_ADDRESS, MDNSResponder.MDNS_PORT)
+        try:
+            self._sock.sendto(packet, address)
+            self._responses += 1
+        except OSError as ex:
+            self._debug("mDNS send error: {}".format(ex))
+
+    def _read_name(self, data, pos):
+        """@brief Read a name from a received packet.
+           @param data The packet.
+           @param pos The position of the name.
+           @return A tuple containing the lower case name and the position after the name."""
+        labels = []
+        end = None
+        jumps = 0
+        while True:
+            length = data[pos]
+            if length == 0:
+                pos += 1
+                break
+            if length & 0xc0 == 0xc0:
+                # A compression pointer to a name earlier in the packet.
+                if end is None:
+                    end = pos + 2
+                pos = ((length & 0x3f) << 8) | data[pos + 1]
+                jumps += 1
+                if jumps > 8:
+                    raise ValueError("mDNS name loop")
+                continue
+            labels.append(bytes(data[pos + 1:pos + 1 + length]).decode())
+            pos += 1 + length
+        if end is None:
+            end = pos
+        return (".".join(labels).lower(), end)
+
+    def _get_response(self, name, qtype):
+        """@brief Get the response to a question.
+           @param name The lower case name in the question.
+           @param qtype The question type.
+           @return The response packet or None if this unit does not answer the question."""
+        if name == self._hostname:
+            if qtype in (MDNSResponder.TYPE_A, MDNSResponder.TYPE_ANY):
+                return self._hostResponse
+        elif name == MDNSResponder.HTTP_SERVICE:
+            if qtype in (MDNSResponder.TYPE_PTR, MDNSResponder.TYPE_ANY):
+                return self._serviceResponse
+        elif name == MDNSResponder.SERVICES_ENUM:
+            if qtype in (MDNSResponder.TYPE_PTR, MDNSResponder.TYPE_ANY):
+                return self._enumResponse
+        else:
+            for instance, response in self._instances:
+                if name == instance and qtype in (MDNSResponder.TYPE_SRV, MDNSResponder.TYPE_TXT, MDNSResponder.TYPE_ANY):
+                    return response
+        return None
+
+    def poll(self):
+        """@brief Answer a received query if one is available. This does not block.
+           @return True if a packet was received."""
+        if self._sock is None:
+            return False
+        try:
+            data, address = self._sock.recvfrom(MDNSResponder.RX_BUFFER_SIZE)
+        except OSError:
+            return False
+
+        try:
+            query_id, flags, qdcount = struct.unpack_from(">HHH", data, 0)
+            # Ignore responses (from other hosts).
+            if flags & 0x8000:
+                return True
+            self._queries += 1
+            # A query from a port other than 5353 is a legacy (one shot) query that
+            # expects a unicast response holding the query ID.
+            legacy = address[1] != MDNSResponder.MDNS_PORT
+            pos = 12
+            sent = []
+            for _ in range(qdcount):
+                name, pos = self._read_name(data, pos)
+                qtype, qclass = struct.unpack_from(">HH", data, pos)
+                pos += 4
+                response = self._get_response(name, qtype)
+                if response and response not in sent:
+                    sent.append(response)
+                    if legacy:
+                        self._send(response, query_id, address)
+                    elif qclass & MDNSResponder.UNICAST_RESPONSE:
+                        self._send(response, None, address)
+                    else:
+                        self._send(response, None)
+
+        except Exception as ex:
+            self._debug("mDNS query error: {}".format(ex))
+
+        return True
+
+    def getStats(self):
+        """@brief Get the responder statistics.
+           @return A dict holding the host name and the number of queries and responses."""
+        return {"hostname": self._hostname,
+                "queries": self._queries,
+                "responses": self._responses}
@@ -0,0 +1,199 @@
+import gc
+import time
+
+from uo import UOBase
+import trace
+
+class BufferPool(object):
+    """@brief Holds I/O buffers allocated at startup (before the heap is fragmented)
+              so that they are reused rather than allocated for each request."""
+
+    def __init__(self, count, size):
+        """@brief Constructor
+           @param count The number of buffers.
+           @param size The size of each buffer in bytes."""
+        self._size = size
+        self._count = count
+        self._buffers = [bytearray(size) for _ in range(count)]
+        self._misses = 0
+
+    def getSize(self):
+        """@brief Get the size of the buffers.
+           @return The size in bytes."""
+        return self._size
+
+    def get(self):
+        """@brief Get a buffer. This must be returned using put() when no longer needed.
+                  If all the buffers are in use a new buffer is allocated.
+           @return A bytearray."""
+        if self._buffers:
+            return self._buffers.pop()
+        self._misses += 1
+        return bytearray(self._size)
+
+    def put(self, buf):
+        """@brief Return a buffer to the pool.
+           @param buf The buffer returned by get()."""
+        if len(self._buffers) < self._count:
+            self._buffers.append(buf)
+
+    def getStats(self):
+        """@brief Get the pool statistics.
+           @return A dict holding the buffer size, the number of buffers, the number
+                   free and the number of times a buffer was allocated as none were free."""
+        return {"size": self._size,
+                "count": self._count,
+                "free": len(self._buffers),
+                "misses": self._misses}
+
+class MemoryManager(UOBase):
+    """@brief Responsible for the heap management policy. MicroPython stops everything
+              while the garbage collector runs. If this happens when the heap is
+              exhausted part way through a request the request is delayed. The
+              MemoryManager
+              - Sets the GC threshold so that automatic collections happen before
+                the heap is exhausted and so take less time.
+              - Runs a collection when the unit is idle (no requests being served)
+                so that automatic collections rarely happen while serving requests.
+              - Holds a pool of I/O buffers allocated at startup.
+              - Records the GC pause times and heap statistics."""
+
+    POLL_PERIOD_MS          = 200       # The period at which update() should be called to check for idle.
+    DEFAULT_THRESHOLD_DIV   = 4         # An automatic collection runs once 1/n of the free heap has been allocated.
+    DEFAULT_IDLE_BYTES      = 8192      # A collection runs when idle once this many bytes have been allocated.
+    DEFAULT_BUFFERS         = 4         # The default number of pooled I/O buffers.
+    DEFAULT_BUFFER_SIZE     = 1024      # The default size of the pooled I/O buffers.
+    MAX_PAUSES              = 16        # The number of recent GC pause times held for reporting.
+
+    def __init__(self,
+                 uo=None,
+                 threshold_div=DEFAULT_THRESHOLD_DIV,
+                 idle_bytes=DEFAULT_IDLE_BYTES,
+                 buffers=DEFAULT_BUFFERS,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        """@brief Constructor. This should be called early in the startup so that the
+                  buffers are allocated before the heap is fragmented.
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param threshold_div An automatic collection runs once 1/n of the free heap has been
+                                allocated. If 0 the MicroPython default is not changed.
+           @param idle_bytes A collection runs when idle once this many bytes have been allocated.
+           @param buffers The number of pooled I/O buffers.
+           @param buffer_size The size of each pooled I/O buffer."""
+        super().__init__(uo=uo)
+        self._idleBytes = idle_bytes
+        self._loadSources = []
+        self._collections = 0
+        self._idleCollections = 0
+        self._autoCollections = 0
+        self._lastPauseUs = 0
+        self._maxPauseUs = 0
+        self._totalPauseUs = 0
+        self._pauses = []
+        self._maxAlloc = 0
+        self.collect()
+        self._bufferPool = BufferPool(buffers, buffer_size)
+        self._threshold = -1
+        if threshold_div > 0:
+            self._threshold = gc.mem_free() // threshold_div
+            gc.threshold(self._threshold)
+
+    def addLoadSource(self, loadSource):
+        """@brief Add a source of load.
+           @param loadSource A function that returns the number of operations in progress
+                             (E.G requests being served). A collection only runs when idle
+                             if all return 0."""
+        self._loadSources.append(loadSource)
+
+    def getBufferPool(self):
+        """@brief Get the pool of I/O buffers.
+           @return The BufferPool instance."""
+        return self._bufferPool
+
+    def _is_busy(self):
+        """@brief Determine if the unit is busy.
+           @return True if any load source is > 0."""
+        for loadSource in self._loadSources:
+            if loadSource() > 0:
+                return True
+        return False
+
+    def collect(self, idle=False):
+        """@brief Run the garbage collector and record the time taken.
+           @param idle True if the collection was run because the unit is idle."""
+        startUs = time.ticks_us()
+        trace.begin("gc.collect", trace.TRACK_GC)
+        gc.collect()
+        trace.end("gc.collect", trace.TRACK_GC)
+        pauseUs = time.ticks_diff(time.ticks_us(), startUs)
+        self._collections += 1
+        if idle:
+            self._idleCollections += 1
+        self._lastPauseUs = pauseUs
+        self._totalPauseUs += pauseUs
+        if pauseUs > self._maxPauseUs:
+            self._maxPauseUs = pauseUs
+        self._pauses.append(pauseUs)
+        if len(self._pauses) > MemoryManager.MAX_PAUSES:
+            self._pauses.pop(0)
+        self._collectAlloc = gc.mem_alloc()
+        self._pollAlloc = self._collectAlloc
+
+    def update(self):
+        """@brief Check if a collection should be run. This should be called every POLL_PERIOD_MS."""
+        alloc = gc.mem_alloc()
+        if alloc > self._maxAlloc:
+            self._maxAlloc = alloc
+        # If less is allocated than when last checked an automatic collection has run.
+        if alloc < self._pollAlloc:
+            self._autoCollections += 1
+            self._collectAlloc = alloc
+        self._pollAlloc = alloc
+        if alloc - self._collectAlloc >= self._idleBytes and not self._is_busy():
+            self.collect(idle=True)
+
+    def _get_largest_free_block(self):
+        """@brief Find the largest block that can be allocated. This allocates blocks
+                  so it is only done when requested.
+           @return The size of the largest free block in bytes."""
+        low = 0
+        high = gc.mem_free()
+        while low < high:
+            size = (low + high + 1) // 2
+            try:
+                bytearray(size)
+                low = size
+            except MemoryError:
+                high = size - 1
+        return low
+
+    def getStats(self, fragmentation=False):
+        """@brief Get the heap and GC statistics.
+           @param fragmentation If True a collection is run and the largest free block and
+                                the fragmentation (% of the free heap not in the largest
+                                free block) are included.
+           @return A dict holding the statistics."""
+        avgPauseUs = 0
+        if self._collections > 0:
+            avgPauseUs = self._totalPauseUs // self._collections
+        stats = {"mem_free": gc.mem_free(),
+                 "mem_alloc": gc.mem_alloc(),
+                 "max_alloc": self._maxAlloc,
+                 "threshold": self._threshold,
+                 "collections": self._collections,
+                 "idle_collections": self._idleCollections,
+                 "auto_collections": self._autoCollections,
+                 "last_pause_us": self._lastPauseUs,
+                 "max_pause_us": self._maxPauseUs,
+                 "avg_pause_us": avgPauseUs,
+                 "pauses_us": list(self._pauses),
+                 "buffers": self._bufferPool.getStats()}
+        if fragmentation:
+            self.collect()
+            free = gc.mem_free()
+            largest = self._get_largest_free_block()
+            stats["largest_free"] = largest
+            stats["fragmentation"] = 0
+            if free > 0:
+                stats["fragmentation"] = (free - largest) * 100 // free
+        return stats
@@ -0,0 +1,164 @@
+import rp2
+from array import array
+
+# The PIO programs used by pio_waveform.py along with the functions that encode the
+# data fed to them and decode the data captured by them. This module only depends on
+# rp2 so that the programs can be run on a PC by tools/pio_sim.py.
+
+PULSE_OVERHEAD_CYCLES = 4        # The number of state machine cycles used by pulse_program() in addition to the delay count.
+PULSE_MAX_CYCLES = 0x7fffffff + PULSE_OVERHEAD_CYCLES # The longest pulse pulse_program() can output.
+EDGE_START_COUNT = 0xffffffff    # The value edge_program() counts down from.
+EDGE_LOOP_CYCLES = 2             # The state machine cycles taken by each iteration of the edge_program() count loops.
+EDGE_PUSH_CYCLES = 3             # The state machine cycles taken to detect an edge and push the count (these cycles are not counted).
+VALID_WIDTHS = (1, 2, 4, 8)      # The number of consecutive pins that patterns and samples may cover.
+
+_programCache = {}
+
+def _cached(key, factory):
+    """@brief Get a program from the cache, assembling it if not already present.
+              Reusing the same program object stops it being loaded into PIO
+              instruction memory more than once.
+       @param key The cache key.
+       @param factory A function that returns the program.
+       @return The program."""
+    if key not in _programCache:
+        _programCache[key] = factory()
+    return _programCache[key]
+
+def pattern_program(width):
+    """@brief Get a program that outputs width bits on consecutive pins every state machine cycle.
+              The words fed to the TX FIFO are shifted out LSB first.
+       @param width The number of pins in VALID_WIDTHS.
+       @return The PIO program."""
+    def factory():
+        @rp2.asm_pio(out_init=(rp2.PIO.OUT_LOW,) * width,
+                     out_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                     autopull=True,
+                     pull_thresh=32,
+                     fifo_join=rp2.PIO.JOIN_TX)
+        def pattern():
+            out(pins, width)
+        return pattern
+    return _cached(('pattern', width), factory)
+
+def pulse_program():
+    """@brief Get a program that outputs a sequence of pulses on a pin.
+              Each word fed to the TX FIFO holds the pin level in bit 0 and the
+              number of cycles to hold it for (less PULSE_OVERHEAD_CYCLES) in bits 1 - 31.
+       @return The PIO program."""
+    def factory():
+        @rp2.asm_pio(out_init=rp2.PIO.OUT_LOW,
+                     out_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                     fifo_join=rp2.PIO.JOIN_TX)
+        def pulses():
+            pull(block)
+            out(pins, 1)
+            out(x, 31)
+            label("delay")
+            jmp(x_dec, "delay")
+        return pulses
+    return _cached(('pulses',), factory)
+
+def capture_program(width, trigger=None):
+    """@brief Get a program that samples width consecutive pins every state machine cycle.
+              The samples are pushed to the RX FIFO packed LSB first.
+       @param width The number of pins in VALID_WIDTHS.
+       @param trigger If None sampling starts immediately. If 0 or 1 sampling starts
+                      when the first pin is at this level.
+       @return The PIO program."""
+    def factory():
+        if trigger is None:
+            @rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                         autopush=True,
+                         push_thresh=32,
+                         fifo_join=rp2.PIO.JOIN_RX)
+            def capture():
+                in_(pins, width)
+
+        else:
+            @rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                         autopush=True,
+                         push_thresh=32,
+                         fifo_join=rp2.PIO.JOIN_RX)
+            def capture():
+                wait(trigger, pin, 0)
+                wrap_target()
+                in_(pins, width)
+
+        return capture
+    return _cached(('capture', width, trigger), factory)
+
+def edge_program():
+    """@brief Get a program that measures the time of the edges on the jmp pin.
+              X counts down from EDGE_START_COUNT every EDGE_LOOP_CYCLES and its
+              value is pushed to the RX FIFO on each edge. Edges alternate rising
+              then falling. If the pin is high at the start the first edge is
+              pushed immediately. Pulses shorter than EDGE_LOOP_CYCLES +
+              EDGE_PUSH_CYCLES may be missed.
+       @return The PIO program."""
+    def factory():
+        @rp2.asm_pio(fifo_join=rp2.PIO.JOIN_RX)
+        def edges():
+            mov(x, invert(null))
+            wrap_target()
+            label("low")
+            jmp(pin, "rise")
+            jmp(x_dec, "low")
+            label("rise")
+            mov(isr, x)
+            push(noblock)
+            label("high")
+            jmp(pin, "high_dec")
+            mov(isr, x)
+            push(noblock)
+            wrap()
+            label("high_dec")
+            jmp(x_dec, "high")
+            jmp("high")
+        return edges
+    return _cached(('edges',), factory)
+
+def check_width(width):
+    """@brief Check the number of pins a pattern or sample covers.
+       @param width The number of pins."""
+    if width not in VALID_WIDTHS:
+        raise ValueError("{} is an invalid width (valid = {}).".format(width, VALID_WIDTHS))
+
+def encode_pulses(pulses):
+    """@brief Encode a sequence of pulses for pulse_program().
+       @param pulses A list of (level, cycles) tuples.
+       @return An array of words to feed to the TX FIFO."""
+    words = array('I', [0] * len(pulses))
+    index = 0
+    for level, cycles in pulses:
+        if cycles < PULSE_OVERHEAD_CYCLES or cycles > PULSE_MAX_CYCLES:
+            raise ValueError("{} is an invalid pulse length (valid = {} - {} cycles).".format(cycles, PULSE_OVERHEAD_CYCLES, PULSE_MAX_CYCLES))
+        words[index] = ((cycles - PULSE_OVERHEAD_CYCLES) << 1) | (level & 1)
+        index += 1
+    return words
+
+def decode_samples(words, width, count):
+    """@brief Decode the words captured by capture_program().
+       @param words The captured words.
+       @param width The number of pins sampled.
+       @param count The number of samples to decode.
+       @return A list of samples. Bit n of each sample holds the level of the nth pin."""
+    per_word = 32 // width
+    mask = (1 << width) - 1
+    samples = []
+    for index in range(count):
+        word = words[index // per_word]
+        samples.append((word >> ((index % per_word) * width)) & mask)
+    return samples
+
+def decode_edges(words, count):
+    """@brief Decode the counts captured by edge_program().
+       @param words The captured counts.
+       @param count The number of counts captured.
+       @return A list of the times, in state machine cycles after the start, of each edge."""
+    times = []
+    for index in range(count):
+        elapsed = (EDGE_START_COUNT - words[index]) * EDGE_LOOP_CYCLES
+        # Add the cycles spent detecting the previous edges as X was not decremented during them.
+        times.append(elapsed + index * EDGE_PUSH_CYCLES)
+    return times
@@ -0,0 +1,273 @@
+import binascii
+from array import array
+import rp2
+import machine
+
+import pio_programs
+
+class PIOWaveform(object):
+    """@brief Responsible for playing waveforms out of GPIO pins and capturing waveforms
+              on GPIO pins using PIO state machines fed by DMA so that the timing
+              does not depend on python code."""
+
+    OUT_SM_ID           = 0                        # The state machine used to play waveforms.
+    IN_SM_ID            = 1                        # The state machine used to capture waveforms.
+    PIO_BASE            = (0x50200000, 0x50300000) # The base address of the PIO0 and PIO1 blocks.
+    PIO_TXF0_OFFSET     = 0x010                    # The offset of the state machine 0 TX FIFO.
+    PIO_RXF0_OFFSET     = 0x020                    # The offset of the state machine 0 RX FIFO.
+    DREQ_PIO_TX0        = (0, 8)                   # The DMA request signal for PIO0/PIO1 state machine 0 TX FIFO.
+    DREQ_PIO_RX0        = (4, 12)                  # The DMA request signal for PIO0/PIO1 state machine 0 RX FIFO.
+    MIN_BUFFER_BYTES    = 4                        # The smallest waveform that can be played or captured (one word).
+    MAX_BUFFER_BYTES    = 16384                    # The largest waveform that can be played or captured. Waveforms played
+                                                   # using the REST server are limited by the request line length.
+    MIN_SM_FREQ_HZ      = 2000                     # The min state machine clock (the max clock divider is 65536).
+
+    MODE_PATTERN        = "pattern"                # Play bit patterns on consecutive pins.
+    MODE_PULSES         = "pulses"                 # Play a sequence of pulses on a pin.
+    MODE_SAMPLES        = "samples"                # Capture the levels of consecutive pins.
+    MODE_EDGES          = "edges"                  # Capture the time of the edges on a pin.
+
+    def __init__(self):
+        """@brief Constructor"""
+        if not hasattr(rp2, 'DMA'):
+            raise Exception("PIO waveforms require MicroPython 1.21 or later (rp2.DMA).")
+        self._outSM = None
+        self._outDMA = None
+        self._outBuffer = None
+        self._outProgram = None
+        self._outMode = None
+        self._inSM = None
+        self._inDMA = None
+        self._inBuffer = None
+        self._inProgram = None
+        self._inMode = None
+        self._inCaptured = 0
+        self._inWidth = 0
+        self._inCount = 0
+        self._inFreq = 0
+        self._inStartLevel = 0
+
+    def _check_freq(self, freq):
+        """@brief Check the state machine clock frequency.
+           @param freq The frequency in Hz."""
+        if freq < PIOWaveform.MIN_SM_FREQ_HZ or freq > machine.freq():
+            raise ValueError("{} Hz is an invalid frequency (valid = {} - {} Hz).".format(freq, PIOWaveform.MIN_SM_FREQ_HZ, machine.freq()))
+
+    def _check_size(self, byte_count):
+        """@brief Check the size of a waveform buffer.
+           @param byte_count The size of the buffer in bytes."""
+        if byte_count < PIOWaveform.MIN_BUFFER_BYTES or byte_count > PIOWaveform.MAX_BUFFER_BYTES:
+            raise ValueError("{} bytes is an invalid waveform size (valid = {} - {}).".format(byte_count, PIOWaveform.MIN_BUFFER_BYTES, PIOWaveform.MAX_BUFFER_BYTES))
+
+    def _fifo_address(self, sm_id, offset):
+        """@brief Get the address of a state machine FIFO register.
+           @param sm_id The state machine ID (0 - 7).
+           @param offset The offset of the state machine 0 FIFO register.
+           @return The address."""
+        return PIOWaveform.PIO_BASE[sm_id // 4] + offset + 4 * (sm_id % 4)
+
+    def _dreq(self, sm_id, dreq_sm0):
+        """@brief Get the DMA request signal of a state machine FIFO.
+           @param sm_id The state machine ID (0 - 7).
+           @param dreq_sm0 The PIO0/PIO1 state machine 0 DMA request signals.
+           @return The DMA request signal."""
+        return dreq_sm0[sm_id // 4] + sm_id % 4
+
+    def _start_dma(self, dma, read, write, count, dreq, inc_read, inc_write):
+        """@brief Start a DMA transfer of 32 bit words paced by a state machine FIFO.
+           @param dma The rp2.DMA instance.
+           @param read The source buffer or address.
+           @param write The destination buffer or address.
+           @param count The number of words to transfer.
+           @param dreq The DMA request signal.
+           @param inc_read If True increment the read address after each word.
+           @param inc_write If True increment the write address after each word."""
+        ctrl = dma.pack_ctrl(size=2, inc_read=inc_read, inc_write=inc_write, treq_sel=dreq)
+        dma.config(read=read, write=write, count=count, ctrl=ctrl, trigger=True)
+
+    def _stop(self, sm_id, sm, dma, program):
+        """@brief Stop a state machine and its DMA channel.
+           @param sm_id The state machine ID (0 - 7).
+           @param sm The rp2.StateMachine instance or None.
+           @param dma The rp2.DMA instance or None.
+           @param program The program the state machine is running."""
+        if sm:
+            sm.active(0)
+            # Free the PIO instruction memory used by the program.
+            try:
+                rp2.PIO(sm_id // 4).remove_program(program)
+            except Exception:
+                pass
+        if dma:
+            dma.close()
+
+    def stop_output(self):
+        """@brief Stop playing a waveform. The output pins hold their current state."""
+        self._stop(PIOWaveform.OUT_SM_ID, self._outSM, self._outDMA, self._outProgram)
+        self._outSM = None
+        self._outDMA = None
+        self._outBuffer = None
+
+    def stop_capture(self):
+        """@brief Stop capturing a waveform. The data captured so far is kept."""
+        if self._inDMA:
+            self._inCaptured = self._get_captured_words()
+        self._stop(PIOWaveform.IN_SM_ID, self._inSM, self._inDMA, self._inProgram)
+        self._inSM = None
+        self._inDMA = None
+
+    def _play(self, mode, program, pin, freq, words, word_count):
+        """@brief Play words through a program on the output state machine.
+           @param mode The output mode.
+           @param program The PIO program.
+           @param pin The first output pin.
+           @param freq The state machine clock frequency in Hz.
+           @param words A buffer holding the words to feed to the program.
+           @param word_count The number of words in the buffer."""
+        self.stop_output()
+        self._outBuffer = words
+        self._outProgram = program
+        self._outMode = mode
+        self._outSM = rp2.StateMachine(PIOWaveform.OUT_SM_ID, program, freq=freq, out_base=machine.Pin(pin))
+        self._outDMA = rp2.DMA()
+        # Start the DMA first so the TX FIFO is full when the state machine starts.
+        self._start_dma(self._outDMA,
+                        words,
+                        self._fifo_address(PIOWaveform.OUT_SM_ID, PIOWaveform.PIO_TXF0_OFFSET),
+                        word_count,
+                        self._dreq(PIOWaveform.OUT_SM_ID, PIOWaveform.DREQ_PIO_TX0),
+                        True,
+                        False)
+        self._outSM.active(1)
+
+    def play_pattern(self, pin, width, freq, data):
+        """@brief Play a bit pattern on consecutive pins, width bits every state machine cycle.
+           @param pin The first output pin.
+           @param width The number of pins (1, 2, 4 or 8).
+           @param freq The rate at which bits are output in Hz.
+           @param data The pattern bytes. Bits are output LSB first. The length must be a multiple of 4."""
+        pio_programs.check_width(width)
+        self._check_freq(freq)
+        self._check_size(len(data))
+        if len(data) % 4:
+            raise ValueError("The pattern length ({} bytes) must be a multiple of 4 bytes.".format(len(data)))
+        # DMA reads the words straight out of the (word aligned) byte buffer.
+        self._play(PIOWaveform.MODE_PATTERN, pio_programs.pattern_program(width), pin, freq, bytearray(data), len(data) // 4)
+
+    def play_pulses(self, pin, freq, pulses):
+        """@brief Play a sequence of pulses on a pin.
+           @param pin The output pin.
+           @param freq The state machine clock frequency in Hz. The pulse lengths are in cycles of this clock.
+           @param pulses A list of (level, cycles) tuples."""
+        self._check_freq(freq)
+        self._check_size(len(pulses) * 4)
+        words = pio_programs.encode_pulses(pulses)
+        self._play(PIOWaveform.MODE_PULSES, pio_programs.pulse_program(), pin, freq, words, len(words))
+
+    def _capture(self, mode, program, pin, freq, word_count):
+        """@brief Start capturing words from a program on the input state machine.
+           @param mode The capture mode.
+           @param program The PIO program.
+           @param pin The first input pin.
+           @param freq The state machine clock frequency in Hz.
+           @param word_count The number of words to capture."""
+        self.stop_capture()
+        inPin = machine.Pin(pin, machine.Pin.IN)
+        self._inStartLevel = inPin.value()
+        self._inBuffer = array('I', [0] * word_count)
+        self._inCaptured = 0
+        self._inProgram = program
+        self._inMode = mode
+        self._inFreq = freq
+        self._inSM = rp2.StateMachine(PIOWaveform.IN_SM_ID, program, freq=freq, in_base=inPin, jmp_pin=inPin)
+        self._inDMA = rp2.DMA()
+        self._start_dma(self._inDMA,
+                        self._fifo_address(PIOWaveform.IN_SM_ID, PIOWaveform.PIO_RXF0_OFFSET),
+                        self._inBuffer,
+                        word_count,
+                        self._dreq(PIOWaveform.IN_SM_ID, PIOWaveform.DREQ_PIO_RX0),
+                        False,
+                        True)
+        self._inSM.active(1)
+
+    def capture_samples(self, pin, width, freq, count, trigger=None):
+        """@brief Capture the levels of consecutive pins every state machine cycle.
+           @param pin The first input pin.
+           @param width The number of pins (1, 2, 4 or 8).
+           @param freq The sample rate in Hz.
+           @param count The number of samples to capture.
+           @param trigger If None capture starts immediately. If 0 or 1 capture starts
+                          when the first pin is at this level."""
+        pio_programs.check_width(width)
+        self._check_freq(freq)
+        word_count = (count * width + 31) // 32
+        self._check_size(word_count * 4)
+        self._inWidth = width
+        self._inCount = count
+        self._capture(PIOWaveform.MODE_SAMPLES, pio_programs.capture_program(width, trigger), pin, freq, word_count)
+
+    def capture_edges(self, pin, freq, count):
+        """@brief Capture the time of the edges on a pin.
+           @param pin The input pin.
+           @param freq The state machine clock frequency in Hz. The edge times are in cycles of this clock.
+           @param count The max number of edges to capture."""
+        self._check_freq(freq)
+        self._check_size(count * 4)
+        self._inWidth = 1
+        self._inCount = count
+        self._capture(PIOWaveform.MODE_EDGES, pio_programs.edge_program(), pin, freq, count)
+
+    def _get_captured_words(self):
+        """@brief Get the number of words captured.
+           @return The number of words in the capture buffer."""
+        if self._inDMA:
+            return len(self._inBuffer) - self._inDMA.count
+        return self._inCaptured
+
+    def isActive(self):
+        """@brief Determine if a waveform is being played or captured.
+           @return True if either DMA channel is active."""
+        return (self._outDMA is not None and self._outDMA.active()) or \
+               (self._inDMA is not None and self._inDMA.active())
+
+    def get_status(self):
+        """@brief Get the state of the output and capture state machines.
+           @return A dict detailing the state."""
+        output = {"mode": self._outMode,
+                  "active": False,
+                  "remaining": 0}
+        if self._outDMA:
+            output["active"] = self._outDMA.active()
+            output["remaining"] = self._outDMA.count
+
+        capture = {"mode": self._inMode,
+                   "active": False,
+                   "words": 0}
+        if self._inBuffer is not None:
+            capture["words"] = self._get_captured_words()
+            if self._inDMA:
+                capture["active"] = self._inDMA.active()
+
+        return {"output": output, "capture": capture}
+
+    def get_capture(self):
+        """@brief Get the captured waveform.
+           @return A dict containing the captured data. For samples this is the
+                   hex encoded sample words (LSB first). For edges this is a list
+                   of edge times in state machine cycles."""
+        if self._inBuffer is None:
+            raise Exception("No waveform has been captured.")
+        words = self._get_captured_words()
+        capture = {"mode": self._inMode,
+                   "freq": self._inFreq,
+                   "start": self._inStartLevel}
+        if self._inMode == PIOWaveform.MODE_EDGES:
+            capture["edges"] = pio_programs.decode_edges(self._inBuffer, words)
+        else:
+            count = words * 32 // self._inWidth
+            if count > self._inCount:
+                count = self._inCount
+            capture["width"] = self._inWidth
+            capture["count"] = count
+            capture["data"] = binascii.hexlify(memoryview(self._inBuffer)[:words]).decode()
+        return capture
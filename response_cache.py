@@ -0,0 +1,71 @@
+import time
+
+class ResponseCache(object):
+    """@brief Holds encoded responses to read only requests for a short time so that
+              identical requests (E.G several clients polling the same value) are
+              answered without reading the hardware or encoding the response again.
+
+              Each entry is keyed by a tuple whose first element is the command so
+              that all the entries of a command can be removed when a request
+              changes the state it reads. Request handlers run to completion
+              without yielding to other requests so the first request of a burst
+              computes the response and those that follow are served from the
+              cache until the TTL expires."""
+
+    MAX_ENTRIES = 16        # The max number of responses held.
+
+    def __init__(self, maxEntries=MAX_ENTRIES):
+        """@brief Constructor
+           @param maxEntries The max number of responses held. When full the entry
+                             that expires first is replaced."""
+        self._maxEntries = maxEntries
+        # Each entry is a tuple of the expiry time (ticks_ms) and the response.
+        self._entryDict = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    def get(self, key):
+        """@brief Get a response.
+           @param key The key (a tuple starting with the command).
+           @return The response or None if not held or expired."""
+        entry = self._entryDict.get(key)
+        if entry is not None:
+            if time.ticks_diff(entry[0], time.ticks_ms()) > 0:
+                self._hits += 1
+                return entry[1]
+            del self._entryDict[key]
+        self._misses += 1
+        return None
+
+    def put(self, key, ttlMs, response):
+        """@brief Hold a response.
+           @param key The key (a tuple starting with the command).
+           @param ttlMs The time (ms) the response is held for.
+           @param response The response."""
+        if key not in self._entryDict and len(self._entryDict) >= self._maxEntries:
+            now = time.ticks_ms()
+            oldestKey = None
+            oldestMs = None
+            for entryKey in self._entryDict:
+                remainingMs = time.ticks_diff(self._entryDict[entryKey][0], now)
+                if oldestMs is None or remainingMs < oldestMs:
+                    oldestKey = entryKey
+                    oldestMs = remainingMs
+            del self._entryDict[oldestKey]
+        self._entryDict[key] = (time.ticks_add(time.ticks_ms(), ttlMs), response)
+
+    def invalidate(self, cmd):
+        """@brief Remove all the responses to a command.
+           @param cmd The command."""
+        for key in [key for key in self._entryDict if key[0] == cmd]:
+            del self._entryDict[key]
+            self._invalidated += 1
+
+    def getStats(self):
+        """@brief Get the cache statistics.
+           @return A dict holding the number of entries, hits, misses and invalidated entries."""
+        return {"entries": len(self._entryDict),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidated": self._invalidated}
@@ -1,8 +1,18 @@
 import json
+import time
+import binascii
 import uasyncio as asyncio
 import machine
 
 from uo import UOBase
+from http_server import HTTPServer
+import wire_format
+from response_cache import ResponseCache
+import trace
+from gpio_events import GPIOEvents
+from temperature import TemperatureSensor
+from shared_adc import SharedADC
+from sequence import SequenceRunner
 
 class RestServer(UOBase):
     """@brief Responsible for providing a REST interface to allow clients to
@@ -10,6 +20,21 @@ class RestServer(UOBase):
 
     TCP_PORT = 8080                                          # The TCP port to present the REST server on.
     MAX_CPU_FREQ_HZ = 240000000                              # The MAX CPU freq in Hz.
+    MIN_CPU_FREQ_HZ = 48000000                               # The MIN CPU freq in Hz (USB needs a 48 MHz clock).
+    GPIO_EVENTS_TIMEOUT_MS = 10000                           # The max time (ms) a long-poll GPIO events request waits for an edge.
+    SSE_KEEPALIVE_MS = 15000                                 # The period (ms) of keepalive comments sent on an idle event stream.
+    WS_MIN_PERIOD_MS = 20                                    # The min period (ms) of a WebSocket subscription.
+    WS_DEFAULT_PERIOD_MS = 1000                              # The default period (ms) of a WebSocket subscription.
+    WS_MAX_SUBSCRIPTIONS = 8                                 # The max number of subscriptions on a WebSocket.
+    WS_IDLE_MS = 15000                                       # The time (ms) the WebSocket push loop waits when there are no subscriptions.
+    MAX_TRACE_EVENTS = 2048                                  # The max number of events held by the span trace (8 bytes each).
+
+    # RP2040 single cycle IO (SIO) registers used to read/write several GPIO pins at once.
+    SIO_BASE = 0xd0000000                                    # The base address of the SIO block.
+    SIO_GPIO_IN = SIO_BASE + 0x004                           # The input state of GPIO 0 - 29.
+    SIO_GPIO_OUT = SIO_BASE + 0x010                          # The output state of GPIO 0 - 29.
+    SIO_GPIO_OUT_XOR = SIO_BASE + 0x01c                      # Writing a 1 to a bit inverts the corresponding output.
+    GPIO_MASK_VALID = 0x1c7fffff                             # GPIO 0 - 22 and 26 - 28. GPIO 23, 24, 25 and 29 connect to the WiFi chip.
 
     SERVER_EXCEPTION_LOG_FILE = '/rest_server_exception.txt' # Rest server exceptions are stored in for debug purposes.
     ERROR_KEY = "ERROR"                                      # The key in the JSON response if an error occurs.
@@ -25,23 +50,150 @@ class RestServer(UOBase):
     UART_TX = "/uart_tx"                                     # The text in the HTTP request when sending data out of a uart port.
     UART_RX = "/uart_rx"                                     # The text in the HTTP request when reading data from a uart port.
     PWM = "/pwm"                                             # The text in the HTTP request when setting a GPIO pin as PWM.
-
-    def __init__(self, uo=None):
+    GPIO_EVENTS = "/gpio_events"                             # The text in the HTTP request when reading edges on GPIO input pins.
+    SET_GPIOS = "/set_gpios"                                 # The text in the HTTP request when setting several GPIO pins at once.
+    GET_GPIOS = "/get_gpios"                                 # The text in the HTTP request when reading several GPIO pins at once.
+    PIO_OUT = "/pio_out"                                     # The text in the HTTP request when playing a waveform using PIO.
+    PIO_IN = "/pio_in"                                       # The text in the HTTP request when capturing a waveform using PIO.
+    PIO_STATUS = "/pio_status"                               # The text in the HTTP request when reading the state of the PIO waveforms.
+    PIO_DATA = "/pio_data"                                   # The text in the HTTP request when reading a captured PIO waveform.
+    PIO_STOP = "/pio_stop"                                   # The text in the HTTP request when stopping the PIO waveforms.
+    CPU_GOVERNOR = "/cpu_governor"                           # The text in the HTTP request when reading/configuring the CPU freq governor.
+    SCHEDULER = "/scheduler"                                 # The text in the HTTP request when reading the scheduled task statistics.
+    HTTP_STATS = "/http_stats"                               # The text in the HTTP request when reading the HTTP connection statistics.
+    SAMPLES = "/samples"                                     # The text in the HTTP request when reading the sample history.
+    MEM = "/mem"                                             # The text in the HTTP request when reading the heap and GC statistics.
+    CORE1 = "/core1"                                         # The text in the HTTP request when reading the data captured by core1.
+    CONFIG = "/config"                                       # The text in the HTTP request when reading/changing the unit config.
+    SEQUENCE = "/sequence"                                   # The text in the HTTP request when running/storing a sequence of timed operations.
+    TRACE = "/trace"                                         # The text in the HTTP request when controlling/reading the span trace.
+    WS = "/ws"                                               # The path of the WebSocket live data channel.
+    WS_STREAMS = ("adc0", "adc1", "adc2", "adc3", "adc4", "temperature", "gpios") # The streams a WebSocket client may subscribe to.
+    DEFAULT_SAMPLES_S = 86400                                # The default time range (seconds) of a /samples request.
+
+    # The commands whose value may be sent as a fixed layout struct record (fmt=struct).
+    # Each maps to the record ID and the struct format of the value. These must
+    # match the layouts in tools/wire_decode.py.
+    STRUCT_LAYOUT_DICT = {ADC_REQ:          (1, "H"),         # The ADC value (0 - 65535).
+                          TEMPERATURE_REQ:  (2, "f"),         # The temperature in degrees C.
+                          SETUP_GPIO_REQ:   (3, "B"),         # The input pin state.
+                          GET_GPIOS:        (4, "I"),         # The input pin states (bit n = GPIO n).
+                          CPU_FREQ:         (5, "I")}         # The CPU freq in Hz.
+
+    # The read only commands whose responses are cached. Each maps to the default TTL (ms) and
+    # the arguments that select the value read. Requests with other arguments (E.G
+    # /cpu_freq?freq=240000000) change the state so they are not cached and remove the cached responses.
+    CACHE_ROUTE_DICT = {ADC_REQ:            (50, ("adc",)),
+                        TEMPERATURE_REQ:    (1000, ()),
+                        CPU_FREQ:           (250, ())}
+    # The cached responses removed by commands that may change the values they hold.
+    CACHE_INVALIDATE_DICT = {SETUP_GPIO_REQ:    (ADC_REQ,),     # GPIO 26 - 28 are also ADC 0 - 2.
+                             SET_GPIOS:         (ADC_REQ,),
+                             PWM:               (ADC_REQ,),
+                             SETUP_UART:        (ADC_REQ,),
+                             SEQUENCE:          (ADC_REQ,),
+                             CPU_GOVERNOR:      (CPU_FREQ,),
+                             CONFIG:            (TEMPERATURE_REQ,)}
+    CACHE_IGNORED_ARGS = ('fmt', GET_REQ, CMD_KEY)         # The arguments that do not select the value read.
+
+    def __init__(self, uo=None, cpuGovernor=None, scheduler=None, httpServer=None, port=TCP_PORT, temperatureSensor=None, sampleStore=None, memoryManager=None, core1Worker=None, config=None, cacheTTLDict=None):
         """@brief Constructor
            @param uo A UO instance for presenting data to the user. If Left as None
-                     no data is sent to the user."""
+                     no data is sent to the user.
+           @param cpuGovernor A CPUGovernor instance that raises the CPU freq while requests
+                              are being served or None if the CPU freq is only set manually.
+           @param scheduler The Scheduler instance running the periodic tasks or None.
+           @param httpServer The HTTPServer instance that the REST commands are added to. If None
+                             the REST server creates its own HTTPServer instance.
+           @param port The TCP port on which all requests are REST commands. If None the REST
+                       commands are only available on the ports the httpServer is listening on.
+           @param temperatureSensor A TemperatureSensor instance (E.G one updated in the background
+                                    by the scheduler) or None.
+           @param sampleStore A SampleStore instance holding the sample history or None.
+           @param memoryManager The MemoryManager instance or None.
+           @param core1Worker A Core1Worker instance that samples ADC channels and buffers UART
+                              data on the second core or None if not used.
+           @param config The Config instance holding the unit settings or None.
+           @param cacheTTLDict A dict mapping read only commands (see CACHE_ROUTE_DICT) to the
+                               time (ms) their responses are cached for. A TTL of 0 disables
+                               caching of the command. If None the default TTLs are used."""
         super().__init__(uo=uo)
+        self._httpServer = httpServer
+        if self._httpServer is None:
+            self._httpServer = HTTPServer(uo)
+        self._port = port
         self._gpioDict = {}
         self._uartDict = {}
         self._pwmDict = {}
+        self._gpioEvents = GPIOEvents()
+        self._pioWaveform = None
+        self._activeRequests = 0
+        self._cpuGovernor = cpuGovernor
+        self._scheduler = scheduler
+        self._temperatureSensor = temperatureSensor
+        self._sampleStore = sampleStore
+        self._memoryManager = memoryManager
+        self._core1Worker = core1Worker
+        self._config = config
+        self._responseCache = ResponseCache()
+        self._cacheTTLDict = {}
+        for cmd in RestServer.CACHE_ROUTE_DICT:
+            self._cacheTTLDict[cmd] = RestServer.CACHE_ROUTE_DICT[cmd][0]
+        if cacheTTLDict:
+            self._cacheTTLDict.update(cacheTTLDict)
+        self._sequenceRunner = SequenceRunner(uo,
+                                              self._get_sequence_pin,
+                                              self._get_sequence_pwm,
+                                              self._get_uart,
+                                              self._get_adc_value,
+                                              self._get_uart_rx_data,
+                                              config=config)
+        if self._cpuGovernor:
+            self._cpuGovernor.addLoadSource(self._get_load)
+            self._cpuGovernor.addLockSource(self._is_cpu_freq_locked)
+        # The functions that handle each command. These are passed the args_dict
+        # and return the JSON response.
+        self._routeDict = {RestServer.ADC_REQ:          self._read_adc,
+                           RestServer.SETUP_GPIO_REQ:   self._setup_gpio,
+                           RestServer.TEMPERATURE_REQ:  self._read_temp,
+                           RestServer.CPU_FREQ:         self._cpu_freq,
+                           RestServer.SETUP_UART:       self._setup_uart,
+                           RestServer.UART_TX:          self._uart_tx,
+                           RestServer.UART_RX:          self._uart_rx,
+                           RestServer.PWM:              self._pwm,
+                           RestServer.SET_GPIOS:        self._set_gpios,
+                           RestServer.GET_GPIOS:        self._get_gpios,
+                           RestServer.PIO_OUT:          self._pio_out,
+                           RestServer.PIO_IN:           self._pio_in,
+                           RestServer.PIO_STATUS:       self._pio_status,
+                           RestServer.PIO_DATA:         self._pio_data,
+                           RestServer.PIO_STOP:         self._pio_stop,
+                           RestServer.CPU_GOVERNOR:     self._cpu_governor,
+                           RestServer.SCHEDULER:        self._scheduler_stats,
+                           RestServer.HTTP_STATS:       self._http_stats,
+                           RestServer.SAMPLES:          self._samples,
+                           RestServer.MEM:              self._mem,
+                           RestServer.CORE1:            self._core1,
+                           RestServer.CONFIG:           self._config_cmd,
+                           RestServer.SEQUENCE:         self._sequence,
+                           RestServer.TRACE:            self._trace}
+        # The async functions that handle commands that may send their own response.
+        # These are passed the args_dict and the writer and return the JSON response or None.
+        self._asyncRouteDict = {RestServer.GPIO_EVENTS: self._gpio_events}
 
     def startServer(self):
-        asyncio.create_task(asyncio.start_server(self._serve_client, "0.0.0.0", RestServer.TCP_PORT))
-
-    def _ok_json_response(self, writer):
-        """@brief Send an HTTP OK response and header to define JSON data following.
-           @param writer The writer object used to send data."""
-        writer.write('HTTP/1.0 200 OK\r\nContent-type: application/json\r\n\r\n')
+        """@brief Add the REST commands to the HTTP server and start it listening."""
+        self._gpioEvents.start()
+        # The Accept header may select the response encoding.
+        self._httpServer.addHeader("accept")
+        for cmd in self._routeDict:
+            self._httpServer.addRoute(cmd, self._serve_request)
+        for cmd in self._asyncRouteDict:
+            self._httpServer.addRoute(cmd, self._serve_request)
+        self._httpServer.addWebSocketRoute(RestServer.WS, self._serve_websocket)
+        if self._port is not None:
+            # Unknown commands on the REST port get a JSON error response rather than a file.
+            self._httpServer.listen(self._port, defaultHandler=self._serve_request)
 
     def _get_return_dict(self, cmd, msg, error):
         """@brief Get a JSON error response.
@@ -52,65 +204,269 @@ class RestServer(UOBase):
         return { RestServer.ERROR_KEY: error,
                  cmd: msg}
 
-    async def _serve_client(self, reader, writer):
-        """@brief Called to serve a request for data."""
-        self._info("Client connected")
-        request_line = await reader.readline()
-        self._info("Request: %s" % request_line)
-        # We are not interested in HTTP request headers, skip them
-        while await reader.readline() != b"\r\n":
-            pass
+    def _get_load(self):
+        """@brief Get the load on the REST server.
+           @return The number of requests being served plus one if a PIO waveform is being played or captured."""
+        load = self._activeRequests
+        if self._pioWaveform and self._pioWaveform.isActive():
+            load += 1
+        return load
+
+    def _is_cpu_freq_locked(self):
+        """@brief Determine if the CPU freq must not be changed by the governor.
+                  The freq of PWM outputs, UART baud rates and PIO waveforms depend on the CPU freq.
+           @return True if the CPU freq is locked."""
+        return len(self._pwmDict) > 0 or \
+               len(self._uartDict) > 0 or \
+               (self._pioWaveform is not None and self._pioWaveform.isActive())
+
+    async def _serve_request(self, request):
+        """@brief Called by the HTTPServer to serve a request for data.
+           @param request The HTTPRequest instance."""
+        self._activeRequests += 1
+        if self._cpuGovernor:
+            self._cpuGovernor.busy()
+        try:
+            await self._handle_request(request)
+        finally:
+            self._activeRequests -= 1
+
+    async def _wait_idle(self, coro):
+        """@brief Wait for an event (E.G a GPIO edge) without the request counting as load.
+           @param coro The coroutine to wait for.
+           @return The value returned by the coroutine."""
+        self._activeRequests -= 1
+        try:
+            return await coro
+        finally:
+            self._activeRequests += 1
 
-        req = request_line.decode()
+    async def _handle_request(self, request):
+        """@brief Run the command in a request and send the response.
+           @param request The HTTPRequest instance."""
+        self._info("Request: %s" % request.request_line)
 
         # We don't respond with an HTTP 404 error but return a JSON message
         # in the event of an error.
-        response_dict = self._get_return_dict("unknown_cmd", "{} is a malformed request.".format(req), True)
-        response = json.dumps(response_dict)
+        response_dict = self._get_return_dict("unknown_cmd", "{} is a malformed request.".format(request.request_line), True)
 
-        args_dict  = self._get_args_dict(req)
+        cmd = None
+        cacheKey = None
+        trace.begin("rest.args", request.track)
+        try:
+            args_dict  = self._get_args_dict(request)
+        finally:
+            trace.end("rest.args", request.track)
         self._debug("args_dict={}".format(args_dict))
+        fmt = wire_format.get_format(args_dict.get('fmt'), request.get_header('accept'))
         if RestServer.CMD_KEY in args_dict:
             cmd = args_dict[RestServer.CMD_KEY]
-            if cmd == RestServer.ADC_REQ:
-                response = self._read_adc(args_dict)
-
-            elif cmd == RestServer.SETUP_GPIO_REQ:
-                response = self._setup_gpio(args_dict)
+            if cmd in self._routeDict:
+                cacheKey = self._get_cache_key(cmd, args_dict, fmt)
+                if cacheKey:
+                    cached = self._responseCache.get(cacheKey)
+                    if cached:
+                        trace.instant("rest.cache_hit", request.track)
+                        await request.send_response(cached[0], cached[1])
+                        return
+
+                trace.begin(cmd, request.track)
+                try:
+                    response_dict = self._routeDict[cmd](args_dict)
+                finally:
+                    trace.end(cmd, request.track)
+                self._invalidate_cache(cmd, cacheKey)
 
-            elif cmd == RestServer.TEMPERATURE_REQ:
-                response = self._read_temp()
+            elif cmd in self._asyncRouteDict:
+                response_dict = await self._asyncRouteDict[cmd](args_dict, request.writer)
 
-            elif cmd == RestServer.CPU_FREQ:
-                response = self._cpu_freq(args_dict)
+        # A response of None indicates the handler has already sent its response.
+        if response_dict is not None:
+            trace.begin("rest.encode", request.track)
+            try:
+                content_type, response = self._encode_response(fmt, cmd, response_dict)
+            finally:
+                trace.end("rest.encode", request.track)
+            # Errors are not cached so that the next request tries again.
+            if cacheKey and not response_dict[RestServer.ERROR_KEY]:
+                self._responseCache.put(cacheKey, self._cacheTTLDict[cmd], (content_type, response))
+            await request.send_response(content_type, response)
+
+    def _get_cache_key(self, cmd, args_dict, fmt):
+        """@brief Get the key of the cached response to a request.
+           @param cmd The command in the request.
+           @param args_dict A dict containing the elements of the http GET request.
+           @param fmt The response format.
+           @return The key or None if the response is not cached."""
+        if not self._cacheTTLDict.get(cmd):
+            return None
+        readArgs = RestServer.CACHE_ROUTE_DICT[cmd][1]
+        for arg in args_dict:
+            if arg not in readArgs and arg not in RestServer.CACHE_IGNORED_ARGS:
+                return None
+        return (cmd, fmt) + tuple([args_dict.get(arg) for arg in readArgs])
+
+    def _invalidate_cache(self, cmd, cacheKey):
+        """@brief Remove the cached responses that a command may have changed.
+           @param cmd The command in the request.
+           @param cacheKey The key of the cached response to the request or None if not cached."""
+        if cacheKey is None and cmd in RestServer.CACHE_ROUTE_DICT:
+            self._responseCache.invalidate(cmd)
+        for cachedCmd in RestServer.CACHE_INVALIDATE_DICT.get(cmd, ()):
+            self._responseCache.invalidate(cachedCmd)
+
+    def _encode_response(self, fmt, cmd, response_dict):
+        """@brief Encode a response in the format requested by the client.
+           @param fmt The format (wire_format.FMT_JSON, FMT_CBOR or FMT_STRUCT).
+           @param cmd The command in the request or None.
+           @param response_dict The response dict returned by the command handler.
+           @return A tuple containing the content type and the encoded response."""
+        if fmt == wire_format.FMT_CBOR:
+            return (wire_format.CONTENT_TYPE_DICT[fmt], wire_format.encode_cbor(response_dict))
+
+        if fmt == wire_format.FMT_STRUCT and cmd in RestServer.STRUCT_LAYOUT_DICT:
+            value = response_dict[cmd]
+            # Error messages and responses without a value are sent as JSON.
+            if not response_dict[RestServer.ERROR_KEY] and not isinstance(value, str):
+                record_id, value_fmt = RestServer.STRUCT_LAYOUT_DICT[cmd]
+                return (wire_format.CONTENT_TYPE_DICT[fmt], wire_format.encode_struct(record_id, value_fmt, False, value))
+
+        return (wire_format.CONTENT_TYPE_DICT[wire_format.FMT_JSON], wire_format.encode_json(response_dict))
+
+    async def _serve_websocket(self, webSocket, request):
+        """@brief Push live data to a WebSocket client. The client sends JSON messages to
+                  subscribe to streams (see WS_STREAMS) at a chosen rate. Each stream is read
+                  at its rate but a value is only sent when it has changed (by at least delta
+                  if set). The values that have changed are sent together in a JSON message
+                  (E.G {"adc0": 1200, "temperature": 26.5, "t": ticks_ms}).
+                   To subscribe to ADC 0 every 100 ms, sending changes of 64 or more
+                        {"subscribe": "adc0", "period_ms": 100, "delta": 64}
+                   To subscribe to the state of GPIO 16 - 22
+                        {"subscribe": "gpios", "period_ms": 50, "mask": "0x7f0000"}
+                   To stop a stream
+                        {"unsubscribe": "adc0"}
+           @param webSocket The WebSocket instance.
+           @param request The HTTPRequest instance of the upgrade request."""
+        self._info("WebSocket connected")
+        # Each subscription is a list of [read function, period_ms, delta, due ms, last value sent].
+        subDict = {}
+        changed = asyncio.Event()
+        rxTask = asyncio.create_task(self._ws_receive(webSocket, subDict, changed))
+        try:
+            # The receive task ends when the client disconnects or a reply cannot be sent.
+            while not webSocket.closed and not rxTask.done():
+                now = time.ticks_ms()
+                update = {}
+                delay = RestServer.WS_IDLE_MS
+                for name in subDict:
+                    sub = subDict[name]
+                    wait = time.ticks_diff(sub[3], now)
+                    if wait <= 0:
+                        value = sub[0]()
+                        last = sub[4]
+                        if last is None or (sub[2] and abs(value - last) >= sub[2]) or (not sub[2] and value != last):
+                            update[name] = value
+                            sub[4] = value
+                        sub[3] = time.ticks_add(sub[3], sub[1])
+                        # If more than a period late restart the period rather than sending a burst.
+                        if time.ticks_diff(sub[3], now) <= 0:
+                            sub[3] = time.ticks_add(now, sub[1])
+                        wait = time.ticks_diff(sub[3], now)
+                    if wait < delay:
+                        delay = wait
+                if update:
+                    update["t"] = now
+                    await webSocket.send(json.dumps(update))
+                try:
+                    await asyncio.wait_for_ms(changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
 
-            elif cmd == RestServer.SETUP_UART:
-                response = self._setup_uart(args_dict)
+        except Exception as ex:
+            self._debug("WebSocket error: {}".format(ex))
 
-            elif cmd == RestServer.UART_TX:
-                response = self._uart_tx(args_dict)
+        finally:
+            rxTask.cancel()
+            self._info("WebSocket disconnected")
 
-            elif cmd == RestServer.UART_RX:
-                response = self._uart_rx(args_dict)
+    async def _ws_receive(self, webSocket, subDict, changed):
+        """@brief Receive the subscribe and unsubscribe messages from a WebSocket client.
+           @param webSocket The WebSocket instance.
+           @param subDict The dict of subscriptions.
+           @param changed An Event set when the subscriptions change or the client disconnects."""
+        try:
+            while True:
+                msg = await webSocket.recv()
+                if msg is None:
+                    return
+                try:
+                    msgDict = json.loads(msg)
+                    if "subscribe" in msgDict:
+                        name = msgDict["subscribe"]
+                        period_ms = int(msgDict.get("period_ms", RestServer.WS_DEFAULT_PERIOD_MS))
+                        if period_ms < RestServer.WS_MIN_PERIOD_MS:
+                            period_ms = RestServer.WS_MIN_PERIOD_MS
+                        if name not in subDict and len(subDict) >= RestServer.WS_MAX_SUBSCRIPTIONS:
+                            raise ValueError("Too many subscriptions.")
+                        delta = msgDict.get("delta", 0)
+                        if isinstance(delta, bool) or not isinstance(delta, (int, float)):
+                            raise ValueError("delta must be a number.")
+                        read = self._get_stream_reader(name, msgDict)
+                        subDict[name] = [read, period_ms, delta, time.ticks_ms(), None]
+                        reply = {"subscribed": name, "period_ms": period_ms}
+
+                    elif "unsubscribe" in msgDict:
+                        name = msgDict["unsubscribe"]
+                        if name in subDict:
+                            del subDict[name]
+                        reply = {"unsubscribed": name}
 
-            elif cmd == RestServer.PWM:
-                response = self._pwm(args_dict)
+                    else:
+                        raise ValueError("Unknown message.")
 
-        # Send the HTTP OK header detailing JSON text to follow.
-        self._ok_json_response(writer)
+                except Exception as ex:
+                    reply = {"error": str(ex)}
 
-        # Send the response to the request
-        writer.write(response)
-        await writer.drain()
-        await writer.wait_closed()
-        self._info("Client disconnected")
+                await webSocket.send(json.dumps(reply))
+                changed.set()
 
-    def _get_args_dict(self, http_request):
+        except Exception as ex:
+            self._debug("WebSocket receive error: {}".format(ex))
+
+        finally:
+            # Stop the push loop if the client disconnects or a reply cannot be sent
+            # (E.G the send times out).
+            webSocket.closed = True
+            changed.set()
+
+    def _get_stream_reader(self, name, msgDict):
+        """@brief Get the function that reads a WebSocket stream.
+           @param name The stream name (see WS_STREAMS).
+           @param msgDict The subscribe message.
+           @return The function."""
+        if name not in RestServer.WS_STREAMS:
+            raise ValueError("{} is an unknown stream.".format(name))
+
+        if name.startswith("adc"):
+            adc = int(name[3:])
+            # If core1 samples this channel copy out its latest sample.
+            if self._core1Worker and self._core1Worker.hasADC(adc):
+                return lambda: self._core1Worker.getADCLatest(adc)
+            return SharedADC(adc).read_u16
+
+        if name == "temperature":
+            return self._get_temperature_sensor().get_temperature
+
+        mask = int(str(msgDict.get("mask", RestServer.GPIO_MASK_VALID)), 0) & RestServer.GPIO_MASK_VALID
+        return lambda: machine.mem32[RestServer.SIO_GPIO_IN] & mask
+
+    def _get_args_dict(self, request):
         """@brief Get a dict containing the arguments detailed in the http request.
-           @param http_request The http request line.
+           @param request The HTTPRequest instance.
            @return A dict containing the arguments passed in the HTTP GET request.
                    This may include the following keys but others may be included
-                   if key=value pairs (separated by ? characters) are present in
+                   if key=value pairs (separated by ? or & characters) are present in
                    the http request.
 
                    CMD = The command in the http request. This is the first element
@@ -119,27 +475,10 @@ class RestServer(UOBase):
                    GET_REQ = The full http request string. This is only included
                    if an HTTP get request was found."""
         return_dict = {}
-        pos = http_request.find("GET ")
-        if pos >= 0:
-            return_dict[RestServer.GET_REQ]=http_request
-            sub_str = http_request[pos+4:]
-            elems = sub_str.split()
-            if len(elems) > 0:
-                args_str=elems[0]
-                args_list = args_str.split('?')
-                if len(args_list) > 0:
-                    # Add the command (first arg) to the list of args
-                    if len(args_list) > 0:
-
-                        return_dict[RestServer.CMD_KEY]=args_list[0].lower()
-                        # Add any subsequent arguments
-                        if len(args_list) > 1:
-                            for arg_str in args_list[1:]:
-                                # Must be key value pairs separated by the = character
-                                arg_elems = arg_str.split("=")
-                                if len(arg_elems) == 2:
-                                    return_dict[arg_elems[0].lower()]=arg_elems[1]
-
+        if request.method == 'GET':
+            return_dict.update(request.args)
+            return_dict[RestServer.GET_REQ]=request.request_line
+            return_dict[RestServer.CMD_KEY]=request.path.lower()
         return return_dict
 
     def _read_adc(self, args_dict):
@@ -152,7 +491,7 @@ class RestServer(UOBase):
                         http://<PICOW_ADDRESS>:8080/adc?adc=4
 
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string containing the ADC value."""
+           @return The response dict containing the ADC value."""
         response_dict = self._get_return_dict(RestServer.ADC_REQ,
                                              "{} is a malformed request to read an ADC.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -161,35 +500,67 @@ class RestServer(UOBase):
             try:
                 adc = int(adc_str)
                 if adc >= 0 and adc <= 4:
-                    _adc = machine.ADC(adc)
-                    adc_value = _adc.read_u16()
+                    adc_value = self._get_adc_value(adc)
                     self._info("Read ADC{}=0x{:04x}".format(adc, adc_value))
                     response_dict = self._get_return_dict(RestServer.ADC_REQ,
-                                             str(adc_value),
+                                             adc_value,
                                              False)
 
             except ValueError:
                 pass
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
 
-    def _read_temp(self):
+    def _get_adc_value(self, adc):
+        """@brief Read an ADC channel.
+           @param adc The ADC channel (0 - 4).
+           @return The ADC value."""
+        # If core1 samples this channel copy out its latest sample.
+        if self._core1Worker and self._core1Worker.hasADC(adc):
+            return self._core1Worker.getADCLatest(adc)
+        return SharedADC(adc).read_u16()
+
+    def _read_temp(self, args_dict):
         """@brief Read the temperature of the picow using the on board temperature sensor.
            To read the picow temperature
                 http://<PICOW_ADDRESS>:8080/temperature
-           @return the JSON response detailing the temperature."""
-        sensor_temp = machine.ADC(4)
-        conversion_factor = 3.3 / (65535)
-        reading = sensor_temp.read_u16() * conversion_factor
-        # The temperature sensor measures the Vbe voltage of a biased bipolar diode, connected to the fifth ADC channel
-        # Typically, Vbe = 0.706V at 27 degrees C, with a slope of -1.721mV (0.001721) per degree.
-        temperature = 27 - (reading - 0.706)/0.001721
-        response_dict = self._get_return_dict(RestServer.TEMPERATURE_REQ,
-                                 str(temperature),
-                                 False)
-        response = json.dumps(response_dict)
-        return response
+
+           To calibrate the temperature sensor against a reference temperature (degrees C)
+                http://<PICOW_ADDRESS>:8080/temperature?ref=21.5
+
+           To set the calibration offset (degrees C) added to each reading
+                http://<PICOW_ADDRESS>:8080/temperature?offset=-1.25
+
+           The calibration offset is saved to flash.
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the temperature."""
+        try:
+            temperatureSensor = self._get_temperature_sensor()
+            if 'ref' in args_dict:
+                temperatureSensor.calibrate(int(float(args_dict['ref']) * 1000))
+
+            elif 'offset' in args_dict:
+                temperatureSensor.set_cal_offset(int(float(args_dict['offset']) * 1000))
+
+            response_dict = self._get_return_dict(RestServer.TEMPERATURE_REQ,
+                                     temperatureSensor.get_temperature(),
+                                     False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.TEMPERATURE_REQ,
+                                                  "Temperature Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _get_temperature_sensor(self):
+        """@brief Get the TemperatureSensor instance. If one was not passed to the constructor
+                  one is created when first needed. This reads the sensor on each request.
+           @return The TemperatureSensor instance."""
+        if self._temperatureSensor is None:
+            self._temperatureSensor = TemperatureSensor(self._uo, config=self._config)
+        return self._temperatureSensor
 
     def _is_valid_pin(self, pin):
         """@brief Determine if a pin is a valid GPIO pin.
@@ -222,7 +593,7 @@ class RestServer(UOBase):
 
            @param args_dict A dict containing the elements of the http GET request.
 
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.SETUP_GPIO_REQ,
                                              "{} is a malformed request to read/write a gpio pin.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -247,6 +618,8 @@ class RestServer(UOBase):
 
                     # If setting an output
                     if dir == 'out':
+                        # Edges are only recorded on input pins
+                        self._gpioEvents.detach(pin)
                         # Set the pin state and store in the dict
                         self._gpioDict[pin]=machine.Pin(pin, machine.Pin.OUT, value=value)
                         response_dict = self._get_return_dict(RestServer.SETUP_GPIO_REQ,
@@ -269,8 +642,10 @@ class RestServer(UOBase):
                             _pin = machine.Pin(pin, machine.Pin.IN)
                         # Store pin in the dict
                         self._gpioDict[pin]=_pin
+                        # Record the edges on this pin so that clients don't have to poll it.
+                        self._gpioEvents.attach(pin, _pin)
                         response_dict = self._get_return_dict(RestServer.SETUP_GPIO_REQ,
-                                 str(_pin.value()),
+                                 _pin.value(),
                                  False)
 
                     # If we get here the pin should have previously been setup as out or in
@@ -287,7 +662,7 @@ class RestServer(UOBase):
                             # If we get here the pin should have previously been setup as in
                             else:
                                 response_dict = self._get_return_dict(RestServer.SETUP_GPIO_REQ,
-                                 str(self._gpioDict[pin].value()),
+                                 self._gpioDict[pin].value(),
                                  False)
 
             except Exception as ex:
@@ -295,19 +670,178 @@ class RestServer(UOBase):
                                                      "GPIO Error: {}".format(ex),
                                                      True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
+
+    async def _gpio_events(self, args_dict, writer):
+        """@brief Get the edges (changes of state) that have occurred on GPIO pins setup as inputs.
+                   Each edge is reported as [seq, pin, value, ticks_us] where seq is the sequence
+                   number of the edge, value is the pin state after the edge and ticks_us is
+                   the time.ticks_us() value when the edge occurred.
+
+                   To get the edges after sequence number 0, waiting up to 5 seconds for one (long-poll)
+                        http://<PICOW_ADDRESS>:8080/gpio_events?since=0?timeout=5000
+                   The next value in the response should be passed as the since argument in the
+                   following request.
+
+                   To stream edges to the client as Server-Sent Events as they occur
+                        http://<PICOW_ADDRESS>:8080/gpio_events?sse=1
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @param writer The writer object used to send data.
+           @return The response dict detailing the edges or None if the edges were streamed to the client."""
+        response_dict = self._get_return_dict(RestServer.GPIO_EVENTS,
+                                             "{} is a malformed request to read GPIO edges.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            since = None
+            if 'since' in args_dict:
+                since = int(args_dict['since'])
+
+            if args_dict.get('sse') == '1':
+                await self._stream_gpio_events(since, writer)
+                return None
+
+            timeout_ms = 0
+            if 'timeout' in args_dict:
+                timeout_ms = int(args_dict['timeout'])
+                if timeout_ms > RestServer.GPIO_EVENTS_TIMEOUT_MS:
+                    timeout_ms = RestServer.GPIO_EVENTS_TIMEOUT_MS
+
+            if since is None:
+                since = self._gpioEvents.getNextSeq()
+
+            await self._wait_idle(self._gpioEvents.waitForEvents(since, timeout_ms))
+            events, lost = self._gpioEvents.getEvents(since)
+            msg = {"next": since + lost + len(events),
+                   "lost": lost,
+                   "now": time.ticks_us(),
+                   "events": events}
+            response_dict = self._get_return_dict(RestServer.GPIO_EVENTS,
+                                                  msg,
+                                                  False)
+
+        except ValueError:
+            pass
+
+        return response_dict
+
+    async def _stream_gpio_events(self, since, writer):
+        """@brief Send GPIO edges to the client as Server-Sent Events until the client disconnects.
+           @param since The sequence number of the first edge to send or None to send new edges only.
+           @param writer The writer object used to send data."""
+        writer.write('HTTP/1.0 200 OK\r\nContent-type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n')
+        if since is None:
+            since = self._gpioEvents.getNextSeq()
+        try:
+            while True:
+                await asyncio.wait_for_ms(writer.drain(), HTTPServer.WRITE_TIMEOUT_MS)
+                if await self._wait_idle(self._gpioEvents.waitForEvents(since, RestServer.SSE_KEEPALIVE_MS)):
+                    events, lost = self._gpioEvents.getEvents(since)
+                    since = since + lost + len(events)
+                    for event in events:
+                        writer.write("id: {}\ndata: {}\n\n".format(event[0], json.dumps(event)))
+                else:
+                    # A comment line stops idle connections being dropped.
+                    writer.write(": keepalive\n\n")
+
+        except (OSError, asyncio.TimeoutError):
+            self._info("Event stream client disconnected")
+
+    def _get_gpio_mask(self, args_dict):
+        """@brief Get the GPIO pin mask from a request.
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The mask. Bit n is set to select GPIO pin n."""
+        mask = int(args_dict['mask'], 0)
+        if mask <= 0 or mask & ~RestServer.GPIO_MASK_VALID:
+            raise ValueError("0x{:08x} is an invalid GPIO mask.".format(mask))
+        return mask
+
+    def _set_gpios(self, args_dict):
+        """@brief Set the state of several GPIO output pins at the same time.
+                   The mask selects the pins (bit n = GPIO n) and the value holds their states.
+                   All the selected pins change state on the same clock cycle.
+
+                   To setup GPIO 8 - 15 as outputs and set them to 0xa5
+                        http://<PICOW_ADDRESS>:8080/set_gpios?mask=0xff00?value=0xa500?dir=out
+
+                   To set the state of pins previously setup as outputs
+                        http://<PICOW_ADDRESS>:8080/set_gpios?mask=0xff00?value=0x5a00
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing success or failure."""
+        response_dict = self._get_return_dict(RestServer.SET_GPIOS,
+                                             "{} is a malformed request to write GPIO pins.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            if 'mask' in args_dict and 'value' in args_dict:
+                mask = self._get_gpio_mask(args_dict)
+                value = int(args_dict['value'], 0)
+
+                if args_dict.get('dir') == 'out':
+                    for pin in range(0, 29):
+                        if mask & (1 << pin):
+                            self._gpioEvents.detach(pin)
+                            self._gpioDict[pin]=machine.Pin(pin, machine.Pin.OUT)
+
+                # A single write to the XOR register changes all the pins at once.
+                # IRQ's are disabled so that no other output change can occur between the read and the write.
+                state = machine.disable_irq()
+                try:
+                    out = machine.mem32[RestServer.SIO_GPIO_OUT]
+                    machine.mem32[RestServer.SIO_GPIO_OUT_XOR] = (out ^ value) & mask
+                finally:
+                    machine.enable_irq(state)
+
+                response_dict = self._get_return_dict(RestServer.SET_GPIOS,
+                                                      "",
+                                                      False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.SET_GPIOS,
+                                                  "GPIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _get_gpios(self, args_dict):
+        """@brief Read the state of several GPIO pins at the same time.
+                   The mask selects the pins (bit n = GPIO n). The returned value holds the state of the selected pins.
+
+                   To read GPIO 16 - 22
+                        http://<PICOW_ADDRESS>:8080/get_gpios?mask=0x7f0000
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the pin states."""
+        response_dict = self._get_return_dict(RestServer.GET_GPIOS,
+                                             "{} is a malformed request to read GPIO pins.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            if 'mask' in args_dict:
+                mask = self._get_gpio_mask(args_dict)
+                value = machine.mem32[RestServer.SIO_GPIO_IN] & mask
+                response_dict = self._get_return_dict(RestServer.GET_GPIOS,
+                                                      value,
+                                                      False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.GET_GPIOS,
+                                                  "GPIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
 
     def _cpu_freq(self, args_dict):
         """@brief Get/Set the CPU frequency.
                    To read the CPU frequency
                         http://<PICOW_ADDRESS>:8080/cpu_freq
 
-                    To Set the CPU frequency to 240 MHz (240 MHz is the max frequency)
+                    To Set the CPU frequency to 240 MHz (48 MHz is the min and 240 MHz is the max frequency)
                         http://<PICOW_ADDRESS>:8080/cpu_freq?freq=240000000
 
+                    Setting the CPU frequency disables the CPU frequency governor.
+
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.CPU_FREQ,
                                              "{} is a malformed request to set/get the CPU frequency.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -318,7 +852,11 @@ class RestServer(UOBase):
             if 'freq' in args_dict:
                 try:
                     freqHz = int(args_dict['freq'])
-                    if freqHz <= RestServer.MAX_CPU_FREQ_HZ:
+                    if freqHz >= RestServer.MIN_CPU_FREQ_HZ and freqHz <= RestServer.MAX_CPU_FREQ_HZ:
+                        # The governor would override a manually set freq
+                        if self._cpuGovernor and self._cpuGovernor.isEnabled():
+                            self._cpuGovernor.setEnabled(False)
+                            self._info("CPU freq governor disabled.")
                         machine.freq(freqHz)
                         response_dict = self._get_return_dict(RestServer.CPU_FREQ,
                                                               "",
@@ -326,7 +864,7 @@ class RestServer(UOBase):
 
                     else:
                         response_dict = self._get_return_dict(RestServer.CPU_FREQ,
-                                                              str(freqHz),
+                                                              freqHz,
                                                               True)
 
                 except Exception as ex:
@@ -336,7 +874,7 @@ class RestServer(UOBase):
 
             else:
                 response_dict = self._get_return_dict(RestServer.CPU_FREQ,
-                                                      str(machine.freq()),
+                                                      machine.freq(),
                                                       False)
 
         except Exception as ex:
@@ -344,8 +882,406 @@ class RestServer(UOBase):
                                                   "Set CPU freq Error: {}".format(ex),
                                                   True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
+
+    def _cpu_governor(self, args_dict):
+        """@brief Get the state of the CPU frequency governor and optionally configure it.
+                  When enabled the governor raises the CPU frequency to the ceiling while
+                  requests are being served (or PIO waveforms are active) and drops it to the
+                  floor once the unit has been idle for the hysteresis time (ms). The CPU
+                  frequency is not changed while PWM outputs, UARTs or PIO waveforms are in use.
+
+                   To read the state of the governor and the recent CPU frequency changes
+                        http://<PICOW_ADDRESS>:8080/cpu_governor
+
+                   To enable the governor to switch between 48 MHz and 240 MHz after 5 seconds idle
+                        http://<PICOW_ADDRESS>:8080/cpu_governor?enable=1?floor=48000000?ceiling=240000000?hysteresis=5000
+
+                   To disable the governor
+                        http://<PICOW_ADDRESS>:8080/cpu_governor?enable=0
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the state of the governor."""
+        response_dict = self._get_return_dict(RestServer.CPU_GOVERNOR,
+                                             "{} is a malformed request to configure the CPU freq governor.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            if self._cpuGovernor is None:
+                raise Exception("The CPU freq governor is not present.")
+
+            state = self._cpuGovernor.getState()
+            if 'floor' in args_dict or 'ceiling' in args_dict or 'hysteresis' in args_dict:
+                self._cpuGovernor.configure(int(args_dict.get('floor', state['floor'])),
+                                            int(args_dict.get('ceiling', state['ceiling'])),
+                                            int(args_dict.get('hysteresis', state['hysteresis'])))
+
+            if 'enable' in args_dict:
+                self._cpuGovernor.setEnabled(args_dict['enable'] == '1')
+
+            response_dict = self._get_return_dict(RestServer.CPU_GOVERNOR,
+                                                  self._cpuGovernor.getState(),
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.CPU_GOVERNOR,
+                                                  "CPU governor Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _scheduler_stats(self, args_dict):
+        """@brief Get the timing statistics of the scheduled (periodic and one shot) tasks.
+                        http://<PICOW_ADDRESS>:8080/scheduler
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the task statistics."""
+        if self._scheduler:
+            response_dict = self._get_return_dict(RestServer.SCHEDULER,
+                                                  self._scheduler.getStats(),
+                                                  False)
+        else:
+            response_dict = self._get_return_dict(RestServer.SCHEDULER,
+                                                  "The scheduler is not present.",
+                                                  True)
+
+        return response_dict
+
+    def _http_stats(self, args_dict):
+        """@brief Get the HTTP server connection and response cache statistics.
+                        http://<PICOW_ADDRESS>:8080/http_stats
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the connection statistics."""
+        stats = dict(self._httpServer.getStats())
+        stats["cache"] = self._responseCache.getStats()
+        response_dict = self._get_return_dict(RestServer.HTTP_STATS,
+                                              stats,
+                                              False)
+        return response_dict
+
+    def _core1(self, args_dict):
+        """@brief Get the data captured by the core1 worker.
+                   To read the core1 worker statistics
+                        http://<PICOW_ADDRESS>:8080/core1
+
+                   To read the ADC 0 samples taken since sample 1000. Each sample is [seq, value, ticks_us].
+                   next is the since value for the next request. The sequence numbers wrap to 0
+                   after 0x3fffffff.
+                        http://<PICOW_ADDRESS>:8080/core1?adc=0?since=1000
+
+                   To read the GPIO edges since edge 10. Each edge is [seq, pin, value, ticks_us].
+                        http://<PICOW_ADDRESS>:8080/core1?gpio=1?since=10
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the captured data."""
+        if not self._core1Worker:
+            return self._get_return_dict(RestServer.CORE1,
+                                         "The core1 worker is not enabled.",
+                                         True)
+        try:
+            since = int(args_dict.get('since', 0))
+            if 'adc' in args_dict:
+                adc = int(args_dict['adc'])
+                if not self._core1Worker.hasADC(adc):
+                    raise ValueError("ADC {} is not sampled by core1.".format(adc))
+                samples, lost, next_seq = self._core1Worker.getADCSamples(adc, since)
+                value = {"samples": samples, "lost": lost, "next": next_seq}
+
+            elif 'gpio' in args_dict:
+                events, lost, next_seq = self._core1Worker.getGPIOEvents(since)
+                value = {"events": events, "lost": lost, "next": next_seq}
+
+            else:
+                value = self._core1Worker.getStats()
+
+            response_dict = self._get_return_dict(RestServer.CORE1,
+                                                  value,
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.CORE1,
+                                                  "Core1 Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _config_cmd(self, args_dict):
+        """@brief Read or change the unit settings. The values of secret settings (E.G the
+                  WiFi password) are not returned. Changes are saved to flash shortly after
+                  the last change and most are used after the unit is restarted.
+                   To read all the settings
+                        http://<PICOW_ADDRESS>:8080/config
+
+                   To read the settings in a section
+                        http://<PICOW_ADDRESS>:8080/config?section=ydev
+
+                   To change a setting. If the setting is present the new value is converted to its type.
+                        http://<PICOW_ADDRESS>:8080/config?section=ydev?key=unit_name?value=LAB_UNIT_1
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the settings."""
+        if not self._config:
+            return self._get_return_dict(RestServer.CONFIG,
+                                         "The config is not present.",
+                                         True)
+        try:
+            section = args_dict.get('section')
+            if 'key' in args_dict:
+                if section is None or 'value' not in args_dict:
+                    raise ValueError("section, key and value are required to change a setting.")
+                key = args_dict['key']
+                value = args_dict['value']
+                current = self._config.get(section, key)
+                if isinstance(current, bool):
+                    value = value.lower() in ("1", "true")
+                elif isinstance(current, int):
+                    value = int(value)
+                elif isinstance(current, float):
+                    value = float(value)
+                self._config.set(section, key, value)
+                self._info("Config {}.{} changed.".format(section, key))
+
+            publicDict = self._config.getPublic()
+            if section is None:
+                value = publicDict
+            elif section in publicDict:
+                value = publicDict[section]
+            else:
+                raise ValueError("{} section not found.".format(section))
+
+            response_dict = self._get_return_dict(RestServer.CONFIG,
+                                                  value,
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.CONFIG,
+                                                  "Config Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _sequence(self, args_dict):
+        """@brief Run a sequence of timed GPIO, ADC, UART and PWM operations on the unit
+                  and return the values read. The operations are separated by , characters
+                  and their arguments by : characters (see sequence.py). Waits are in
+                  microseconds and the total wait time must be <= 1 second.
+                   To run a sequence
+                        http://<PICOW_ADDRESS>:8080/sequence?ops=out:16:1,wait:5000,tx:0:48656c6c6f,adc:1,pwm:2:1000:32768
+
+                   To store a sequence so that it can be run by name
+                        http://<PICOW_ADDRESS>:8080/sequence?name=pulse?ops=out:16:1,wait:100,out:16:0
+
+                   To run a stored sequence
+                        http://<PICOW_ADDRESS>:8080/sequence?run=pulse
+
+                   To remove a stored sequence
+                        http://<PICOW_ADDRESS>:8080/sequence?delete=pulse
+
+                   To list the stored sequences
+                        http://<PICOW_ADDRESS>:8080/sequence
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict holding the values read or the stored sequences."""
+        try:
+            if 'run' in args_dict:
+                value = self._sequenceRunner.runStored(args_dict['run'])
+
+            elif 'delete' in args_dict:
+                self._sequenceRunner.remove(args_dict['delete'])
+                value = self._sequenceRunner.getStored()
+
+            elif 'name' in args_dict:
+                if 'ops' not in args_dict:
+                    raise ValueError("ops is required to store a sequence.")
+                self._sequenceRunner.store(args_dict['name'], args_dict['ops'])
+                self._info("Stored {} sequence.".format(args_dict['name']))
+                value = self._sequenceRunner.getStored()
+
+            elif 'ops' in args_dict:
+                sequence = self._sequenceRunner.compile(args_dict['ops'])
+                value = self._sequenceRunner.run(sequence)
+
+            else:
+                value = self._sequenceRunner.getStored()
+
+            response_dict = self._get_return_dict(RestServer.SEQUENCE,
+                                                  value,
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.SEQUENCE,
+                                                  "Sequence Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _trace(self, args_dict):
+        """@brief Control the span trace (trace.py) and read the recorded spans. The spans
+                  record the time taken by each phase of the requests, the scheduled tasks,
+                  the YView/mDNS responders, the WiFi operations and the idle GC.
+                   To start recording spans in a ring of 512 events (default 256)
+                        http://<PICOW_ADDRESS>:8080/trace?enable=1?events=512
+
+                   To stop recording spans
+                        http://<PICOW_ADDRESS>:8080/trace?enable=0
+
+                   To remove the recorded spans
+                        http://<PICOW_ADDRESS>:8080/trace?clear=1
+
+                   To read the recorded spans in a compact form (see tools/trace_dump.py)
+                        http://<PICOW_ADDRESS>:8080/trace?dump=1
+
+                   To read the recorded spans in Chrome Trace Event format
+                        http://<PICOW_ADDRESS>:8080/trace?chrome=1
+
+                   To read the trace statistics
+                        http://<PICOW_ADDRESS>:8080/trace
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the trace."""
+        try:
+            if 'enable' in args_dict:
+                if args_dict['enable'] == '1':
+                    events = int(args_dict.get('events', trace.Tracer.DEFAULT_EVENTS))
+                    if events < 1 or events > RestServer.MAX_TRACE_EVENTS:
+                        raise ValueError("events must be 1 - {}.".format(RestServer.MAX_TRACE_EVENTS))
+                    trace.enable(events)
+                else:
+                    trace.disable()
+
+            tracer = trace.get_tracer()
+            if tracer is None:
+                if 'dump' in args_dict or 'chrome' in args_dict or 'clear' in args_dict:
+                    raise ValueError("The trace is not enabled.")
+                value = {"enabled": False}
+
+            elif 'clear' in args_dict:
+                tracer.clear()
+                value = tracer.getStats()
+
+            elif 'dump' in args_dict:
+                value = tracer.getDump()
+
+            elif 'chrome' in args_dict:
+                value = tracer.getChromeTrace()
+
+            else:
+                value = tracer.getStats()
+                value["enabled"] = True
+
+            response_dict = self._get_return_dict(RestServer.TRACE,
+                                                  value,
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.TRACE,
+                                                  "Trace Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _get_sequence_pin(self, pin, output):
+        """@brief Get a GPIO pin used by a sequence. Pins that have been setup are used
+                  as they are. Others are setup as an output or an input with no pull
+                  up/down resistor.
+           @param pin The GPIO pin number.
+           @param output True if the pin is an output.
+           @return The machine.Pin instance."""
+        _pin = self._gpioDict.get(pin)
+        if _pin is None:
+            if output:
+                # Edges are only recorded on input pins
+                self._gpioEvents.detach(pin)
+                _pin = machine.Pin(pin, machine.Pin.OUT)
+            else:
+                _pin = machine.Pin(pin, machine.Pin.IN)
+            self._gpioDict[pin]=_pin
+        return _pin
+
+    def _get_sequence_pwm(self, pin):
+        """@brief Get a PWM output used by a sequence. The pin is setup as a PWM output if not already.
+           @param pin The GPIO pin number.
+           @return The machine.PWM instance."""
+        pwm = self._pwmDict.get(pin)
+        if pwm is None:
+            pwm = machine.PWM( machine.Pin(pin) )
+            self._pwmDict[pin]=pwm
+        return pwm
+
+    def _mem(self, args_dict):
+        """@brief Get the heap and GC statistics.
+                   To read the statistics
+                        http://<PICOW_ADDRESS>:8080/mem
+
+                   To also find the largest free block and the heap fragmentation (this runs a collection)
+                        http://<PICOW_ADDRESS>:8080/mem?frag=1
+
+                   To run a collection
+                        http://<PICOW_ADDRESS>:8080/mem?collect=1
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the heap and GC statistics."""
+        if not self._memoryManager:
+            return self._get_return_dict(RestServer.MEM,
+                                         "The memory manager is not present.",
+                                         True)
+        try:
+            if args_dict.get('collect') == '1':
+                self._memoryManager.collect()
+            response_dict = self._get_return_dict(RestServer.MEM,
+                                                  self._memoryManager.getStats(fragmentation=args_dict.get('frag') == '1'),
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.MEM,
+                                                  "Memory Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _samples(self, args_dict):
+        """@brief Get the sample history held in flash. Each row holds the time, the
+                  number of samples and the min, max and average of each channel.
+                   To read the last day (the default) at the default resolution
+                        http://<PICOW_ADDRESS>:8080/samples
+
+                   To read the last hour at a 5 minute resolution
+                        http://<PICOW_ADDRESS>:8080/samples?last=3600?res=300
+
+                   To read a time range (time.time() seconds on the pico W)
+                        http://<PICOW_ADDRESS>:8080/samples?start=1700000000?end=1700086400
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the samples."""
+        if not self._sampleStore:
+            return self._get_return_dict(RestServer.SAMPLES,
+                                         "The sample store is not enabled.",
+                                         True)
+        try:
+            end = int(args_dict.get('end', time.time()))
+            start = end - int(args_dict.get('last', RestServer.DEFAULT_SAMPLES_S))
+            start = int(args_dict.get('start', start))
+            resolution = None
+            if 'res' in args_dict:
+                resolution = int(args_dict['res'])
+            if start >= end:
+                raise ValueError("start must be before end.")
+            resolution = self._sampleStore.getResolution(start, end, resolution)
+            response_dict = self._get_return_dict(RestServer.SAMPLES,
+                                                  {"start": start,
+                                                   "end": end,
+                                                   "resolution": resolution,
+                                                   "fields": self._sampleStore.getFields(),
+                                                   "rows": self._sampleStore.query(start, end, resolution),
+                                                   "store": self._sampleStore.getStats()},
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.SAMPLES,
+                                                  "Samples Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
 
     def _setup_uart(self, args_dict):
         """@brief Setup a UART.
@@ -353,7 +1289,7 @@ class RestServer(UOBase):
                         http://<PICOW_ADDRESS>:8080/setup_uart?uart=0?tx_pin=0?rx_pin=1?baud=115200
 
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.SETUP_UART ,
                                              "{} is a malformed request to setup a UART.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -376,6 +1312,9 @@ class RestServer(UOBase):
                                                         tx=machine.Pin(tx_pin),
                                                         rx=machine.Pin(rx_pin))
                             self._uartDict[uart]=uartInstance
+                            # Core1 reads the received data so that the UART RX FIFO does not overflow.
+                            if self._core1Worker:
+                                self._core1Worker.addUART(uart, uartInstance)
                             response_dict = self._get_return_dict(RestServer.SETUP_UART,
                                                                   "",
                                                                   False)
@@ -385,8 +1324,7 @@ class RestServer(UOBase):
                                                  "UART setup Error: {}".format(ex),
                                                  True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
 
     def _uart_tx(self, args_dict):
         """@brief TX data on a UART.
@@ -395,7 +1333,7 @@ class RestServer(UOBase):
 
                   self._setup_uart() must be called prior to calling this method.
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.UART_TX,
                                              "{} is a malformed request to TX UART data.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -422,8 +1360,7 @@ class RestServer(UOBase):
                                                   "UART setup Error: {}".format(ex),
                                                   True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
 
     def _uart_rx(self, args_dict):
         """@brief Read data from a UART.
@@ -432,7 +1369,7 @@ class RestServer(UOBase):
 
                   self._setup_uart() must be called prior to calling this method.
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.UART_RX,
                                              "{} is a malformed request to RX UART data.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -441,8 +1378,7 @@ class RestServer(UOBase):
             if 'uart' in args_dict:
                 uart = int(args_dict['uart'])
                 if uart in self._uartDict:
-                    uartInstance = self._uartDict[uart]
-                    rx_data = uartInstance.read()
+                    rx_data = self._get_uart_rx_data(uart)
                     response_dict = self._get_return_dict(RestServer.UART_RX,
                                                           rx_data,
                                                           False)
@@ -455,8 +1391,23 @@ class RestServer(UOBase):
                                                   "UART setup Error: {}".format(ex),
                                                   True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
+
+    def _get_uart(self, uart):
+        """@brief Get a UART that has been setup.
+           @param uart The UART number.
+           @return The machine.UART instance."""
+        if uart not in self._uartDict:
+            raise Exception("Uart {} has not been setup.".format(uart))
+        return self._uartDict[uart]
+
+    def _get_uart_rx_data(self, uart):
+        """@brief Read the data received on a UART that has been setup.
+           @param uart The UART number.
+           @return The data received or None if no data is available."""
+        if self._core1Worker and self._core1Worker.hasUART(uart):
+            return self._core1Worker.uartRead(uart)
+        return self._uartDict[uart].read()
 
     def _is_valid_pwm_hz(self, freq):
         """@brief Determine a valid pwm freq.
@@ -489,7 +1440,7 @@ class RestServer(UOBase):
                         http://<PICOW_ADDRESS>:8080/pwm?pin=16?freq=1000?duty_cycle=32767
 
            @param args_dict A dict containing the elements of the http GET request.
-           @return The JSON string detailing success or failure."""
+           @return The response dict detailing success or failure."""
         response_dict = self._get_return_dict(RestServer.PWM,
                                              "{} is a malformed request to set a PWM output.".format(args_dict[RestServer.GET_REQ]),
                                              True)
@@ -530,8 +1481,191 @@ class RestServer(UOBase):
                                                   "PWM setup Error: {}".format(ex),
                                                   True)
 
-        response = json.dumps(response_dict)
-        return response
+        return response_dict
+
+    def _get_pio_waveform(self):
+        """@brief Get the PIOWaveform instance. This is created when first needed
+                  as it claims PIO state machines and DMA channels.
+           @return The PIOWaveform instance."""
+        if self._pioWaveform is None:
+            # Imported when first used to save RAM if PIO waveforms are not used.
+            from pio_waveform import PIOWaveform
+            self._pioWaveform = PIOWaveform()
+        return self._pioWaveform
+
+    def _get_pio_pin(self, args_dict, width=1):
+        """@brief Get the first pin of a PIO waveform from a request.
+           @param args_dict A dict containing the elements of the http GET request.
+           @param width The number of consecutive pins used.
+           @return The GPIO pin number."""
+        pin = int(args_dict['pin'])
+        for p in range(pin, pin + width):
+            if not self._is_valid_pin(p) or not (RestServer.GPIO_MASK_VALID >> p) & 1:
+                raise ValueError("GPIO {} cannot be used.".format(p))
+        return pin
+
+    def _pio_out(self, args_dict):
+        """@brief Play a waveform on GPIO pins using a PIO state machine fed by DMA.
+                   The timing of the waveform is set by the state machine clock (freq, 2 kHz - CPU freq).
+
+                   To play the bit pattern 0x55aa55aa (LSB first) on pin 16 at 1 MHz
+                        http://<PICOW_ADDRESS>:8080/pio_out?mode=pattern?pin=16?freq=1000000?data=aa55aa55
+
+                   To play a bit pattern on pins 16 - 19 (width = 1, 2, 4 or 8 pins), 4 bits per cycle
+                        http://<PICOW_ADDRESS>:8080/pio_out?mode=pattern?pin=16?width=4?freq=1000000?data=0123456789abcdef
+
+                   To play pulses of level:cycles on pin 16 with a 1 MHz clock (pulses must be at least 4 cycles)
+                        http://<PICOW_ADDRESS>:8080/pio_out?mode=pulses?pin=16?freq=1000000?pulses=1:10,0:250,1:10,0:4
+
+                   The waveform is sent in the request line which is limited to
+                   HTTPServer.MAX_REQUEST_LINE_BYTES (4096 bytes) so a pattern may be up to
+                   about 2000 bytes and a pulse sequence holds as many pulses as fit.
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing success or failure."""
+        response_dict = self._get_return_dict(RestServer.PIO_OUT,
+                                             "{} is a malformed request to play a PIO waveform.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            pioWaveform = self._get_pio_waveform()
+            mode = args_dict.get('mode')
+            if 'pin' in args_dict and 'freq' in args_dict:
+                freq = int(args_dict['freq'])
+                if mode == pioWaveform.MODE_PATTERN and 'data' in args_dict:
+                    width = int(args_dict.get('width', '1'))
+                    pin = self._get_pio_pin(args_dict, width)
+                    data = binascii.unhexlify(args_dict['data'])
+                    pioWaveform.play_pattern(pin, width, freq, data)
+                    response_dict = self._get_return_dict(RestServer.PIO_OUT,
+                                                          "",
+                                                          False)
+
+                elif mode == pioWaveform.MODE_PULSES and 'pulses' in args_dict:
+                    pin = self._get_pio_pin(args_dict)
+                    pulses = []
+                    for pulse in args_dict['pulses'].split(','):
+                        level, cycles = pulse.split(':')
+                        pulses.append((int(level), int(cycles)))
+                    pioWaveform.play_pulses(pin, freq, pulses)
+                    response_dict = self._get_return_dict(RestServer.PIO_OUT,
+                                                          "",
+                                                          False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.PIO_OUT,
+                                                  "PIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _pio_in(self, args_dict):
+        """@brief Capture a waveform on GPIO pins using a PIO state machine feeding DMA.
+                   The captured waveform is read using the pio_data command.
+
+                   To capture 1024 samples of pin 18 at 1 MHz
+                        http://<PICOW_ADDRESS>:8080/pio_in?mode=samples?pin=18?freq=1000000?count=1024
+
+                   To capture 256 samples of pins 18 - 21 (width = 1, 2, 4 or 8 pins) once pin 18 goes high (trigger=0 or 1)
+                        http://<PICOW_ADDRESS>:8080/pio_in?mode=samples?pin=18?width=4?freq=1000000?count=256?trigger=1
+
+                   To capture the time of up to 64 edges on pin 18 with a 10 MHz clock
+                        http://<PICOW_ADDRESS>:8080/pio_in?mode=edges?pin=18?freq=10000000?count=64
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing success or failure."""
+        response_dict = self._get_return_dict(RestServer.PIO_IN,
+                                             "{} is a malformed request to capture a PIO waveform.".format(args_dict[RestServer.GET_REQ]),
+                                             True)
+        try:
+            pioWaveform = self._get_pio_waveform()
+            mode = args_dict.get('mode')
+            if 'pin' in args_dict and 'freq' in args_dict and 'count' in args_dict:
+                freq = int(args_dict['freq'])
+                count = int(args_dict['count'])
+                if mode == pioWaveform.MODE_SAMPLES:
+                    width = int(args_dict.get('width', '1'))
+                    pin = self._get_pio_pin(args_dict, width)
+                    trigger = None
+                    if 'trigger' in args_dict:
+                        trigger = int(args_dict['trigger']) & 1
+                    pioWaveform.capture_samples(pin, width, freq, count, trigger)
+                    response_dict = self._get_return_dict(RestServer.PIO_IN,
+                                                          "",
+                                                          False)
+
+                elif mode == pioWaveform.MODE_EDGES:
+                    pin = self._get_pio_pin(args_dict)
+                    pioWaveform.capture_edges(pin, freq, count)
+                    response_dict = self._get_return_dict(RestServer.PIO_IN,
+                                                          "",
+                                                          False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.PIO_IN,
+                                                  "PIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _pio_status(self, args_dict):
+        """@brief Get the state of the PIO waveforms being played and captured.
+                        http://<PICOW_ADDRESS>:8080/pio_status
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing the state."""
+        try:
+            response_dict = self._get_return_dict(RestServer.PIO_STATUS,
+                                                  self._get_pio_waveform().get_status(),
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.PIO_STATUS,
+                                                  "PIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _pio_data(self, args_dict):
+        """@brief Get a captured PIO waveform. For samples the data is hex encoded
+                  32 bit little endian words each holding 32/width samples, first
+                  sample in the LSB's. For edges a list of edge times (in cycles)
+                  is returned. Edges alternate rising then falling.
+                        http://<PICOW_ADDRESS>:8080/pio_data
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict containing the captured waveform."""
+        try:
+            response_dict = self._get_return_dict(RestServer.PIO_DATA,
+                                                  self._get_pio_waveform().get_capture(),
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.PIO_DATA,
+                                                  "PIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
+
+    def _pio_stop(self, args_dict):
+        """@brief Stop playing and capturing PIO waveforms.
+                        http://<PICOW_ADDRESS>:8080/pio_stop
+
+           @param args_dict A dict containing the elements of the http GET request.
+           @return The response dict detailing success or failure."""
+        try:
+            pioWaveform = self._get_pio_waveform()
+            pioWaveform.stop_output()
+            pioWaveform.stop_capture()
+            response_dict = self._get_return_dict(RestServer.PIO_STOP,
+                                                  "",
+                                                  False)
+
+        except Exception as ex:
+            response_dict = self._get_return_dict(RestServer.PIO_STOP,
+                                                  "PIO Error: {}".format(ex),
+                                                  True)
+
+        return response_dict
 
 
 def unquote(string):
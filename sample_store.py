@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import struct
+
+from uo import UOBase
+
+class SampleStore(UOBase):
+    """@brief Responsible for keeping a history of sampled values (E.G ADC and
+              temperature readings) in flash so that it survives connectivity gaps
+              and restarts.
+
+              update() is called periodically (by the scheduler) to sample each
+              channel. The samples are rolled up in RAM into min/max/avg buckets of
+              BUCKET_SECONDS and one fixed size binary record is appended to the
+              store for each bucket. This keeps the number of flash writes low.
+
+              The records are held in preallocated segment files that are used as
+              a ring. Once the last segment is full the oldest segment is
+              overwritten. Each record holds a sequence number so that the next
+              record position is found at startup without an index file.
+
+              query() returns the buckets in a time range at a chosen resolution."""
+
+    STORE_DIR           = "/samples"                # The folder holding the segment files.
+    META_FILE           = "meta.json"               # The file holding the store layout.
+    SEGMENT_FILE        = "seg{}.bin"               # The segment file names.
+    DEFAULT_SEGMENTS    = 8                         # The default number of segment files.
+    DEFAULT_RECORDS     = 360                       # The default number of records in each segment (6 hours of 1 minute buckets).
+    DEFAULT_BUCKET_S    = 60                        # The default period (seconds) of each record.
+    SAMPLE_PERIOD_MS    = 1000                      # The period at which update() should be called.
+    MAX_QUERY_BUCKETS   = 500                       # The max number of buckets returned by query() (limits the response size).
+    READ_CHUNK_RECORDS  = 16                        # The number of records read from flash at a time.
+    FILL_CHUNK_SIZE     = 512                       # The number of bytes written at a time when creating a segment file.
+    # Each record holds the sequence number, the bucket start time (time.time()) and the
+    # number of samples followed by the min, max and avg of each channel.
+    RECORD_HEADER_FMT   = "<IIH"
+    RECORD_CHANNEL_FMT  = "iii"
+    FIELDS_PER_CHANNEL  = ("min", "max", "avg")
+
+    def __init__(self,
+                 uo=None,
+                 segments=DEFAULT_SEGMENTS,
+                 records=DEFAULT_RECORDS,
+                 bucket_s=DEFAULT_BUCKET_S,
+                 store_dir=STORE_DIR):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param segments The number of segment files.
+           @param records The number of records in each segment file.
+           @param bucket_s The period (seconds) of each record.
+           @param store_dir The folder holding the segment files."""
+        super().__init__(uo=uo)
+        self._segments = segments
+        self._records = records
+        self._bucketS = bucket_s
+        self._storeDir = store_dir
+        self._channelNames = []
+        self._channelFuncs = []
+        self._recordFmt = None
+        self._recordSize = 0
+        self._segment = 0
+        self._index = 0
+        self._seq = 1
+        self._recordsWritten = 0
+        self._writeErrors = 0
+        self._bucketStart = None
+        self._bucket = None
+
+    def addChannel(self, name, func):
+        """@brief Add a sampled channel. All channels must be added before open() is called.
+           @param name The name of the channel (E.G adc0).
+           @param func A function that returns the value (int) of the channel."""
+        if self._recordFmt:
+            raise Exception("Channels must be added before the sample store is opened.")
+        self._channelNames.append(name)
+        self._channelFuncs.append(func)
+
+    def open(self):
+        """@brief Open the store. The segment files are created if they do not exist
+                  or the layout has changed (the history is lost). The position of
+                  the next record is then found."""
+        self._recordFmt = SampleStore.RECORD_HEADER_FMT + SampleStore.RECORD_CHANNEL_FMT * len(self._channelNames)
+        self._recordSize = struct.calcsize(self._recordFmt)
+        meta = {"channels": self._channelNames,
+                "segments": self._segments,
+                "records": self._records,
+                "bucket_s": self._bucketS}
+        if self._read_meta() != meta:
+            self._format(meta)
+        self._find_head()
+        self._info("Sample store: {} records of {} bytes, next = segment {} record {}".format(self._segments*self._records,
+                                                                                             self._recordSize,
+                                                                                             self._segment,
+                                                                                             self._index))
+
+    def _get_path(self, name):
+        """@brief Get the path of a file in the store folder.
+           @param name The file name.
+           @return The path."""
+        return "{}/{}".format(self._storeDir, name)
+
+    def _read_meta(self):
+        """@brief Read the store layout.
+           @return The layout dict or None if not present."""
+        try:
+            with open(self._get_path(SampleStore.META_FILE), "r") as read_file:
+                return json.load(read_file)
+        except:
+            return None
+
+    def _format(self, meta):
+        """@brief Create the segment files full size so that flash space is reserved.
+           @param meta The store layout dict."""
+        self._info("Creating sample store in {}".format(self._storeDir))
+        try:
+            os.mkdir(self._storeDir)
+        except OSError:
+            pass
+        fill = bytes(SampleStore.FILL_CHUNK_SIZE)
+        segmentSize = self._records * self._recordSize
+        for segment in range(self._segments):
+            with open(self._get_path(SampleStore.SEGMENT_FILE.format(segment)), "wb") as write_file:
+                remaining = segmentSize
+                while remaining > 0:
+                    write_file.write(fill[:min(remaining, len(fill))])
+                    remaining -= SampleStore.FILL_CHUNK_SIZE
+        # The layout is written last so that an interrupted format is repeated.
+        with open(self._get_path(SampleStore.META_FILE), "w") as write_file:
+            write_file.write(json.dumps(meta))
+
+    def _read_records(self, segment):
+        """@brief A generator that reads the records in a segment file.
+           @param segment The segment number.
+           @return Each record (a tuple of the unpacked values) in the segment."""
+        buf = bytearray(SampleStore.READ_CHUNK_RECORDS * self._recordSize)
+        with open(self._get_path(SampleStore.SEGMENT_FILE.format(segment)), "rb") as read_file:
+            while True:
+                rxCount = read_file.readinto(buf)
+                if not rxCount:
+                    break
+                for offset in range(0, rxCount - self._recordSize + 1, self._recordSize):
+                    yield struct.unpack_from(self._recordFmt, buf, offset)
+
+    def _read_seq(self, segment, index):
+        """@brief Read the sequence number of a record.
+           @param segment The segment number.
+           @param index The record number in the segment.
+           @return The sequence number (0 if the record has not been written)."""
+        with open(self._get_path(SampleStore.SEGMENT_FILE.format(segment)), "rb") as read_file:
+            read_file.seek(index * self._recordSize)
+            return struct.unpack("<I", read_file.read(4))[0]
+
+    def _find_head(self):
+        """@brief Find the position of the next record. This follows the last record
+                  written (the highest sequence number)."""
+        lastSeq = 0
+        lastSegment = 0
+        for segment in range(self._segments):
+            seq = self._read_seq(segment, 0)
+            if seq > lastSeq:
+                lastSeq = seq
+                lastSegment = segment
+        if lastSeq == 0:
+            self._segment = 0
+            self._index = 0
+            self._seq = 1
+            return
+
+        # The records in a segment have consecutive sequence numbers up to the last record written.
+        # All the records are read (rather than stopping at the first gap) so that
+        # the segment file is closed.
+        index = 0
+        found = True
+        for record in self._read_records(lastSegment):
+            if found and record[0] == lastSeq + index:
+                index += 1
+            else:
+                found = False
+        self._seq = lastSeq + index
+        self._segment = lastSegment
+        self._index = index
+        if self._index >= self._records:
+            self._segment = (self._segment + 1) % self._segments
+            self._index = 0
+
+    def _write_record(self, bucket_start, bucket):
+        """@brief Append a record to the store.
+           @param bucket_start The bucket start time.
+           @param bucket The bucket list [count, min, max, sum, min, max, sum, ...]."""
+        count = bucket[0]
+        values = []
+        for channel in range(len(self._channelNames)):
+            pos = 1 + channel * 3
+            values.append(bucket[pos])
+            values.append(bucket[pos + 1])
+            values.append(bucket[pos + 2] // count)
+        data = struct.pack(self._recordFmt, self._seq, bucket_start, count, *values)
+        try:
+            with open(self._get_path(SampleStore.SEGMENT_FILE.format(self._segment)), "r+b") as write_file:
+                write_file.seek(self._index * self._recordSize)
+                write_file.write(data)
+            self._recordsWritten += 1
+        except OSError as ex:
+            self._writeErrors += 1
+            self._debug("Sample store write error: {}".format(ex))
+        self._seq += 1
+        self._index += 1
+        if self._index >= self._records:
+            self._segment = (self._segment + 1) % self._segments
+            self._index = 0
+
+    def update(self):
+        """@brief Sample each channel. The store must be open. When a bucket period
+                  ends a record is written to the store."""
+        now = time.time()
+        bucketStart = now - now % self._bucketS
+        if self._bucket and bucketStart != self._bucketStart:
+            self._write_record(self._bucketStart, self._bucket)
+            self._bucket = None
+        if self._bucket is None:
+            self._bucketStart = bucketStart
+            self._bucket = [0] + [None, None, 0] * len(self._channelNames)
+
+        bucket = self._bucket
+        bucket[0] += 1
+        pos = 1
+        for func in self._channelFuncs:
+            value = func()
+            if bucket[pos] is None or value < bucket[pos]:
+                bucket[pos] = value
+            if bucket[pos + 1] is None or value > bucket[pos + 1]:
+                bucket[pos + 1] = value
+            bucket[pos + 2] += value
+            pos += 3
+
+    def getFields(self):
+        """@brief Get the name of each value in the rows returned by query().
+           @return A list of the field names."""
+        fields = ["time", "count"]
+        for name in self._channelNames:
+            for field in SampleStore.FIELDS_PER_CHANNEL:
+                fields.append("{}_{}".format(name, field))
+        return fields
+
+    def getStats(self):
+        """@brief Get the sample store statistics.
+           @return A dict holding the statistics."""
+        return {"records_written": self._recordsWritten,
+                "write_errors": self._writeErrors,
+                "segment": self._segment,
+                "index": self._index,
+                "capacity_s": self._segments * self._records * self._bucketS}
+
+    def getResolution(self, start, end, resolution=None):
+        """@brief Get the resolution used for a query.
+           @param start The start time of the query.
+           @param end The end time of the query.
+           @param resolution The requested resolution (seconds) or None.
+           @return The resolution (seconds). This is a multiple of the bucket period
+                   and is raised if required so that MAX_QUERY_BUCKETS are not exceeded."""
+        minRes = (end - start + SampleStore.MAX_QUERY_BUCKETS - 1) // SampleStore.MAX_QUERY_BUCKETS
+        if resolution is None or resolution < minRes:
+            resolution = minRes
+        if resolution < self._bucketS:
+            resolution = self._bucketS
+        return (resolution + self._bucketS - 1) // self._bucketS * self._bucketS
+
+    def query(self, start, end, resolution):
+        """@brief Get the samples in a time range.
+           @param start The start time (time.time() seconds).
+           @param end The end time (time.time() seconds).
+           @param resolution The period of each returned row (see getResolution()).
+           @return A list of rows in time order. Each row holds the values listed by getFields()."""
+        channels = len(self._channelNames)
+        rowDict = {}
+
+        def add(bucket_start, count, values):
+            """@brief Add a record (or the current bucket) to the rows."""
+            if bucket_start < start or bucket_start >= end or count == 0:
+                return
+            rowStart = bucket_start - (bucket_start - start) % resolution
+            row = rowDict.get(rowStart)
+            if row is None:
+                row = [rowStart, 0] + [None, None, 0] * channels
+                rowDict[rowStart] = row
+            row[1] += count
+            pos = 2
+            for channel in range(channels):
+                _min, _max, _avg = values[channel*3:channel*3+3]
+                if row[pos] is None or _min < row[pos]:
+                    row[pos] = _min
+                if row[pos + 1] is None or _max > row[pos + 1]:
+                    row[pos + 1] = _max
+                # The sum is held until all records have been added.
+                row[pos + 2] += _avg * count
+                pos += 3
+
+        headerSize = len(SampleStore.RECORD_HEADER_FMT) - 1
+        for segment in range(self._segments):
+            for record in self._read_records(segment):
+                if record[0]:
+                    add(record[1], record[2], record[headerSize:])
+
+        # Include the bucket not yet written to flash.
+        if self._bucket:
+            values = []
+            count = self._bucket[0]
+            for channel in range(channels):
+                pos = 1 + channel * 3
+                values += [self._bucket[pos], self._bucket[pos + 1], self._bucket[pos + 2] // count]
+            add(self._bucketStart, count, values)
+
+        rows = []
+        for rowStart in sorted(rowDict):
+            row = rowDict[rowStart]
+            for channel in range(channels):
+                pos = 4 + channel * 3
+                row[pos] //= row[1]
+            rows.append(row)
+        return rows
@@ -0,0 +1,205 @@
+import time
+import uasyncio as asyncio
+
+from uo import UOBase
+import trace
+
+class ScheduledTask(object):
+    """@brief Holds a task run by the Scheduler along with its timing statistics."""
+
+    def __init__(self, name, func, period_ms, deadline_ms, one_shot, active):
+        """@brief Constructor
+           @param name The name of the task.
+           @param func The function to run. This may be a normal or an async function.
+                       If it returns False a periodic task is deactivated.
+           @param period_ms The period of the task (periodic tasks) or the delay before it is run (one shot tasks).
+           @param deadline_ms The time after the task is due by which it must have completed.
+           @param one_shot If True the task is removed after it has run.
+           @param active If False the task is not run until activate() is called."""
+        self.name = name
+        self.func = func
+        self.period_ms = period_ms
+        self.deadline_ms = deadline_ms
+        self.one_shot = one_shot
+        self.active = active
+        self.activate_req = False
+        self.due_ms = time.ticks_add(time.ticks_ms(), period_ms)
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.max_late_ms = 0
+        self.last_run_us = 0
+        self.max_run_us = 0
+        self.total_run_us = 0
+
+    def getStats(self):
+        """@brief Get the timing statistics of the task.
+           @return A dict holding the statistics."""
+        avg_run_us = 0
+        if self.runs > 0:
+            avg_run_us = self.total_run_us // self.runs
+        return {"period_ms": self.period_ms,
+                "deadline_ms": self.deadline_ms,
+                "one_shot": self.one_shot,
+                "active": self.active,
+                "runs": self.runs,
+                "overruns": self.overruns,
+                "skipped": self.skipped,
+                "max_late_ms": self.max_late_ms,
+                "last_run_us": self.last_run_us,
+                "max_run_us": self.max_run_us,
+                "avg_run_us": avg_run_us}
+
+class Scheduler(UOBase):
+    """@brief Responsible for running periodic and one shot tasks from a single
+              uasyncio task. The scheduler sleeps until the next task is due or
+              until it is woken (E.G from an IRQ handler) so that there are no
+              unnecessary wakeups."""
+
+    def __init__(self, uo=None):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user."""
+        super().__init__(uo=uo)
+        self._taskDict = {}
+        self._flag = asyncio.ThreadSafeFlag()
+        self._event = asyncio.Event()
+        self._wakeups = 0
+
+    def addPeriodic(self, name, func, period_ms, deadline_ms=None, active=True):
+        """@brief Add a task that runs periodically.
+           @param name The name of the task.
+           @param func The function to run. If this returns False the task is deactivated.
+           @param period_ms The period of the task in milliseconds.
+           @param deadline_ms The time after the task is due by which it must have completed.
+                              If None this is the period.
+           @param active If False the task is not run until activate() is called."""
+        if deadline_ms is None:
+            deadline_ms = period_ms
+        self._taskDict[name] = ScheduledTask(name, func, period_ms, deadline_ms, False, active)
+        self._event.set()
+
+    def addOneShot(self, name, func, delay_ms, deadline_ms=None):
+        """@brief Add a task that runs once.
+           @param name The name of the task.
+           @param func The function to run.
+           @param delay_ms The delay in milliseconds before the task is run.
+           @param deadline_ms The time after the task is due by which it must have completed.
+                              If None the task has no deadline."""
+        self._taskDict[name] = ScheduledTask(name, func, delay_ms, deadline_ms, True, True)
+        self._event.set()
+
+    def remove(self, name):
+        """@brief Remove a task.
+           @param name The name of the task."""
+        if name in self._taskDict:
+            del self._taskDict[name]
+
+    def activate(self, name):
+        """@brief Activate a task so that it runs immediately and then periodically.
+                  This may be called from an IRQ handler.
+           @param name The name of the task."""
+        self._taskDict[name].activate_req = True
+        self._flag.set()
+
+    def getStats(self):
+        """@brief Get the timing statistics of all tasks.
+           @return A dict containing the number of scheduler wakeups and a dict
+                   of the task statistics keyed by task name."""
+        taskStatsDict = {}
+        for name in self._taskDict:
+            taskStatsDict[name] = self._taskDict[name].getStats()
+        return {"wakeups": self._wakeups,
+                "tasks": taskStatsDict}
+
+    def start(self):
+        """@brief Start the scheduler running in the background."""
+        asyncio.create_task(self.run())
+
+    async def _relay(self):
+        """@brief Pass wakeups from IRQ handlers (via the ThreadSafeFlag) to the scheduler."""
+        while True:
+            await self._flag.wait()
+            self._event.set()
+
+    def _get_delay_ms(self, now):
+        """@brief Get the time until the next task is due.
+           @param now The current ticks_ms() value.
+           @return The delay in milliseconds or None if no tasks are active."""
+        delay = None
+        for task in self._taskDict.values():
+            if task.active or task.activate_req:
+                if task.activate_req:
+                    task_delay = 0
+                else:
+                    task_delay = time.ticks_diff(task.due_ms, now)
+                if delay is None or task_delay < delay:
+                    delay = task_delay
+        if delay is not None and delay < 0:
+            delay = 0
+        return delay
+
+    async def _run_task(self, task, now):
+        """@brief Run a task and update its statistics.
+           @param task The ScheduledTask instance.
+           @param now The ticks_ms() value when the task was found to be due."""
+        late = time.ticks_diff(now, task.due_ms)
+        if late > task.max_late_ms:
+            task.max_late_ms = late
+        start_us = time.ticks_us()
+        result = None
+        trace.begin(task.name)
+        try:
+            result = task.func()
+            # Async functions return a generator that must be awaited.
+            if result is not None and hasattr(result, 'send'):
+                result = await result
+        except Exception as ex:
+            self._info("Scheduled task {} error: {}".format(task.name, ex))
+        trace.end(task.name)
+        run_us = time.ticks_diff(time.ticks_us(), start_us)
+        task.runs += 1
+        task.last_run_us = run_us
+        task.total_run_us += run_us
+        if run_us > task.max_run_us:
+            task.max_run_us = run_us
+        end = time.ticks_ms()
+        if task.deadline_ms is not None and time.ticks_diff(end, task.due_ms) > task.deadline_ms:
+            task.overruns += 1
+
+        if task.one_shot:
+            self.remove(task.name)
+        elif result is False:
+            task.active = False
+        else:
+            task.due_ms = time.ticks_add(task.due_ms, task.period_ms)
+            # If we have fallen more than a period behind skip the missed runs.
+            if time.ticks_diff(end, task.due_ms) > 0:
+                task.skipped += 1
+                task.due_ms = time.ticks_add(end, task.period_ms)
+
+    async def run(self):
+        """@brief Run the tasks as they become due. This never returns."""
+        asyncio.create_task(self._relay())
+        while True:
+            now = time.ticks_ms()
+            delay = self._get_delay_ms(now)
+            if delay is None or delay > 0:
+                self._event.clear()
+                try:
+                    if delay is None:
+                        await self._event.wait()
+                    else:
+                        await asyncio.wait_for_ms(self._event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeups += 1
+                now = time.ticks_ms()
+
+            for task in list(self._taskDict.values()):
+                if task.activate_req:
+                    task.activate_req = False
+                    task.active = True
+                    task.due_ms = now
+                if task.active and time.ticks_diff(now, task.due_ms) >= 0:
+                    await self._run_task(task, now)
@@ -0,0 +1,278 @@
+import time
+import binascii
+
+from uo import UOBase
+
+class Sequence(object):
+    """@brief A sequence of timed peripheral operations compiled from a program.
+              A program is a list of operations separated by , characters. The
+              arguments of each operation are separated by : characters.
+
+              out:<pin>:<value>             Set an output pin (0 or 1).
+              in:<pin>                      Read an input pin.
+              wait:<us>                     Wait for a number of microseconds.
+              adc:<adc>                     Read an ADC channel (0 - 4).
+              tx:<uart>:<hex data>          Send bytes (as hex digits) on a UART.
+              rx:<uart>                     Read the bytes received on a UART.
+              pwm:<pin>:<freq>:<duty>       Set a PWM output. If freq is 0 only the duty cycle is set.
+
+              E.G out:16:1,wait:5000,tx:0:48656c6c6f,adc:1,pwm:2:1000:32768"""
+
+    OP_OUT              = 0
+    OP_IN               = 1
+    OP_WAIT             = 2
+    OP_ADC              = 3
+    OP_TX               = 4
+    OP_RX               = 5
+    OP_PWM              = 6
+    # The name and number of arguments of each operation (indexed by opcode).
+    OP_NAMES            = ("out", "in", "wait", "adc", "tx", "rx", "pwm")
+    OP_ARG_COUNTS       = (2, 1, 1, 1, 2, 1, 3)
+    OP_SEPARATOR        = ','
+    ARG_SEPARATOR       = ':'
+    MAX_OPS             = 64            # The max number of operations in a sequence.
+    MAX_WAIT_US         = 1000000       # The max total wait time. Nothing else runs while a sequence runs.
+    MAX_PIN             = 28
+    MAX_ADC             = 4
+    MAX_UART            = 1
+    MIN_PWM_HZ          = 26
+    MAX_PWM_HZ          = 125000000
+
+    def __init__(self, program):
+        """@brief Constructor. The program is compiled. ValueError is raised if it is invalid.
+           @param program The program text."""
+        self.program = program
+        # Each op is a tuple of the opcode and its (int or bytes) arguments.
+        self.ops = []
+        totalWaitUs = 0
+        elems = program.split(Sequence.OP_SEPARATOR)
+        if len(elems) > Sequence.MAX_OPS:
+            raise ValueError("A sequence may hold at most {} operations.".format(Sequence.MAX_OPS))
+        for elem in elems:
+            args = elem.strip().split(Sequence.ARG_SEPARATOR)
+            name = args.pop(0).lower()
+            if name not in Sequence.OP_NAMES:
+                raise ValueError("{} is an unknown operation.".format(name))
+            op = Sequence.OP_NAMES.index(name)
+            if len(args) != Sequence.OP_ARG_COUNTS[op]:
+                raise ValueError("{} requires {} arguments.".format(name, Sequence.OP_ARG_COUNTS[op]))
+
+            if op == Sequence.OP_TX:
+                uart = self._get_int(args[0], 0, Sequence.MAX_UART, "UART")
+                self.ops.append((op, uart, binascii.unhexlify(args[1])))
+                continue
+
+            values = [int(arg, 0) for arg in args]
+            if op in (Sequence.OP_OUT, Sequence.OP_IN, Sequence.OP_PWM):
+                self._get_int(args[0], 0, Sequence.MAX_PIN, "pin")
+            if op == Sequence.OP_OUT:
+                self._get_int(args[1], 0, 1, "output value")
+            elif op == Sequence.OP_WAIT:
+                totalWaitUs += self._get_int(args[0], 0, Sequence.MAX_WAIT_US, "wait")
+            elif op == Sequence.OP_ADC:
+                self._get_int(args[0], 0, Sequence.MAX_ADC, "ADC")
+            elif op == Sequence.OP_RX:
+                self._get_int(args[0], 0, Sequence.MAX_UART, "UART")
+            elif op == Sequence.OP_PWM:
+                if values[1] != 0:
+                    self._get_int(args[1], Sequence.MIN_PWM_HZ, Sequence.MAX_PWM_HZ, "PWM freq")
+                self._get_int(args[2], 0, 65535, "PWM duty")
+            self.ops.append(tuple([op] + values))
+
+        if totalWaitUs > Sequence.MAX_WAIT_US:
+            raise ValueError("The total wait time must be <= {} us.".format(Sequence.MAX_WAIT_US))
+
+    def _get_int(self, arg, minValue, maxValue, name):
+        """@brief Get an integer argument.
+           @param arg The argument text.
+           @param minValue The min valid value.
+           @param maxValue The max valid value.
+           @param name The name of the argument used in the error message.
+           @return The value. ValueError is raised if invalid."""
+        value = int(arg, 0)
+        if value < minValue or value > maxValue:
+            raise ValueError("{} is an invalid {} (valid = {} - {}).".format(value, name, minValue, maxValue))
+        return value
+
+class SequenceRunner(UOBase):
+    """@brief Responsible for running sequences of timed peripheral operations on the
+              unit so that the time between the operations does not depend on the
+              network. The peripherals used are found before the first operation runs.
+              Waits are measured from the start of the sequence (each wait ends its
+              delay after the end of the previous wait) so the time taken by the
+              operations does not add to the delays. Sequences may be stored by name."""
+
+    CFG_SECTION     = "sequences"   # The config section holding the stored sequences.
+    CACHE_SIZE      = 4             # The number of compiled programs that are not stored but kept for reuse.
+
+    def __init__(self, uo, getPin, getPWM, getUART, readADC, readUART, config=None):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param getPin A function that is passed a GPIO pin number and True for an output
+                         or False for an input and returns the machine.Pin instance.
+           @param getPWM A function that is passed a GPIO pin number and returns the machine.PWM instance.
+           @param getUART A function that is passed a UART number and returns the machine.UART
+                          instance. This raises an exception if the UART has not been setup.
+           @param readADC A function that is passed an ADC channel and returns its value.
+           @param readUART A function that is passed a UART number and returns the bytes received.
+           @param config The Config instance that the stored sequences are saved to or None."""
+        super().__init__(uo=uo)
+        self._getPin = getPin
+        self._getPWM = getPWM
+        self._getUART = getUART
+        self._readADC = readADC
+        self._readUART = readUART
+        self._config = config
+        self._storedDict = {}
+        self._cacheDict = {}
+        self._runs = 0
+        self._maxLateUs = 0
+        if self._config:
+            stored = self._config.getSection(SequenceRunner.CFG_SECTION)
+            if stored:
+                self._storedDict = stored
+
+    def compile(self, program):
+        """@brief Get the compiled sequence of a program. Recently used programs are
+                  not compiled again.
+           @param program The program text.
+           @return The Sequence instance. ValueError is raised if the program is invalid."""
+        sequence = self._cacheDict.get(program)
+        if sequence is None:
+            sequence = Sequence(program)
+            if len(self._cacheDict) >= SequenceRunner.CACHE_SIZE:
+                self._cacheDict.pop(next(iter(self._cacheDict)))
+            self._cacheDict[program] = sequence
+        return sequence
+
+    def store(self, name, program):
+        """@brief Store a sequence so that it can be run by name.
+           @param name The sequence name.
+           @param program The program text. ValueError is raised if the program is invalid."""
+        sequence = Sequence(program)
+        self._storedDict[name] = sequence
+        if self._config:
+            self._config.set(SequenceRunner.CFG_SECTION, name, program)
+
+    def remove(self, name):
+        """@brief Remove a stored sequence.
+           @param name The sequence name."""
+        if name not in self._storedDict:
+            raise ValueError("{} sequence not found.".format(name))
+        del self._storedDict[name]
+        if self._config:
+            stored = self.getStored()
+            if stored:
+                self._config.setSection(SequenceRunner.CFG_SECTION, stored)
+            else:
+                self._config.removeSection(SequenceRunner.CFG_SECTION)
+
+    def getStored(self):
+        """@brief Get the stored sequences.
+           @return A dict mapping each name to its program text."""
+        stored = {}
+        for name in self._storedDict:
+            sequence = self._storedDict[name]
+            if isinstance(sequence, Sequence):
+                sequence = sequence.program
+            stored[name] = sequence
+        return stored
+
+    def runStored(self, name):
+        """@brief Run a stored sequence.
+           @param name The sequence name.
+           @return See run()."""
+        sequence = self._storedDict.get(name)
+        if sequence is None:
+            raise ValueError("{} sequence not found.".format(name))
+        # Sequences loaded from the config are compiled when first run.
+        if not isinstance(sequence, Sequence):
+            sequence = Sequence(sequence)
+            self._storedDict[name] = sequence
+        return self.run(sequence)
+
+    def _bind(self, sequence):
+        """@brief Find the peripherals used by a sequence.
+           @param sequence The Sequence instance.
+           @return A list of ops. Each is a tuple of the opcode, the peripheral (or function) and its arguments."""
+        bound = []
+        for op in sequence.ops:
+            code = op[0]
+            if code == Sequence.OP_OUT:
+                bound.append((code, self._getPin(op[1], True), op[2], 0))
+            elif code == Sequence.OP_IN:
+                bound.append((code, self._getPin(op[1], False), 0, 0))
+            elif code == Sequence.OP_WAIT:
+                bound.append((code, None, op[1], 0))
+            elif code == Sequence.OP_ADC:
+                bound.append((code, self._readADC, op[1], 0))
+            elif code == Sequence.OP_TX:
+                bound.append((code, self._getUART(op[1]), op[2], 0))
+            elif code == Sequence.OP_RX:
+                # Check the UART has been setup before the sequence starts.
+                self._getUART(op[1])
+                bound.append((code, self._readUART, op[1], 0))
+            elif code == Sequence.OP_PWM:
+                bound.append((code, self._getPWM(op[1]), op[2], op[3]))
+        return bound
+
+    def run(self, sequence):
+        """@brief Run a sequence. Nothing else runs until it has completed.
+           @param sequence The Sequence instance.
+           @return A dict holding
+                   results: A list of the values read. Each is a list of [op index, value, time_us]
+                            where time_us is the time from the start of the sequence.
+                            UART data is returned as hex digits.
+                   elapsed_us: The time taken to run the sequence.
+                   late_us: The max time by which a wait ended late."""
+        bound = self._bind(sequence)
+        results = []
+        lateUs = 0
+        startUs = time.ticks_us()
+        waitEndUs = startUs
+        for index in range(len(bound)):
+            code, target, arg1, arg2 = bound[index]
+            if code == Sequence.OP_WAIT:
+                waitEndUs = time.ticks_add(waitEndUs, arg1)
+                while time.ticks_diff(waitEndUs, time.ticks_us()) > 0:
+                    pass
+                late = time.ticks_diff(time.ticks_us(), waitEndUs)
+                if late > lateUs:
+                    lateUs = late
+
+            elif code == Sequence.OP_OUT:
+                target.value(arg1)
+
+            elif code == Sequence.OP_IN:
+                results.append([index, target.value(), time.ticks_diff(time.ticks_us(), startUs)])
+
+            elif code == Sequence.OP_ADC:
+                results.append([index, target(arg1), time.ticks_diff(time.ticks_us(), startUs)])
+
+            elif code == Sequence.OP_TX:
+                target.write(arg1)
+
+            elif code == Sequence.OP_RX:
+                data = target(arg1)
+                results.append([index, binascii.hexlify(data).decode() if data else "", time.ticks_diff(time.ticks_us(), startUs)])
+
+            elif code == Sequence.OP_PWM:
+                if arg1:
+                    target.freq(arg1)
+                target.duty_u16(arg2)
+
+        elapsedUs = time.ticks_diff(time.ticks_us(), startUs)
+        self._runs += 1
+        if lateUs > self._maxLateUs:
+            self._maxLateUs = lateUs
+        return {"results": results,
+                "elapsed_us": elapsedUs,
+                "late_us": lateUs}
+
+    def getStats(self):
+        """@brief Get the sequence statistics.
+           @return A dict holding the number of runs and the max time a wait ended late."""
+        return {"runs": self._runs,
+                "max_late_us": self._maxLateUs,
+                "stored": len(self._storedDict)}
@@ -0,0 +1,27 @@
+import _thread
+import machine
+
+# The RP2040 has a single ADC whose input is selected by a mux. If one core selects
+# a channel or starts a conversion while the other core is converting, the reading
+# may come from the wrong channel or be corrupted. When the core1 worker samples
+# ADC channels both cores read the ADC, so every ADC read (on either core) is made
+# through a SharedADC which holds this lock while the conversion is made.
+_adcLock = _thread.allocate_lock()
+
+class SharedADC(object):
+    """@brief An ADC channel that may be read from either core. This has the same
+              read_u16() method as machine.ADC."""
+
+    def __init__(self, channel):
+        """@brief Constructor
+           @param channel The ADC channel (0 - 4)."""
+        self._adc = machine.ADC(channel)
+
+    def read_u16(self):
+        """@brief Read the ADC channel. This does not allocate memory.
+           @return The ADC value (0 - 65535)."""
+        _adcLock.acquire()
+        try:
+            return self._adc.read_u16()
+        finally:
+            _adcLock.release()
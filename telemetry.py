@@ -0,0 +1,240 @@
+import time
+import socket
+import struct
+import machine
+import uasyncio as asyncio
+
+from uo import UOBase
+from wire_format import encode_cbor
+from shared_adc import SharedADC
+
+class Telemetry(UOBase):
+    """@brief Responsible for pushing sensor readings to a collector rather than the
+              collector polling the REST interface. update() is called periodically
+              (by the scheduler) to take a sample. Once a batch of samples has been
+              taken they are sent as a single CBOR frame over UDP or a persistent
+              TCP connection. See tools/telemetry_collector.py for a collector.
+
+              Each frame is a CBOR map holding
+              v         The frame version.
+              unit      The unit name.
+              seq       The frame sequence number (a gap shows a lost frame).
+              period_ms The sample period.
+              fields    The name of each value in a sample.
+              samples   A list of samples, each a list of values in fields order.
+              metrics   Optional metrics read when the frame is sent.
+
+              Over TCP each frame is preceded by its length (2 bytes, big endian)."""
+
+    PROTO_UDP           = "udp"
+    PROTO_TCP           = "tcp"
+    DEFAULT_PORT        = 2935                  # The default collector port.
+    DEFAULT_PERIOD_MS   = 1000                  # The default sample period.
+    DEFAULT_BATCH       = 10                    # The default number of samples sent in each frame.
+    MAX_BATCH           = 32                    # The max number of samples in a frame (keeps UDP frames below the MTU).
+    MAX_QUEUED_FRAMES   = 4                     # Frames waiting to be sent. The oldest is dropped if the collector is slow.
+    CONNECT_TIMEOUT_MS  = 5000                  # The time allowed to connect to a TCP collector.
+    WRITE_TIMEOUT_MS    = 5000                  # The time allowed to send a frame to a TCP collector.
+    RECONNECT_MS        = 10000                 # The min time between TCP connection attempts.
+    FRAME_VERSION       = 1
+    TCP_LENGTH_FMT      = ">H"                  # The length sent before each frame over TCP.
+    SERVICE_NAME        = "TELEMETRY"           # The name of the service in the YView service list.
+    ADC_CHANNELS        = (0, 1, 2, 3, 4)       # The valid ADC channels.
+    # The RP2040 SIO register holding the input state of GPIO 0 - 29.
+    SIO_GPIO_IN         = 0xd0000004
+
+    def __init__(self,
+                 uo=None,
+                 host=None,
+                 port=DEFAULT_PORT,
+                 protocol=PROTO_UDP,
+                 period_ms=DEFAULT_PERIOD_MS,
+                 batch=DEFAULT_BATCH,
+                 adcs=(),
+                 temperatureSensor=None,
+                 gpio_mask=0,
+                 unit_name=""):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param host The address of the collector.
+           @param port The port of the collector.
+           @param protocol PROTO_UDP or PROTO_TCP.
+           @param period_ms The period at which update() is called.
+           @param batch The number of samples sent in each frame.
+           @param adcs The ADC channels read in each sample.
+           @param temperatureSensor A TemperatureSensor instance or None if the temperature is not sent.
+           @param gpio_mask The GPIO pins read in each sample (bit n = GPIO n, 0 = GPIO state not sent).
+           @param unit_name The name of this unit sent in each frame."""
+        super().__init__(uo=uo)
+        if not host:
+            raise ValueError("The telemetry collector host is not set.")
+        if protocol not in (Telemetry.PROTO_UDP, Telemetry.PROTO_TCP):
+            raise ValueError("{} is an invalid telemetry protocol (udp or tcp).".format(protocol))
+        if batch < 1 or batch > Telemetry.MAX_BATCH:
+            raise ValueError("{} is an invalid telemetry batch size (valid = 1 - {}).".format(batch, Telemetry.MAX_BATCH))
+        for adc in adcs:
+            if adc not in Telemetry.ADC_CHANNELS:
+                raise ValueError("{} is an invalid ADC channel.".format(adc))
+        self._host = host
+        self._port = port
+        self._protocol = protocol
+        self._periodMS = period_ms
+        self._batch = batch
+        self._adcs = [SharedADC(adc) for adc in adcs]
+        self._temperatureSensor = temperatureSensor
+        self._gpioMask = gpio_mask
+        self._unitName = unit_name
+        self._metricDict = {}
+        self._fields = ["ticks_ms"]
+        for adc in adcs:
+            self._fields.append("adc{}".format(adc))
+        if temperatureSensor:
+            self._fields.append("temp_mc")
+        if gpio_mask:
+            self._fields.append("gpios")
+        self._samples = []
+        self._frames = []
+        self._seq = 0
+        self._event = asyncio.Event()
+        self._sock = None
+        self._address = None
+        self._writer = None
+        self._lastConnectMS = None
+        self._sentFrames = 0
+        self._sentBytes = 0
+        self._droppedFrames = 0
+        self._errors = 0
+
+    def addMetric(self, name, func):
+        """@brief Add a metric sent in each frame (E.G free memory).
+           @param name The name of the metric.
+           @param func A function that returns the value of the metric."""
+        self._metricDict[name] = func
+
+    def getServiceStr(self):
+        """@brief Get the details of the telemetry target for the YView service list.
+           @return The service string (E.G TELEMETRY:udp:192.168.1.10:2935)."""
+        return "{}:{}:{}:{}".format(Telemetry.SERVICE_NAME, self._protocol, self._host, self._port)
+
+    def getStats(self):
+        """@brief Get the telemetry statistics.
+           @return A dict holding the statistics."""
+        return {"frames": self._sentFrames,
+                "bytes": self._sentBytes,
+                "dropped": self._droppedFrames,
+                "errors": self._errors,
+                "queued": len(self._frames),
+                "connected": self._sock is not None or self._writer is not None}
+
+    def start(self):
+        """@brief Start the uasyncio task that sends frames to the collector.
+                  update() must be called every period_ms (E.G by the scheduler)."""
+        asyncio.create_task(self._send_frames())
+
+    def update(self):
+        """@brief Take a sample. Once a batch of samples has been taken a frame is
+                  queued to be sent."""
+        sample = [time.ticks_ms()]
+        for adc in self._adcs:
+            sample.append(adc.read_u16())
+        if self._temperatureSensor:
+            sample.append(self._temperatureSensor.get_mc())
+        if self._gpioMask:
+            sample.append(machine.mem32[Telemetry.SIO_GPIO_IN] & self._gpioMask)
+        self._samples.append(sample)
+        if len(self._samples) >= self._batch:
+            self._queue_frame()
+
+    def _queue_frame(self):
+        """@brief Encode the samples taken into a frame and queue it to be sent."""
+        frame = {"v": Telemetry.FRAME_VERSION,
+                 "unit": self._unitName,
+                 "seq": self._seq,
+                 "period_ms": self._periodMS,
+                 "fields": self._fields,
+                 "samples": self._samples}
+        if self._metricDict:
+            metrics = {}
+            for name in self._metricDict:
+                try:
+                    metrics[name] = self._metricDict[name]()
+                except Exception as ex:
+                    self._debug("Telemetry metric {} error: {}".format(name, ex))
+            frame["metrics"] = metrics
+        self._seq += 1
+        self._samples = []
+        self._frames.append(encode_cbor(frame))
+        if len(self._frames) > Telemetry.MAX_QUEUED_FRAMES:
+            self._frames.pop(0)
+            self._droppedFrames += 1
+        self._event.set()
+
+    async def _send_frames(self):
+        """@brief Send queued frames to the collector."""
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            while self._frames:
+                frame = self._frames.pop(0)
+                try:
+                    if self._protocol == Telemetry.PROTO_TCP:
+                        sent = await self._send_tcp(frame)
+                    else:
+                        sent = self._send_udp(frame)
+                    if sent:
+                        self._sentFrames += 1
+                        self._sentBytes += len(frame)
+                    else:
+                        self._droppedFrames += 1
+
+                except Exception as ex:
+                    self._errors += 1
+                    self._droppedFrames += 1
+                    self._debug("Telemetry send error: {}".format(ex))
+                    await self._close()
+
+    def _send_udp(self, frame):
+        """@brief Send a frame to the collector in a UDP datagram.
+           @param frame The frame bytes.
+           @return True if sent."""
+        if self._sock is None:
+            self._address = socket.getaddrinfo(self._host, self._port)[0][-1]
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        self._sock.sendto(frame, self._address)
+        return True
+
+    async def _send_tcp(self, frame):
+        """@brief Send a frame to the collector over a TCP connection. The connection
+                  is kept open between frames. While the collector is unavailable
+                  frames are dropped and the connection is retried every RECONNECT_MS.
+           @param frame The frame bytes.
+           @return True if sent."""
+        if self._writer is None:
+            now = time.ticks_ms()
+            if self._lastConnectMS is not None and \
+               time.ticks_diff(now, self._lastConnectMS) < Telemetry.RECONNECT_MS:
+                return False
+            self._lastConnectMS = now
+            _, self._writer = await asyncio.wait_for_ms(asyncio.open_connection(self._host, self._port),
+                                                        Telemetry.CONNECT_TIMEOUT_MS)
+            self._info("Connected to telemetry collector {}:{}".format(self._host, self._port))
+        self._writer.write(struct.pack(Telemetry.TCP_LENGTH_FMT, len(frame)))
+        self._writer.write(frame)
+        await asyncio.wait_for_ms(self._writer.drain(), Telemetry.WRITE_TIMEOUT_MS)
+        return True
+
+    async def _close(self):
+        """@brief Close the connection to the collector so that it is reopened when the next frame is sent."""
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self._writer:
+            writer = self._writer
+            self._writer = None
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
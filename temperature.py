@@ -0,0 +1,106 @@
+from uo import UOBase
+from shared_adc import SharedADC
+
+class TemperatureSensor(UOBase):
+    """@brief Responsible for reading the RP2040 on chip temperature sensor.
+              Several ADC samples are averaged and converted to a temperature
+              using integer arithmetic. A smoothed temperature can be kept up
+              to date in the background (update()) so that it can be read
+              without waiting for the ADC."""
+
+    ADC_CHANNEL         = 4                             # The ADC channel connected to the temperature sensor.
+    DEFAULT_SAMPLES     = 16                            # The default number of ADC samples averaged for each reading.
+    MAX_SAMPLES         = 256                           # The max number of ADC samples averaged for each reading.
+    DEFAULT_EMA_SHIFT   = 3                             # The default smoothing. Each update moves the smoothed value 1/2^n of the way to the new reading.
+    UPDATE_PERIOD_MS    = 1000                          # The period at which update() should be called to keep the smoothed value up to date.
+    CAL_SECTION         = "temperature"                 # The config section holding the calibration offset.
+    CAL_OFFSET_KEY      = "offset_mc"                   # The key in the config section holding the offset in milli degrees C.
+    EMA_FRACTION_BITS   = 4                             # The number of fraction bits held in the smoothed value.
+
+    # The sensor voltage (Vbe) is typically 0.706 V at 27 degrees C and falls by 1.721 mV per degree C.
+    # With a 3.3 V ADC reference the temperature in milli degrees C for a read_u16() value of N is
+    # 27000 + 706000 * 1000 / 1721 - N * (3300000 / 65535 / 1.721)
+    # The slope is held with 8 fraction bits so that all values fit in a MicroPython small int.
+    OFFSET_MC           = 437227                        # The temperature (milli degrees C) for an ADC value of 0.
+    SLOPE_MC_Q8         = 7490                          # The temperature change (milli degrees C * 256) per ADC LSB (read_u16()).
+
+    def __init__(self, uo=None, samples=DEFAULT_SAMPLES, ema_shift=DEFAULT_EMA_SHIFT, config=None):
+        """@brief Constructor
+           @param uo A UO instance for presenting data to the user. If Left as None
+                     no data is sent to the user.
+           @param samples The number of ADC samples averaged for each reading.
+           @param ema_shift The smoothing applied by update() (0 = no smoothing).
+           @param config The Config instance holding the calibration offset. If None the
+                         calibration offset is not saved."""
+        super().__init__(uo=uo)
+        if samples < 1 or samples > TemperatureSensor.MAX_SAMPLES:
+            raise ValueError("{} is an invalid number of samples (valid = 1 - {}).".format(samples, TemperatureSensor.MAX_SAMPLES))
+        self._adc = SharedADC(TemperatureSensor.ADC_CHANNEL)
+        self._samples = samples
+        self._emaShift = ema_shift
+        self._emaQ = None
+        self._updates = 0
+        self._config = config
+        self._calOffsetMC = self._load_cal_offset()
+
+    def _load_cal_offset(self):
+        """@brief Load the calibration offset from the config.
+           @return The offset in milli degrees C (0 if not calibrated)."""
+        if self._config is None:
+            return 0
+        return int(self._config.get(TemperatureSensor.CAL_SECTION, TemperatureSensor.CAL_OFFSET_KEY, 0))
+
+    def _save_cal_offset(self):
+        """@brief Save the calibration offset to the config."""
+        if self._config:
+            self._config.set(TemperatureSensor.CAL_SECTION, TemperatureSensor.CAL_OFFSET_KEY, self._calOffsetMC)
+
+    def _read_uncalibrated_mc(self):
+        """@brief Read the ADC several times and convert the average to a temperature.
+           @return The temperature in milli degrees C without the calibration offset."""
+        adcSum = 0
+        for _ in range(self._samples):
+            adcSum += self._adc.read_u16()
+        adcAvg = (adcSum + (self._samples >> 1)) // self._samples
+        return TemperatureSensor.OFFSET_MC - ((adcAvg * TemperatureSensor.SLOPE_MC_Q8) >> 8)
+
+    def read_mc(self):
+        """@brief Read the temperature now (not smoothed).
+           @return The temperature in milli degrees C."""
+        return self._read_uncalibrated_mc() + self._calOffsetMC
+
+    def update(self):
+        """@brief Take a reading and update the smoothed temperature.
+                  This should be called every UPDATE_PERIOD_MS."""
+        readingQ = self._read_uncalibrated_mc() << TemperatureSensor.EMA_FRACTION_BITS
+        if self._emaQ is None:
+            self._emaQ = readingQ
+        else:
+            self._emaQ += (readingQ - self._emaQ) >> self._emaShift
+        self._updates += 1
+
+    def get_mc(self):
+        """@brief Get the temperature. This is the smoothed temperature if update() is
+                  being called, else the temperature is read now.
+           @return The temperature in milli degrees C."""
+        if self._emaQ is None:
+            return self.read_mc()
+        return (self._emaQ >> TemperatureSensor.EMA_FRACTION_BITS) + self._calOffsetMC
+
+    def get_temperature(self):
+        """@brief Get the temperature (see get_mc()).
+           @return The temperature in degrees C (to 0.001 degrees C)."""
+        return self.get_mc() / 1000
+
+    def calibrate(self, reference_mc):
+        """@brief Set and save the calibration offset so that the temperature read now
+                  matches a reference temperature.
+           @param reference_mc The reference temperature in milli degrees C."""
+        self.set_cal_offset(reference_mc - self._read_uncalibrated_mc())
+
+    def set_cal_offset(self, offset_mc):
+        """@brief Set and save the calibration offset.
+           @param offset_mc The offset in milli degrees C added to each reading."""
+        self._calOffsetMC = offset_mc
+        self._save_cal_offset()
+        self._info("Temperature calibration offset = {} milli degrees C".format(offset_mc))
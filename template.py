@@ -0,0 +1,84 @@
+class Template(object):
+    """@brief A file (E.G an HTML page) split once into static chunks and named slots
+              so that it can be served with the slot values written between the
+              chunks. A slot is a $ character followed by the slot name (upper case
+              letters, digits and _ characters, E.G $WIFINETWORKS). Only the names
+              of registered slots are slots so other $ characters (E.G in
+              JavaScript) are left as they are.
+
+              The static chunks are held as file offsets rather than data so a
+              template uses little RAM. They are read from the file through a
+              buffer when the template is sent so the file is not read whole or
+              decoded."""
+
+    def __init__(self, fd, buf, slotNames):
+        """@brief Constructor. The file is split into static chunks and slots.
+           @param fd The open file (binary mode).
+           @param buf A bytearray used to read the file.
+           @param slotNames The names of the slots (without the $ character)."""
+        # Each chunk is either a tuple holding the offset and length of static data or a slot name.
+        self.chunks = []
+        self.slots = 0
+        staticStart = 0
+        pos = 0
+        while True:
+            fd.seek(pos)
+            count = fd.readinto(buf)
+            if not count:
+                break
+            block = bytes(buf[:count])
+            nextPos = pos + count
+            i = block.find(b'$')
+            while i >= 0:
+                end = i + 1
+                while end < count and self._is_name_char(block[end]):
+                    end += 1
+                # If the name may continue into the next block read the next block from the $.
+                if end == count and count == len(buf) and i > 0:
+                    nextPos = pos + i
+                    break
+                name = block[i+1:end].decode()
+                if name in slotNames:
+                    self._add_static(staticStart, pos + i)
+                    self.chunks.append(name)
+                    self.slots += 1
+                    staticStart = pos + end
+                i = block.find(b'$', end)
+            pos = nextPos
+        self._add_static(staticStart, pos)
+
+    def _is_name_char(self, c):
+        """@brief Determine if a character may be part of a slot name.
+           @param c The character value.
+           @return True if A - Z, 0 - 9 or _."""
+        return (c >= 0x41 and c <= 0x5a) or (c >= 0x30 and c <= 0x39) or c == 0x5f
+
+    def _add_static(self, start, end):
+        """@brief Add a static chunk.
+           @param start The offset of the start of the chunk in the file.
+           @param end The offset of the end of the chunk in the file."""
+        if end > start:
+            self.chunks.append((start, end - start))
+
+    async def send(self, fd, buf, request, slotDict):
+        """@brief Send the template with the value of each slot in place of the slot.
+           @param fd The open file (binary mode).
+           @param buf A bytearray used to read the file.
+           @param request The HTTPRequest instance used to send data back to the client.
+                          The response must have been started.
+           @param slotDict A dict mapping each slot name to a function that returns its value (str or bytes)."""
+        mv = memoryview(buf)
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                value = slotDict[chunk]()
+                if value:
+                    await request.write(value)
+                continue
+            offset, length = chunk
+            fd.seek(offset)
+            while length > 0:
+                count = fd.readinto(mv[:min(length, len(buf))])
+                if not count:
+                    break
+                await request.write(mv[:count])
+                length -= count
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import subprocess
+from   optparse import OptionParser
+
+# This tool cross compiles the project python files to MicroPython bytecode (.mpy files)
+# so that they do not have to be compiled on the pico W each time it starts. This reduces
+# the startup time and the heap used by the compiler. It can also create a manifest file
+# that freezes the modules into a custom MicroPython firmware build.
+#
+# mpy-cross must be installed (pip install mpy-cross) and its version must match the
+# MicroPython firmware version on the pico W (E.G pip install mpy-cross==1.21.0) as the
+# .mpy file format changes between some MicroPython versions.
+
+MPY_CROSS       = "mpy-cross"           # The MicroPython cross compiler.
+MPY_ARCH        = "armv6m"              # The RP2040 cores are Cortex M0+ (ARMv6-M).
+DEFAULT_SRC_DIR = "."                   # The folder containing the project python files.
+DEFAULT_OUT_DIR = "build/mpy"           # The folder the .mpy files are written to.
+MANIFEST_FILE   = "manifest.py"         # The name of the frozen module manifest file.
+PICOW_MANIFEST  = "$(PORT_DIR)/boards/RPI_PICO_W/manifest.py" # The pico W firmware manifest.
+# main.py is run from source by MicroPython at startup so it is not compiled.
+# It should be kept small and import the other modules.
+EXCLUDE_FILES   = ("main.py", "boot.py")
+
+def get_src_files(src_dir):
+    """@brief Get the python files to compile.
+       @param src_dir The folder containing the project python files.
+       @return A sorted list of the python file names."""
+    srcFiles = []
+    for pyFile in glob.glob(os.path.join(src_dir, "*.py")):
+        fileName = os.path.basename(pyFile)
+        if fileName not in EXCLUDE_FILES:
+            srcFiles.append(fileName)
+    srcFiles.sort()
+    return srcFiles
+
+def build_mpy(src_dir, out_dir, mpy_cross):
+    """@brief Cross compile the python files to .mpy files.
+       @param src_dir The folder containing the project python files.
+       @param out_dir The folder to write the .mpy files to.
+       @param mpy_cross The mpy-cross command."""
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    # Remove old files so that modules that no longer exist are not deployed.
+    for oldFile in glob.glob(os.path.join(out_dir, "*.mpy")):
+        os.remove(oldFile)
+
+    srcBytes = 0
+    mpyBytes = 0
+    for fileName in get_src_files(src_dir):
+        srcFile = os.path.join(src_dir, fileName)
+        mpyFile = os.path.join(out_dir, fileName[:-3] + ".mpy")
+        cmd = [mpy_cross, "-march={}".format(MPY_ARCH)]
+        # Set the source file name held in the .mpy file to the file name on the pico W.
+        cmd += ["-s", fileName, "-o", mpyFile, srcFile]
+        subprocess.check_call(cmd)
+        srcSize = os.path.getsize(srcFile)
+        mpySize = os.path.getsize(mpyFile)
+        srcBytes += srcSize
+        mpyBytes += mpySize
+        print("{: <25} {: >7} -> {: >7} bytes".format(fileName, srcSize, mpySize))
+
+    print("{: <25} {: >7} -> {: >7} bytes".format("TOTAL", srcBytes, mpyBytes))
+
+def write_manifest(src_dir, manifest_file):
+    """@brief Create a manifest file that freezes the project modules into a MicroPython firmware build.
+              The firmware is built using
+              make -C ports/rp2 BOARD=RPI_PICO_W FROZEN_MANIFEST=<manifest file>
+       @param src_dir The folder containing the project python files.
+       @param manifest_file The manifest file to create."""
+    srcDir = os.path.abspath(src_dir)
+    fd = open(manifest_file, 'w')
+    fd.write("# Created by tools/build_mpy.py\n")
+    fd.write("include(\"{}\")\n".format(PICOW_MANIFEST))
+    for fileName in get_src_files(src_dir):
+        fd.write("module(\"{}\", base_path=\"{}\")\n".format(fileName, srcDir))
+    fd.close()
+    print("Created {}".format(manifest_file))
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Cross compile the project python files to .mpy files and/or create a frozen module manifest.')
+    opts.add_option("--src",        help="The folder containing the python files (default={}).".format(DEFAULT_SRC_DIR), default=DEFAULT_SRC_DIR)
+    opts.add_option("--out",        help="The folder to write the .mpy files to (default={}).".format(DEFAULT_OUT_DIR), default=DEFAULT_OUT_DIR)
+    opts.add_option("--mpy_cross",  help="The mpy-cross command (default={}).".format(MPY_CROSS), default=MPY_CROSS)
+    opts.add_option("--manifest",   help="Create a frozen module manifest file in the output folder rather than .mpy files.", action="store_true", default=False)
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        if options.manifest:
+            if not os.path.isdir(options.out):
+                os.makedirs(options.out)
+            write_manifest(options.src, os.path.join(options.out, MANIFEST_FILE))
+        else:
+            build_mpy(options.src, options.out, options.mpy_cross)
+
+    #If the program throws a system exit exception
+    except SystemExit:
+      pass
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import glob
+import base64
+import shutil
+from   optparse import OptionParser
+
+# This tool creates the webroot files that are loaded onto the pico W. Each page
+# served by the pico W is a separate connection and flash read for the HTML file
+# and each CSS, JavaScript and icon file it references. The number of connections
+# rather than the number of bytes sets the page load time. Therefore the CSS and
+# JavaScript files smaller than the max inline size (and the favicon) are inlined
+# into the HTML files which are then minified. Larger files (E.G zepto.min.js) are
+# left as separate files so that the browser can cache them.
+#
+# Placeholders in the HTML files (E.G $WIFINETWORKS) that are replaced by the
+# web server are not changed. The files are written to build/webroot and
+# deploy_and_run.sh loads this folder onto the pico W.
+
+DEFAULT_SRC_DIR     = "webroot"         # The folder containing the web files.
+DEFAULT_OUT_DIR     = "build/webroot"   # The folder the bundled web files are written to.
+DEFAULT_MAX_INLINE  = 4096              # Files larger than this (bytes) are not inlined.
+FAVICON_FILE        = "favicon.ico"     # Inlined into each page so that browsers do not request it.
+# Files that are loaded onto the pico W even if inlined in every page as they are
+# requested by path (E.G browsers request /favicon.ico when showing a REST response).
+KEEP_FILES          = (FAVICON_FILE,)
+HTML_EXT            = ".html"
+PLACEHOLDER_REGEX   = re.compile(r"\$[A-Z][A-Z0-9_]*")
+# The elements whose content is copied without change.
+RAW_REGEX           = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>.*?</\2\s*>)", re.IGNORECASE | re.DOTALL)
+STYLESHEET_REGEX    = re.compile(r"<link\b[^>]*\brel\s*=\s*[\"']?stylesheet[\"']?[^>]*>", re.IGNORECASE)
+SCRIPT_SRC_REGEX    = re.compile(r"<script\b[^>]*\bsrc\s*=\s*[\"']([^\"']+)[\"'][^>]*>\s*</script\s*>", re.IGNORECASE)
+HREF_REGEX          = re.compile(r"\bhref\s*=\s*[\"']([^\"']+)[\"']", re.IGNORECASE)
+ICON_REGEX          = re.compile(r"<link\b[^>]*\brel\s*=\s*[\"'][^\"']*icon[^\"']*[\"']", re.IGNORECASE)
+HEAD_END_REGEX      = re.compile(r"</head\s*>", re.IGNORECASE)
+TAG_REGEX           = re.compile(r"(<[^>]*>)")
+# Whitespace in a tag that is not in a quoted attribute value.
+TAG_SPACE_REGEX     = re.compile(r"(\"[^\"]*\"|'[^']*')|\s+")
+COMMENT_REGEX       = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+CSS_COMMENT_REGEX   = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_SPACE_REGEX     = re.compile(r"\s*([{};,>])\s*")
+# A space before : may be a descendant selector (E.G .nav :hover) so only the space after is removed.
+CSS_COLON_REGEX     = re.compile(r":\s+")
+JS_QUOTES           = ('"', "'", '`')
+JS_REGEX_PREFIX     = ('', '(', ',', '=', ':', '[', '!', '&', '|', '?', '{', '}', ';', '+', '-', '*', '%', '<', '>', '~', '^')
+
+class WebrootBundler(object):
+    """@brief Responsible for inlining the small CSS and JavaScript files into the
+              HTML files and minifying them."""
+
+    def __init__(self, src_dir, out_dir, max_inline):
+        """@brief Constructor
+           @param src_dir The folder containing the web files.
+           @param out_dir The folder the bundled web files are written to.
+           @param max_inline Files larger than this (bytes) are not inlined."""
+        self._srcDir = src_dir
+        self._outDir = out_dir
+        self._maxInline = max_inline
+        # The files that were inlined and those still referenced by a page.
+        self._inlined = set()
+        self._referenced = set()
+
+    def _get_local_file(self, url):
+        """@brief Get the file in the source folder that a URL references.
+           @param url The URL in the HTML file.
+           @return The file name or None if the URL is not a local file that can be inlined."""
+        if url.find(':') >= 0 or url.startswith("//"):
+            return None
+        fileName = url.split('?')[0].split('#')[0].lstrip('/')
+        srcFile = os.path.join(self._srcDir, fileName)
+        if not os.path.isfile(srcFile):
+            return None
+        if os.path.getsize(srcFile) > self._maxInline:
+            self._referenced.add(fileName)
+            return None
+        return fileName
+
+    def _read(self, fileName):
+        """@brief Read a text file in the source folder.
+           @param fileName The file name.
+           @return The file contents."""
+        with open(os.path.join(self._srcDir, fileName), 'r') as fd:
+            return fd.read()
+
+    def minify_css(self, css):
+        """@brief Remove the comments and unneeded whitespace from CSS.
+           @param css The CSS text.
+           @return The minified CSS."""
+        css = CSS_COMMENT_REGEX.sub("", css)
+        css = re.sub(r"\s+", " ", css)
+        css = CSS_SPACE_REGEX.sub(r"\1", css)
+        css = CSS_COLON_REGEX.sub(":", css)
+        return css.replace(";}", "}").strip()
+
+    def _js_line_state(self, line, state):
+        """@brief Find whether a line of JavaScript ends inside a literal or comment.
+           @param line The line of JavaScript.
+           @param state The literal open at the start of the line. '' if none, the quote
+                        character (\", ' or `) of a string or template literal or * for a
+                        block comment.
+           @return The literal open at the end of the line (as the state argument)."""
+        # The last character of code before the current character. A / after one of the
+        # JS_REGEX_PREFIX characters (or at the start of a line) starts a regex literal.
+        prev = ''
+        pos = 0
+        while pos < len(line):
+            c = line[pos]
+            if state == '*':
+                if line.startswith("*/", pos):
+                    state = ''
+                    pos += 1
+            elif state:
+                if c == '\\':
+                    pos += 1
+                elif c == state:
+                    state = ''
+                    prev = c
+            elif line.startswith("//", pos):
+                break
+            elif line.startswith("/*", pos):
+                state = '*'
+                pos += 1
+            elif c in JS_QUOTES or (c == '/' and prev in JS_REGEX_PREFIX):
+                state = c
+            elif not c.isspace():
+                prev = c
+            pos += 1
+        # Only template literals and block comments span lines without a \ at the end.
+        if state in ('"', "'") and not line.endswith('\\'):
+            state = ''
+        elif state == '/':
+            state = ''
+        return state
+
+    def minify_js(self, js):
+        """@brief Remove the indentation, blank lines and whole line comments from JavaScript.
+                  Line breaks are kept so that automatic semicolon insertion is not affected.
+                  Lines in multi-line string and template literals are not changed.
+           @param js The JavaScript text.
+           @return The minified JavaScript."""
+        lines = []
+        state = ''
+        for line in js.splitlines():
+            startState = state
+            state = self._js_line_state(line, state)
+            if startState in JS_QUOTES:
+                lines.append(line)
+                continue
+            line = line.lstrip()
+            if state not in JS_QUOTES:
+                line = line.rstrip()
+            if line and not line.startswith("//"):
+                lines.append(line)
+        # If the literals could not be followed the JavaScript is left as it is.
+        if state:
+            return js
+        return "\n".join(lines)
+
+    def _minify_script_element(self, element):
+        """@brief Minify the content of a script element.
+           @param element The script element text.
+           @return The minified script element."""
+        start = element.find('>') + 1
+        end = element.lower().rfind("</script")
+        return element[:start] + self.minify_js(element[start:end]) + element[end:]
+
+    def _minify_tag(self, tag):
+        """@brief Remove unneeded whitespace from a tag. Quoted attribute values are not changed.
+           @param tag The tag text.
+           @return The minified tag."""
+        tag = TAG_SPACE_REGEX.sub(lambda match: match.group(1) if match.group(1) else " ", tag)
+        return tag.replace("< ", "<").replace(" >", ">").replace(" />", "/>")
+
+    def minify_html(self, html):
+        """@brief Remove the comments and unneeded whitespace from HTML. The content of
+                  script, style, pre and textarea elements is not changed (apart from
+                  minifying the script and style content).
+           @param html The HTML text.
+           @return The minified HTML."""
+        html = COMMENT_REGEX.sub("", html)
+        elems = []
+        for pos, part in enumerate(RAW_REGEX.split(html)):
+            # split() returns the text, the raw element and the element name in turn.
+            if pos % 3 == 2:
+                continue
+            if pos % 3 == 1:
+                name = part[1:].split('>')[0].split()[0].lower()
+                if name == "script":
+                    part = self._minify_script_element(part)
+                elif name == "style":
+                    start = part.find('>') + 1
+                    end = part.lower().rfind("</style")
+                    part = part[:start] + self.minify_css(part[start:end]) + part[end:]
+                elems.append(part)
+                continue
+            for text in TAG_REGEX.split(part):
+                if text.startswith('<'):
+                    elems.append(self._minify_tag(text))
+                else:
+                    # Runs of whitespace between words and tags are shown as one space.
+                    elems.append(re.sub(r"\s+", " ", text))
+        html = "".join(elems)
+        # Whitespace at the start of the document and between the tags in the head is not shown.
+        html = re.sub(r">\s+(<(?:/?head|meta|link|style|script|title|/?html|body)\b)", r">\1", html, flags=re.IGNORECASE)
+        return html.strip()
+
+    def _inline_stylesheet(self, match):
+        """@brief Replace a link to a local stylesheet with a style element.
+           @param match The regex match of the link tag.
+           @return The replacement text."""
+        link = match.group(0)
+        href = HREF_REGEX.search(link)
+        fileName = self._get_local_file(href.group(1)) if href else None
+        if fileName is None:
+            return link
+        self._inlined.add(fileName)
+        css = self.minify_css(self._read(fileName))
+        return "<style>{}</style>".format(css.replace("</style", "<\\/style"))
+
+    def _inline_script(self, match):
+        """@brief Replace a script element that references a local file with the script.
+           @param match The regex match of the script element.
+           @return The replacement text."""
+        fileName = self._get_local_file(match.group(1))
+        if fileName is None:
+            return match.group(0)
+        self._inlined.add(fileName)
+        js = self.minify_js(self._read(fileName))
+        return "<script>{}</script>".format(js.replace("</script", "<\\/script"))
+
+    def _inline_favicon(self, html):
+        """@brief Add the favicon to the head of a page as a data URL.
+           @param html The HTML text.
+           @return The HTML text."""
+        iconFile = os.path.join(self._srcDir, FAVICON_FILE)
+        if ICON_REGEX.search(html) or not os.path.isfile(iconFile) or os.path.getsize(iconFile) > self._maxInline:
+            return html
+        headEnd = HEAD_END_REGEX.search(html)
+        if headEnd is None:
+            return html
+        with open(iconFile, 'rb') as fd:
+            iconData = base64.b64encode(fd.read()).decode()
+        self._inlined.add(FAVICON_FILE)
+        link = '<link rel="icon" href="data:image/x-icon;base64,{}">'.format(iconData)
+        return html[:headEnd.start()] + link + html[headEnd.start():]
+
+    def bundle_html(self, fileName):
+        """@brief Inline the small CSS and JavaScript files referenced by an HTML file and minify it.
+           @param fileName The HTML file name.
+           @return The bundled HTML text."""
+        html = self._read(fileName)
+        html = STYLESHEET_REGEX.sub(self._inline_stylesheet, html)
+        html = SCRIPT_SRC_REGEX.sub(self._inline_script, html)
+        html = self._inline_favicon(html)
+        # Placeholders in the inlined files are also kept.
+        inlinedPlaceholders = sorted(PLACEHOLDER_REGEX.findall(html))
+        html = self.minify_html(html)
+        outPlaceholders = sorted(PLACEHOLDER_REGEX.findall(html))
+        if outPlaceholders != inlinedPlaceholders:
+            changed = sorted(set(inlinedPlaceholders) ^ set(outPlaceholders))
+            raise Exception("{}: The placeholders {} (of {}) were changed.".format(fileName, changed, inlinedPlaceholders))
+        return html
+
+    def bundle(self):
+        """@brief Create the bundled web files in the output folder."""
+        if os.path.isdir(self._outDir):
+            shutil.rmtree(self._outDir)
+        os.makedirs(self._outDir)
+
+        srcFiles = []
+        for srcFile in sorted(glob.glob(os.path.join(self._srcDir, "*"))):
+            fileName = os.path.basename(srcFile)
+            # Editor backup files are not loaded onto the pico W.
+            if os.path.isfile(srcFile) and not fileName.endswith('~'):
+                srcFiles.append(fileName)
+
+        srcBytes = 0
+        outBytes = 0
+        for fileName in srcFiles:
+            if fileName.endswith(HTML_EXT):
+                html = self.bundle_html(fileName)
+                with open(os.path.join(self._outDir, fileName), 'w') as fd:
+                    fd.write(html)
+                srcSize = os.path.getsize(os.path.join(self._srcDir, fileName))
+                outSize = os.path.getsize(os.path.join(self._outDir, fileName))
+                srcBytes += srcSize
+                outBytes += outSize
+                print("{: <25} {: >7} -> {: >7} bytes".format(fileName, srcSize, outSize))
+
+        for fileName in srcFiles:
+            if fileName.endswith(HTML_EXT):
+                continue
+            srcSize = os.path.getsize(os.path.join(self._srcDir, fileName))
+            srcBytes += srcSize
+            # Files that are inlined in every page that uses them are not needed.
+            if fileName in self._inlined and fileName not in self._referenced and fileName not in KEEP_FILES:
+                print("{: <25} {: >7} -> inlined".format(fileName, srcSize))
+                continue
+            shutil.copy(os.path.join(self._srcDir, fileName), self._outDir)
+            outBytes += srcSize
+            print("{: <25} {: >7} -> {: >7} bytes".format(fileName, srcSize, srcSize))
+
+        print("{: <25} {: >7} -> {: >7} bytes".format("TOTAL", srcBytes, outBytes))
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Inline the small CSS and JavaScript files into the webroot HTML files and minify them.')
+    opts.add_option("--src",        help="The folder containing the web files (default={}).".format(DEFAULT_SRC_DIR), default=DEFAULT_SRC_DIR)
+    opts.add_option("--out",        help="The folder to write the bundled files to (default={}).".format(DEFAULT_OUT_DIR), default=DEFAULT_OUT_DIR)
+    opts.add_option("--max_inline", help="Files larger than this (bytes) are not inlined (default={}).".format(DEFAULT_MAX_INLINE), type="int", default=DEFAULT_MAX_INLINE)
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        webrootBundler = WebrootBundler(options.src, options.out, options.max_inline)
+        webrootBundler.bundle()
+
+    #If the program throws a system exit exception
+    except SystemExit:
+      pass
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import types
+from   collections import deque
+from   optparse import OptionParser
+
+# This tool runs the PIO programs in pio_programs.py on a PC. It provides an rp2
+# module that assembles programs written using the MicroPython @rp2.asm_pio syntax
+# and a cycle by cycle model of a state machine to run them.
+# When executed it runs the programs against known waveforms and checks the results.
+
+class PIO(object):
+    """@brief The rp2.PIO constants used by @rp2.asm_pio programs."""
+    IN_LOW      = 0
+    IN_HIGH     = 1
+    OUT_LOW     = 2
+    OUT_HIGH    = 3
+    SHIFT_LEFT  = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE   = 0
+    JOIN_TX     = 1
+    JOIN_RX     = 2
+
+class Instr(object):
+    """@brief A single PIO instruction."""
+
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+        self.delay = 0
+        self.sideset = None
+
+    def __getitem__(self, delay):
+        """@brief Set the delay cycles using the instr()[delay] syntax."""
+        self.delay = delay
+        return self
+
+    def side(self, value):
+        """@brief Set the side set pins value."""
+        self.sideset = value
+        return self
+
+    def __repr__(self):
+        return "{}{}".format(self.op, self.args)
+
+class Program(object):
+    """@brief An assembled PIO program."""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.instrs = []
+        self.labels = {}
+        self.wrap_target = 0
+        self.wrap = None
+
+    def _emit(self, op, *args):
+        instr = Instr(op, *args)
+        self.instrs.append(instr)
+        return instr
+
+    def dsl(self):
+        """@brief Get the globals an @rp2.asm_pio function is executed with."""
+        prog = self
+        gl = {}
+        for token in ('pins', 'x', 'y', 'null', 'isr', 'osr', 'pindirs', 'pc', 'exec', 'status',
+                      'pin', 'gpio', 'irq', 'not_x', 'x_dec', 'not_y', 'y_dec', 'x_not_y', 'not_osre',
+                      'iffull', 'ifempty'):
+            gl[token] = token
+        gl['block'] = True
+        gl['noblock'] = False
+        gl['invert'] = lambda src: ('invert', src)
+        gl['reverse'] = lambda src: ('reverse', src)
+
+        def label(name):
+            prog.labels[name] = len(prog.instrs)
+
+        def wrap_target():
+            prog.wrap_target = len(prog.instrs)
+
+        def wrap():
+            prog.wrap = len(prog.instrs) - 1
+
+        def jmp(cond, label=None):
+            if label is None:
+                cond, label = None, cond
+            return prog._emit('jmp', cond, label)
+
+        def push(*args):
+            return prog._emit('push', 'iffull' in args, False not in args)
+
+        def pull(*args):
+            return prog._emit('pull', 'ifempty' in args, False not in args)
+
+        gl['label'] = label
+        gl['wrap_target'] = wrap_target
+        gl['wrap'] = wrap
+        gl['jmp'] = jmp
+        gl['push'] = push
+        gl['pull'] = pull
+        gl['nop'] = lambda: prog._emit('mov', 'y', 'y')
+        gl['wait'] = lambda polarity, src, index: prog._emit('wait', polarity, src, index)
+        gl['in_'] = lambda src, count: prog._emit('in', src, count)
+        gl['out'] = lambda dst, count: prog._emit('out', dst, count)
+        gl['mov'] = lambda dst, src: prog._emit('mov', dst, src)
+        gl['set'] = lambda dst, value: prog._emit('set', dst, value)
+        return gl
+
+def asm_pio(**config):
+    """@brief A replacement for the MicroPython rp2.asm_pio decorator."""
+    def dec(f):
+        prog = Program(f.__name__, config)
+        func = types.FunctionType(f.__code__, prog.dsl(), f.__name__, f.__defaults__, f.__closure__)
+        func()
+        if prog.wrap is None:
+            prog.wrap = len(prog.instrs) - 1
+        return prog
+    return dec
+
+class GPIO(object):
+    """@brief The levels of the GPIO pins seen by a state machine."""
+
+    def __init__(self, input_func=None):
+        """@param input_func A function that is passed the cycle number and returns
+                             the input pin levels as a word (bit n = GPIO n)."""
+        self.input_func = input_func
+        self.outputs = 0
+        self.output_mask = 0
+        self.trace = []
+
+    def read(self, cycle):
+        levels = self.outputs
+        if self.input_func:
+            levels = (self.input_func(cycle) & ~self.output_mask) | (self.outputs & self.output_mask)
+        return levels
+
+    def write(self, cycle, base, count, value):
+        mask = ((1 << count) - 1) << base
+        self.output_mask |= mask
+        outputs = (self.outputs & ~mask) | ((value << base) & mask)
+        if outputs != self.outputs or not self.trace:
+            self.trace.append((cycle, outputs))
+        self.outputs = outputs
+
+class StateMachine(object):
+    """@brief A cycle by cycle model of an RP2040 PIO state machine."""
+
+    def __init__(self, program, gpio, in_base=0, out_base=0, set_base=0, sideset_base=0, jmp_pin=None):
+        cfg = program.config
+        self.prog = program
+        self.gpio = gpio
+        self.in_base = in_base
+        self.out_base = out_base
+        self.set_base = set_base
+        self.sideset_base = sideset_base
+        self.jmp_pin = jmp_pin
+        self.out_count = self._pin_count(cfg.get('out_init'))
+        self.set_count = self._pin_count(cfg.get('set_init'))
+        self.sideset_count = self._pin_count(cfg.get('sideset_init'))
+        self.in_shift_right = cfg.get('in_shiftdir', PIO.SHIFT_LEFT) == PIO.SHIFT_RIGHT
+        self.out_shift_right = cfg.get('out_shiftdir', PIO.SHIFT_LEFT) == PIO.SHIFT_RIGHT
+        self.autopush = cfg.get('autopush', False)
+        self.autopull = cfg.get('autopull', False)
+        self.push_thresh = cfg.get('push_thresh', 32)
+        self.pull_thresh = cfg.get('pull_thresh', 32)
+        join = cfg.get('fifo_join', PIO.JOIN_NONE)
+        self.tx_depth = 8 if join == PIO.JOIN_TX else (0 if join == PIO.JOIN_RX else 4)
+        self.rx_depth = 8 if join == PIO.JOIN_RX else (0 if join == PIO.JOIN_TX else 4)
+        self.tx = deque()
+        self.rx = deque()
+        self.x = 0
+        self.y = 0
+        self.isr = 0
+        self.isr_count = 0
+        self.osr = 0
+        self.osr_count = 32
+        self.pc = 0
+        self.delay = 0
+        self.cycle = 0
+        self.stalls = 0
+        if self.out_count:
+            gpio.write(0, out_base, self.out_count, 0)
+
+    @staticmethod
+    def _pin_count(init):
+        if init is None:
+            return 0
+        if isinstance(init, (tuple, list)):
+            return len(init)
+        return 1
+
+    def put(self, word):
+        """@brief Add a word to the TX FIFO.
+           @return True if there was space for it."""
+        if len(self.tx) < self.tx_depth:
+            self.tx.append(word & 0xffffffff)
+            return True
+        return False
+
+    def get(self):
+        """@brief Remove a word from the RX FIFO.
+           @return The word or None if the FIFO is empty."""
+        if self.rx:
+            return self.rx.popleft()
+        return None
+
+    def _source(self, src):
+        op = None
+        if isinstance(src, tuple):
+            op, src = src
+        if src == 'pins':
+            value = self._rotate(self.gpio.read(self.cycle), self.in_base)
+        elif src == 'x':
+            value = self.x
+        elif src == 'y':
+            value = self.y
+        elif src == 'null':
+            value = 0
+        elif src == 'isr':
+            value = self.isr
+        elif src == 'osr':
+            value = self.osr
+        elif src == 'status':
+            value = 0
+        else:
+            raise ValueError("{} is not a supported source.".format(src))
+        if op == 'invert':
+            value = ~value & 0xffffffff
+        elif op == 'reverse':
+            value = int('{:032b}'.format(value)[::-1], 2)
+        return value
+
+    @staticmethod
+    def _rotate(value, base):
+        return ((value >> base) | (value << (32 - base))) & 0xffffffff
+
+    def _jump_taken(self, cond):
+        if cond is None:
+            return True
+        if cond == 'not_x':
+            return self.x == 0
+        if cond == 'x_dec':
+            taken = self.x != 0
+            self.x = (self.x - 1) & 0xffffffff
+            return taken
+        if cond == 'not_y':
+            return self.y == 0
+        if cond == 'y_dec':
+            taken = self.y != 0
+            self.y = (self.y - 1) & 0xffffffff
+            return taken
+        if cond == 'x_not_y':
+            return self.x != self.y
+        if cond == 'pin':
+            return (self.gpio.read(self.cycle) >> self.jmp_pin) & 1 == 1
+        if cond == 'not_osre':
+            return self.osr_count < self.pull_thresh
+        raise ValueError("{} is not a supported jmp condition.".format(cond))
+
+    def _execute(self, instr):
+        """@brief Execute an instruction.
+           @return None to move to the next instruction, the address to jump to or False if stalled."""
+        op = instr.op
+        if op == 'jmp':
+            cond, label = instr.args
+            if self._jump_taken(cond):
+                return self.prog.labels[label]
+
+        elif op == 'wait':
+            polarity, src, index = instr.args
+            if src == 'gpio':
+                pin = index
+            elif src == 'pin':
+                pin = (self.in_base + index) % 32
+            else:
+                raise ValueError("wait on {} is not supported.".format(src))
+            if (self.gpio.read(self.cycle) >> pin) & 1 != polarity:
+                return False
+
+        elif op == 'in':
+            src, count = instr.args
+            if self.autopush and self.isr_count + count >= self.push_thresh and len(self.rx) >= self.rx_depth:
+                return False
+            data = self._source(src) & ((1 << count) - 1)
+            if self.in_shift_right:
+                self.isr = ((self.isr >> count) | (data << (32 - count))) & 0xffffffff
+            else:
+                self.isr = ((self.isr << count) | data) & 0xffffffff
+            self.isr_count = min(32, self.isr_count + count)
+            if self.autopush and self.isr_count >= self.push_thresh:
+                self.rx.append(self.isr)
+                self.isr = 0
+                self.isr_count = 0
+
+        elif op == 'out':
+            dst, count = instr.args
+            if self.autopull and self.osr_count >= self.pull_thresh:
+                if not self.tx:
+                    return False
+                self.osr = self.tx.popleft()
+                self.osr_count = 0
+            if self.out_shift_right:
+                data = self.osr & ((1 << count) - 1)
+                self.osr = self.osr >> count
+            else:
+                data = self.osr >> (32 - count)
+                self.osr = (self.osr << count) & 0xffffffff
+            self.osr_count = min(32, self.osr_count + count)
+            if dst == 'pins':
+                self.gpio.write(self.cycle, self.out_base, min(count, self.out_count), data)
+            elif dst == 'x':
+                self.x = data
+            elif dst == 'y':
+                self.y = data
+            elif dst == 'isr':
+                self.isr = data
+                self.isr_count = count
+            elif dst == 'pc':
+                return data
+            elif dst not in ('null', 'pindirs'):
+                raise ValueError("out to {} is not supported.".format(dst))
+
+        elif op == 'push':
+            iffull, block = instr.args
+            if iffull and self.isr_count < self.push_thresh:
+                return None
+            if len(self.rx) >= self.rx_depth:
+                if block:
+                    return False
+            else:
+                self.rx.append(self.isr)
+            self.isr = 0
+            self.isr_count = 0
+
+        elif op == 'pull':
+            ifempty, block = instr.args
+            if ifempty and self.osr_count < self.pull_thresh:
+                return None
+            if self.tx:
+                self.osr = self.tx.popleft()
+            elif block:
+                return False
+            else:
+                self.osr = self.x
+            self.osr_count = 0
+
+        elif op == 'mov':
+            dst, src = instr.args
+            value = self._source(src)
+            if dst == 'x':
+                self.x = value
+            elif dst == 'y':
+                self.y = value
+            elif dst == 'isr':
+                self.isr = value
+                self.isr_count = 0
+            elif dst == 'osr':
+                self.osr = value
+                self.osr_count = 0
+            elif dst == 'pins':
+                self.gpio.write(self.cycle, self.out_base, self.out_count, value)
+            elif dst == 'pc':
+                return value
+            else:
+                raise ValueError("mov to {} is not supported.".format(dst))
+
+        elif op == 'set':
+            dst, value = instr.args
+            if dst == 'x':
+                self.x = value
+            elif dst == 'y':
+                self.y = value
+            elif dst == 'pins':
+                self.gpio.write(self.cycle, self.set_base, self.set_count, value)
+            elif dst != 'pindirs':
+                raise ValueError("set {} is not supported.".format(dst))
+
+        return None
+
+    def step(self):
+        """@brief Run the state machine for one clock cycle."""
+        if self.delay > 0:
+            self.delay -= 1
+        else:
+            instr = self.prog.instrs[self.pc]
+            next_pc = self._execute(instr)
+            if next_pc is False:
+                self.stalls += 1
+            else:
+                if instr.sideset is not None and self.sideset_count:
+                    self.gpio.write(self.cycle, self.sideset_base, self.sideset_count, instr.sideset)
+                if next_pc is None:
+                    next_pc = self.prog.wrap_target if self.pc == self.prog.wrap else self.pc + 1
+                self.pc = next_pc
+                self.delay = instr.delay
+        self.cycle += 1
+
+    def run(self, cycles, tx_words=None, rx_words=None):
+        """@brief Run the state machine, feeding the TX FIFO and draining the RX FIFO as DMA would.
+           @param cycles The number of cycles to run for.
+           @param tx_words A list of words to feed to the TX FIFO.
+           @param rx_words A list to which words taken from the RX FIFO are appended."""
+        tx_index = 0
+        for _ in range(cycles):
+            while tx_words is not None and tx_index < len(tx_words) and self.put(tx_words[tx_index]):
+                tx_index += 1
+            self.step()
+            if rx_words is not None:
+                while self.rx:
+                    rx_words.append(self.rx.popleft())
+
+def install():
+    """@brief Install this module as the rp2 module so that pio_programs can be imported."""
+    rp2 = types.ModuleType('rp2')
+    rp2.PIO = PIO
+    rp2.asm_pio = asm_pio
+    sys.modules['rp2'] = rp2
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+class PIOChecker(object):
+    """@brief Runs each program in pio_programs.py against known waveforms and checks the results."""
+
+    def __init__(self, verbose=False):
+        import pio_programs
+        self._pp = pio_programs
+        self._verbose = verbose
+        self._failures = 0
+
+    def _check(self, name, expected, actual):
+        ok = expected == actual
+        print("{:<40} {}".format(name, "PASS" if ok else "FAIL"))
+        if not ok or self._verbose:
+            print("  expected={}".format(expected))
+            print("  actual  ={}".format(actual))
+        if not ok:
+            self._failures += 1
+
+    def check_pattern(self, width):
+        pin = 16
+        words = [0x12345678, 0x9abcdef0, 0x0ff0a55a]
+        gpio = GPIO()
+        sm = StateMachine(self._pp.pattern_program(width), gpio, out_base=pin)
+        count = len(words) * 32 // width
+        sm.run(count + 8, tx_words=words)
+        levels = [0] * sm.cycle
+        for cycle, outputs in gpio.trace:
+            for c in range(cycle, sm.cycle):
+                levels[c] = (outputs >> pin) & ((1 << width) - 1)
+        # The first out instruction executes on cycle 0
+        self._check("pattern width={}".format(width),
+                    self._pp.decode_samples(words, width, count),
+                    levels[:count])
+
+    def check_pulses(self):
+        pin = 2
+        pulses = [(1, 4), (0, 10), (1, 100), (0, 7), (1, 5)]
+        gpio = GPIO()
+        sm = StateMachine(self._pp.pulse_program(), gpio, out_base=pin)
+        total = sum(p[1] for p in pulses)
+        sm.run(total + 20, tx_words=list(self._pp.encode_pulses(pulses)))
+        changes = [(cycle, (outputs >> pin) & 1) for cycle, outputs in gpio.trace[1:]]
+        start = changes[0][0]
+        actual = []
+        for index in range(len(changes) - 1):
+            actual.append((changes[index][1], changes[index + 1][0] - changes[index][0]))
+        # The last pulse holds its level until more data is supplied.
+        expected = []
+        for level, cycles in pulses[:-1]:
+            if expected and expected[-1][0] == level:
+                expected[-1] = (level, expected[-1][1] + cycles)
+            else:
+                expected.append((level, cycles))
+        self._check("pulses (start cycle {})".format(start), expected, actual)
+
+    def check_capture(self, width, trigger):
+        pin = 10
+        trigger_cycle = 37
+        def inputs(cycle):
+            if trigger is not None and cycle < trigger_cycle:
+                return (1 - trigger) << pin
+            return ((cycle * 7 + (cycle >> 3)) & ((1 << width) - 1)) << pin
+        gpio = GPIO(inputs)
+        sm = StateMachine(self._pp.capture_program(width, trigger), gpio, in_base=pin)
+        count = 3 * 32 // width
+        rx = []
+        sm.run(trigger_cycle + count + 8, rx_words=rx)
+        start = 0
+        if trigger is not None:
+            # The wait completes on the first cycle the pin is at the trigger level
+            # and sampling starts on the next cycle.
+            start = trigger_cycle
+            while (inputs(start) >> pin) & 1 != trigger:
+                start += 1
+            start += 1
+        expected = [(inputs(start + c) >> pin) & ((1 << width) - 1) for c in range(count)]
+        self._check("capture width={} trigger={}".format(width, trigger),
+                    expected,
+                    self._pp.decode_samples(rx, width, count))
+
+    def check_edges(self):
+        pin = 5
+        # Pulses must be at least EDGE_LOOP_CYCLES + EDGE_PUSH_CYCLES long to be detected.
+        edges = [10, 31, 200, 205, 211, 500, 1234]
+        def inputs(cycle):
+            level = 0
+            for edge in edges:
+                if cycle >= edge:
+                    level ^= 1
+            return level << pin
+        gpio = GPIO(inputs)
+        sm = StateMachine(self._pp.edge_program(), gpio, jmp_pin=pin)
+        rx = []
+        sm.run(edges[-1] + 20, rx_words=rx)
+        times = self._pp.decode_edges(rx, len(rx))
+        # Edges are detected with a resolution of EDGE_LOOP_CYCLES.
+        errors = [t - e for t, e in zip(times, edges)]
+        ok = len(times) == len(edges) and all(abs(err) <= self._pp.EDGE_LOOP_CYCLES for err in errors)
+        self._check("edges (errors={})".format(errors), True, ok)
+
+    def check_all(self):
+        for width in self._pp.VALID_WIDTHS:
+            self.check_pattern(width)
+        self.check_pulses()
+        for width in self._pp.VALID_WIDTHS:
+            for trigger in (None, 0, 1):
+                self.check_capture(width, trigger)
+        self.check_edges()
+        return self._failures
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Run the pico W PIO programs (pio_programs.py) on a simulated state machine and check the results.')
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+    opts.add_option("--verbose",    help="Show the expected and actual results of every check.", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        install()
+        failures = PIOChecker(verbose=options.verbose).check_all()
+        if failures:
+            print("{} check(s) failed.".format(failures))
+            sys.exit(1)
+
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except SystemExit:
+      raise
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,572 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import gc
+import time
+import types
+import random
+import asyncio
+import tempfile
+import tracemalloc
+from   optparse import OptionParser
+
+# This tool runs the REST and web servers on a PC for a long time to find faults
+# that only show after many requests (E.G a unit slowing down after days of polling).
+# It provides stand-in machine, network, micropython and uasyncio modules so that
+# the server code runs unchanged under CPython.
+#
+# Clients send a mix of valid requests, malformed requests, slow requests, dropped
+# connections and connections that send nothing. The requests are sent in windows.
+# At the end of each window the load is stopped so that the traced heap, the number
+# of asyncio tasks and the number of open files/sockets can be compared when idle,
+# along with the latency of the valid requests. The test fails if any of these
+# trend upward or if a request gets an unexpected response.
+
+TICKS_MAX = 0x3fffffff
+
+def _ticks_diff(new, old):
+    """@brief The MicroPython time.ticks_diff()."""
+    diff = (new - old) & TICKS_MAX
+    if diff >= (TICKS_MAX + 1) // 2:
+        diff -= TICKS_MAX + 1
+    return diff
+
+class Pin(object):
+    """@brief The machine.Pin used by the servers. Inputs read 0."""
+    IN          = 0
+    OUT         = 1
+    OPEN_DRAIN  = 2
+    ALT         = 3
+    PULL_UP     = 1
+    PULL_DOWN   = 2
+    IRQ_FALLING = 4
+    IRQ_RISING  = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def toggle(self):
+        self._value ^= 1
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        pass
+
+class ADC(object):
+    """@brief The machine.ADC. Each channel reads a fixed value."""
+
+    def __init__(self, channel):
+        self._channel = channel
+
+    def read_u16(self):
+        return 14000 + self._channel
+
+class PWM(object):
+    """@brief The machine.PWM."""
+
+    def __init__(self, pin, freq=None, duty_u16=None):
+        pass
+
+    def freq(self, freq=None):
+        pass
+
+    def duty_u16(self, duty=None):
+        pass
+
+    def deinit(self):
+        pass
+
+class UART(object):
+    """@brief The machine.UART. Sent data is looped back."""
+
+    def __init__(self, *args, **kwargs):
+        self._data = b''
+
+    def write(self, data):
+        self._data += data
+        return len(data)
+
+    def any(self):
+        return len(self._data)
+
+    def read(self, count=-1):
+        data = self._data
+        self._data = b''
+        return data or None
+
+    def readinto(self, buf):
+        count = min(len(buf), len(self._data))
+        buf[:count] = self._data[:count]
+        self._data = self._data[count:]
+        return count or None
+
+class Mem32(dict):
+    """@brief The machine.mem32 registers."""
+
+    def __getitem__(self, address):
+        return self.get(address, 0)
+
+    def __setitem__(self, address, value):
+        dict.__setitem__(self, address, value & 0xffffffff)
+
+class WLAN(object):
+    """@brief The network.WLAN."""
+
+    def __init__(self, interface):
+        pass
+
+    def active(self, *args):
+        return True
+
+    def scan(self):
+        return []
+
+    def config(self, *args, **kwargs):
+        if args:
+            return b'\x28\xcd\xc1\x00\x00\x01'
+
+    def ifconfig(self, *args):
+        return ('127.0.0.1', '255.0.0.0', '', '')
+
+    def connect(self, *args):
+        pass
+
+    def status(self):
+        return 3
+
+    def isconnected(self):
+        return True
+
+class ThreadSafeFlag(object):
+    """@brief The uasyncio.ThreadSafeFlag."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+class ResetError(Exception):
+    """@brief Raised if the server code resets the unit."""
+
+def install():
+    """@brief Install the stand-in MicroPython modules so that the server modules can be imported."""
+    startNs = time.monotonic_ns()
+    time.ticks_ms = lambda: ((time.monotonic_ns() - startNs) // 1000000) & TICKS_MAX
+    time.ticks_us = lambda: ((time.monotonic_ns() - startNs) // 1000) & TICKS_MAX
+    time.ticks_cpu = time.ticks_us
+    time.ticks_diff = _ticks_diff
+    time.ticks_add = lambda ticks, delta: (ticks + delta) & TICKS_MAX
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+    # The traced Python heap stands in for the MicroPython heap.
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    gc.mem_free = lambda: 1000000
+    gc.threshold = lambda *args: -1 if not args else None
+
+    machine = types.ModuleType('machine')
+    machine.Pin = Pin
+    machine.ADC = ADC
+    machine.PWM = PWM
+    machine.UART = UART
+    machine.mem32 = Mem32()
+    machine.unique_id = lambda: b'\x01\x02\x03\x04\x05\x06\x07\x08'
+    machine.disable_irq = lambda: 0
+    machine.enable_irq = lambda state: None
+    machine.idle = lambda: None
+    cpuFreq = [125000000]
+    def freq(hz=None):
+        if hz is None:
+            return cpuFreq[0]
+        cpuFreq[0] = hz
+    machine.freq = freq
+    def reset():
+        raise ResetError("machine.reset() called")
+    machine.reset = reset
+    sys.modules['machine'] = machine
+
+    network = types.ModuleType('network')
+    network.STA_IF = 0
+    network.AP_IF = 1
+    network.WLAN = WLAN
+    sys.modules['network'] = network
+
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    micropython.schedule = lambda func, arg: func(arg)
+    micropython.alloc_emergency_exception_buf = lambda size: None
+    sys.modules['micropython'] = micropython
+
+    uasyncio = types.ModuleType('uasyncio')
+    for name in asyncio.__all__:
+        setattr(uasyncio, name, getattr(asyncio, name))
+    async def sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+    async def wait_for_ms(coro, ms):
+        return await asyncio.wait_for(coro, ms / 1000)
+    uasyncio.sleep_ms = sleep_ms
+    uasyncio.wait_for_ms = wait_for_ms
+    uasyncio.ThreadSafeFlag = ThreadSafeFlag
+    sys.modules['uasyncio'] = uasyncio
+
+    # The MicroPython stream methods that differ from CPython.
+    write = asyncio.StreamWriter.write
+    def stream_write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        return write(self, data)
+    asyncio.StreamWriter.write = stream_write
+    waitClosed = asyncio.StreamWriter.wait_closed
+    async def stream_wait_closed(self):
+        try:
+            await waitClosed(self)
+        except Exception:
+            pass
+    asyncio.StreamWriter.wait_closed = stream_wait_closed
+    async def stream_readinto(self, buf):
+        data = await self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+    asyncio.StreamReader.readinto = stream_readinto
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+class SoakTest(object):
+    """@brief Responsible for running the servers, applying the load and checking for trends."""
+
+    REST_PORT           = 18080     # The port the REST server listens on.
+    WEB_PORT            = 18081     # The port the web server listens on.
+    CLIENT_TIMEOUT_S    = 10        # The max time a client waits for a response.
+    SLOW_DELAY_S        = 0.002     # The delay between each part of a request sent by a slow client.
+    SETTLE_TIMEOUT_S    = 5         # The max time to wait for the server connections to close at the end of a window.
+
+    def __init__(self, options):
+        """@brief Constructor
+           @param options The command line options."""
+        self._options = options
+        self._random = random.Random(options.seed)
+        self._tmpDir = tempfile.mkdtemp(prefix="soak_")
+        self._windows = []
+        self._latencies = []
+        self._errors = 0
+        self._errorDict = {}
+        self._kindCounts = {}
+        self._sent = 0
+        # The request kinds, each is (name, weight, port, data, expected status or None if no response is read).
+        longLine = "GET /adc?adc=0?pad=" + "x" * 5000 + " HTTP/1.1\r\n\r\n"
+        bigHeaders = "GET /adc?adc=0 HTTP/1.1\r\n" + "X-Pad: {}\r\n".format("y" * 400) * 12 + "\r\n"
+        self._kinds = [("adc",          20, SoakTest.REST_PORT, "GET /adc?adc=0 HTTP/1.1\r\n\r\n", "200"),
+                       ("temperature",  10, SoakTest.REST_PORT, "GET /temperature HTTP/1.1\r\n\r\n", "200"),
+                       ("get_gpios",    10, SoakTest.REST_PORT, "GET /get_gpios?mask=0x3 HTTP/1.1\r\n\r\n", "200"),
+                       ("cpu_freq",     5,  SoakTest.REST_PORT, "GET /cpu_freq HTTP/1.1\r\n\r\n", "200"),
+                       ("http_stats",   5,  SoakTest.REST_PORT, "GET /http_stats?fmt=cbor HTTP/1.1\r\n\r\n", "200"),
+                       ("config",       5,  SoakTest.REST_PORT, "GET /config HTTP/1.1\r\n\r\n", "200"),
+                       ("unknown_cmd",  3,  SoakTest.REST_PORT, "GET /no_such_cmd?a=1 HTTP/1.1\r\n\r\n", "200"),
+                       ("page",         8,  SoakTest.WEB_PORT,  "GET / HTTP/1.1\r\nAccept-Encoding: gzip\r\n\r\n", "200"),
+                       ("css",          4,  SoakTest.WEB_PORT,  "GET /thestyle.css HTTP/1.1\r\n\r\n", "200"),
+                       ("favicon",      4,  SoakTest.WEB_PORT,  "GET /favicon.ico HTTP/1.1\r\n\r\n", "200"),
+                       ("not_found",    2,  SoakTest.WEB_PORT,  "GET /missing.html HTTP/1.1\r\n\r\n", "404"),
+                       ("garbage",      2,  SoakTest.REST_PORT, "GARBAGE\r\n\r\n", "400"),
+                       ("binary",       1,  SoakTest.REST_PORT, "\x00\xff\x13\x37 \x00\r\n\r\n", "400"),
+                       ("long_line",    1,  SoakTest.REST_PORT, longLine, "414"),
+                       ("big_headers",  1,  SoakTest.REST_PORT, bigHeaders, "431"),
+                       ("no_upgrade",   1,  SoakTest.REST_PORT, "GET /ws HTTP/1.1\r\n\r\n", "426"),
+                       ("slow",         3,  SoakTest.REST_PORT, "GET /adc?adc=1 HTTP/1.1\r\nConnection: close\r\n\r\n", "200"),
+                       ("dropped",      3,  SoakTest.REST_PORT, "GET /temperature HT", None),
+                       ("unread",       3,  SoakTest.WEB_PORT,  "GET / HTTP/1.1\r\n\r\n", None),
+                       ("stalled",      1,  SoakTest.REST_PORT, "", "408")]
+        self._kindWeights = [kind[1] for kind in self._kinds]
+
+    def _start_servers(self):
+        """@brief Start the HTTP, REST and web servers as main.py does."""
+        from uo import UO
+        from config import Config
+        from memory import BufferPool
+        from http_server import HTTPServer
+        from basic_web_server import BasicWebServer
+        from rest_server import RestServer
+
+        # Short timeouts so that stalled clients are dropped quickly.
+        HTTPServer.REQUEST_LINE_TIMEOUT_MS = self._options.timeout_ms
+        HTTPServer.HEADERS_TIMEOUT_MS = self._options.timeout_ms
+        # Keep the config in a temporary folder and do not touch files in the PC root folder.
+        Config.LEGACY_FILES = {}
+        BasicWebServer.WEB_ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'webroot') + '/'
+        BasicWebServer.TCP_PORT = SoakTest.WEB_PORT
+
+        uo = UO(enabled=self._options.debug, debug_enabled=self._options.debug)
+        config = Config(uo, os.path.join(self._tmpDir, "config.json"))
+        config.setSection("wifi", {"mode": "STA", "ssid": "soak", "pass": "soak_test"})
+        self._httpServer = HTTPServer(uo)
+        basicWebServer = BasicWebServer(uo, self._httpServer, BufferPool(4, 1024), config)
+        basicWebServer.start()
+        restServer = RestServer(uo,
+                                httpServer=self._httpServer,
+                                port=SoakTest.REST_PORT,
+                                config=config)
+        restServer.startServer()
+
+    def _add_error(self, name, msg):
+        """@brief Record an unexpected result.
+           @param name The request kind.
+           @param msg The error message."""
+        self._errors += 1
+        key = "{}: {}".format(name, msg)
+        self._errorDict[key] = self._errorDict.get(key, 0) + 1
+        if self._options.debug:
+            print("ERROR: {}".format(key))
+
+    async def _read_status(self, reader):
+        """@brief Read a whole response.
+           @param reader The StreamReader.
+           @return The status code string (E.G 200)."""
+        # The server closes the connection after each response.
+        response = await reader.read()
+        line = response.split(b'\r\n', 1)[0].split()
+        if len(line) < 2:
+            return "no response"
+        return line[1].decode()
+
+    async def _request(self, kind):
+        """@brief Send a request and check the response.
+           @param kind The request kind tuple."""
+        name, _, port, data, expected = kind
+        self._kindCounts[name] = self._kindCounts.get(name, 0) + 1
+        data = data.encode('latin-1')
+        startS = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), SoakTest.CLIENT_TIMEOUT_S)
+            if name == "slow":
+                for i in range(0, len(data), 7):
+                    writer.write(data[i:i+7])
+                    await writer.drain()
+                    await asyncio.sleep(SoakTest.SLOW_DELAY_S)
+            elif data:
+                writer.write(data)
+                await writer.drain()
+            if expected is None:
+                # The client goes away without reading the response.
+                return
+            status = await asyncio.wait_for(self._read_status(reader), SoakTest.CLIENT_TIMEOUT_S)
+            if status == "503":
+                # The connection limit was reached. This is expected while others are open.
+                self._kindCounts["busy"] = self._kindCounts.get("busy", 0) + 1
+            elif status != expected:
+                self._add_error(name, "status {} (expected {})".format(status, expected))
+            elif name not in ("slow", "stalled"):
+                self._latencies.append(time.perf_counter() - startS)
+
+        except asyncio.TimeoutError:
+            self._add_error(name, "client timeout")
+        except OSError as ex:
+            self._add_error(name, "{}".format(ex.__class__.__name__))
+
+        finally:
+            if writer:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    async def _client(self, count):
+        """@brief A client that sends requests one after another.
+           @param count The number of requests to send."""
+        for _ in range(count):
+            kind = self._random.choices(self._kinds, self._kindWeights)[0]
+            await self._request(kind)
+
+    async def _settle(self):
+        """@brief Wait for the server to finish with all connections."""
+        startS = time.perf_counter()
+        while self._httpServer.getStats()["connections"] > 0 and time.perf_counter() - startS < SoakTest.SETTLE_TIMEOUT_S:
+            await asyncio.sleep(0.01)
+        # Let closed connections be cleaned up.
+        await asyncio.sleep(0.05)
+
+    def _get_heap_size(self):
+        """@brief Get the size of the traced heap not including the memory allocated by this tool
+                  (E.G the window statistics) as this grows during the test.
+           @return The size in bytes."""
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__),
+                                                              tracemalloc.Filter(False, tracemalloc.__file__)])
+        return sum([stat.size for stat in snapshot.statistics("filename")])
+
+    def _get_open_files(self):
+        """@brief Get the number of open files and sockets in this process.
+           @return The number or -1 if not available on this platform."""
+        try:
+            return len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return -1
+
+    async def _run_window(self, index, count):
+        """@brief Send a window of requests and record the results.
+           @param index The window number.
+           @param count The number of requests in the window."""
+        self._latencies = []
+        errors = self._errors
+        startS = time.perf_counter()
+        clients = self._options.clients
+        await asyncio.gather(*[self._client(count // clients + (1 if c < count % clients else 0)) for c in range(clients)])
+        elapsedS = time.perf_counter() - startS
+        await self._settle()
+        gc.collect()
+        latencies = sorted(self._latencies)
+        p50 = p99 = maxMs = 0.0
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000
+            maxMs = latencies[-1] * 1000
+        self._sent += count
+        window = {"window": index,
+                  "requests": self._sent,
+                  "rate": count / elapsedS,
+                  "p50_ms": p50,
+                  "p99_ms": p99,
+                  "max_ms": maxMs,
+                  "heap_kb": self._get_heap_size() / 1024,
+                  "tasks": len(asyncio.all_tasks()),
+                  "files": self._get_open_files(),
+                  "connections": self._httpServer.getStats()["connections"],
+                  "errors": self._errors - errors}
+        self._windows.append(window)
+        print("{window: >6} {requests: >10} {rate: >8.0f} {p50_ms: >8.2f} {p99_ms: >8.2f} {max_ms: >8.1f} {heap_kb: >9.1f} {tasks: >6} {files: >6} {connections: >6} {errors: >6}".format(**window))
+
+    def _median(self, values):
+        """@brief Get the median of a list of values."""
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    def _trend(self, name):
+        """@brief Get the start and end values of a statistic. Windows in the warm up
+                  period are ignored. These are the medians of the first and last quarter
+                  of the remaining windows so that single slow windows do not fail the test.
+           @param name The statistic name.
+           @return A tuple containing the start and end values."""
+        values = [window[name] for window in self._windows[self._options.warmup:]]
+        quarter = max(1, len(values) // 4)
+        return (self._median(values[:quarter]), self._median(values[-quarter:]))
+
+    def _check(self):
+        """@brief Check the trends.
+           @return A list of the failure messages."""
+        failures = []
+        if len(self._windows) - self._options.warmup < 2:
+            failures.append("Too few windows to find trends (increase --requests or reduce --window).")
+            return failures
+        start, end = self._trend("heap_kb")
+        print("Heap:        {:.1f} KB -> {:.1f} KB".format(start, end))
+        if end - start > self._options.max_heap_growth:
+            failures.append("The heap grew by {:.1f} KB (max {} KB).".format(end - start, self._options.max_heap_growth))
+        start, end = self._trend("tasks")
+        print("Tasks:       {} -> {}".format(start, end))
+        if end > start:
+            failures.append("The number of asyncio tasks rose from {} to {}.".format(start, end))
+        start, end = self._trend("files")
+        print("Open files:  {} -> {}".format(start, end))
+        if end > start:
+            failures.append("The number of open files/sockets rose from {} to {}.".format(start, end))
+        start, end = self._trend("connections")
+        print("Connections: {} -> {}".format(start, end))
+        if end > 0:
+            failures.append("{} server connections were not closed.".format(end))
+        start, end = self._trend("p99_ms")
+        print("p99 latency: {:.2f} ms -> {:.2f} ms".format(start, end))
+        if start > 0 and (end - start) * 100 / start > self._options.max_p99_drift:
+            failures.append("The p99 latency rose by {:.0f}% (max {}%).".format((end - start) * 100 / start, self._options.max_p99_drift))
+        if self._errors > 0:
+            failures.append("{} requests received an unexpected response.".format(self._errors))
+        return failures
+
+    def _save_csv(self, csv_file):
+        """@brief Save the window statistics to a CSV file.
+           @param csv_file The CSV file."""
+        with open(csv_file, "w") as fd:
+            keys = list(self._windows[0].keys())
+            fd.write(",".join(keys) + "\n")
+            for window in self._windows:
+                fd.write(",".join([str(window[key]) for key in keys]) + "\n")
+
+    async def _run(self):
+        """@brief Run the servers and the load."""
+        self._start_servers()
+        # Let the servers start listening.
+        await asyncio.sleep(0.1)
+        print("{: >6} {: >10} {: >8} {: >8} {: >8} {: >8} {: >9} {: >6} {: >6} {: >6} {: >6}".format("WINDOW", "REQUESTS", "REQ/S", "P50 MS", "P99 MS", "MAX MS", "HEAP KB", "TASKS", "FILES", "CONNS", "ERRORS"))
+        index = 0
+        remaining = self._options.requests
+        while remaining > 0:
+            count = min(self._options.window, remaining)
+            await self._run_window(index, count)
+            remaining -= count
+            index += 1
+
+    def run(self):
+        """@brief Run the soak test.
+           @return True if passed."""
+        tracemalloc.start()
+        asyncio.run(self._run())
+        tracemalloc.stop()
+        if self._options.csv:
+            self._save_csv(self._options.csv)
+        print("Requests:    {}".format(", ".join(["{}={}".format(name, self._kindCounts[name]) for name in sorted(self._kindCounts)])))
+        for key in sorted(self._errorDict):
+            print("Error:       {} ({})".format(key, self._errorDict[key]))
+        failures = self._check()
+        for failure in failures:
+            print("FAIL: {}".format(failure))
+        if not failures:
+            print("PASS")
+        return not failures
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Run the pico W REST and web servers on a PC under a long mixed load and check for heap, task and socket leaks and latency drift.')
+    opts.add_option("--requests",        help="The total number of requests (default=1000000).", type="int", default=1000000)
+    opts.add_option("--window",          help="The number of requests in each window (default=10000).", type="int", default=10000)
+    opts.add_option("--clients",         help="The number of concurrent clients (default=4).", type="int", default=4)
+    opts.add_option("--warmup",          help="The number of windows ignored at the start (default=2).", type="int", default=2)
+    opts.add_option("--timeout_ms",      help="The server request line/header timeout used (default=500).", type="int", default=500)
+    opts.add_option("--max_heap_growth", help="The max heap growth in KB (default=128).", type="float", default=128)
+    opts.add_option("--max_p99_drift",   help="The max rise in the p99 latency in %% (default=50).", type="float", default=50)
+    opts.add_option("--seed",            help="The random seed used to choose the requests (default=1).", type="int", default=1)
+    opts.add_option("--csv",             help="Save the statistics of each window to a CSV file.", default=None)
+    opts.add_option("--debug",           help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        install()
+        if not SoakTest(options).run():
+            sys.exit(1)
+
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except SystemExit:
+      raise
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import socket
+import struct
+from   threading import Thread
+from   optparse import OptionParser
+
+from   wire_decode import decode_cbor
+
+# This tool is a reference collector for the telemetry frames pushed by pico W
+# units (see telemetry.py). It receives the frames over UDP or TCP, decodes them
+# and displays the samples. Lost frames are detected from gaps in the frame
+# sequence numbers of each unit.
+
+DEFAULT_PORT    = 2935
+UDP_RX_SIZE     = 65535
+TCP_LENGTH_FMT  = ">H"      # The length sent before each frame over TCP.
+
+class Collector(object):
+    """@brief Responsible for decoding and displaying telemetry frames."""
+
+    def __init__(self, show_samples, csv_file=None):
+        """@brief Constructor
+           @param show_samples If True each sample is displayed, else a line per frame.
+           @param csv_file A file to append the samples to or None."""
+        self._showSamples = show_samples
+        self._csvFile = csv_file
+        self._lastSeqDict = {}
+        self._lostDict = {}
+
+    def process(self, data, address):
+        """@brief Process a received frame.
+           @param data The frame bytes.
+           @param address The address of the unit that sent the frame."""
+        frame = decode_cbor(data)
+        unit = "{}/{}".format(address, frame.get("unit", ""))
+        seq = frame["seq"]
+        lost = self._lostDict.get(unit, 0)
+        if unit in self._lastSeqDict and seq > self._lastSeqDict[unit] + 1:
+            lost += seq - self._lastSeqDict[unit] - 1
+            self._lostDict[unit] = lost
+        self._lastSeqDict[unit] = seq
+
+        fields = frame["fields"]
+        samples = frame["samples"]
+        print("{} {} seq={} samples={} bytes={} lost={} metrics={}".format(time.strftime("%H:%M:%S"),
+                                                                            unit,
+                                                                            seq,
+                                                                            len(samples),
+                                                                            len(data),
+                                                                            lost,
+                                                                            frame.get("metrics", {})))
+        if self._showSamples:
+            for sample in samples:
+                print("  " + ", ".join("{}={}".format(name, value) for name, value in zip(fields, sample)))
+
+        if self._csvFile:
+            fd = open(self._csvFile, 'a')
+            for sample in samples:
+                fd.write("{},{},{},{}\n".format(unit, seq, ",".join(fields), ",".join(str(value) for value in sample)))
+            fd.close()
+
+def run_udp(collector, port):
+    """@brief Receive telemetry frames in UDP datagrams.
+       @param collector The Collector instance.
+       @param port The UDP port to listen on."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    print("Listening on UDP port {}".format(port))
+    while True:
+        data, addressPort = sock.recvfrom(UDP_RX_SIZE)
+        try:
+            collector.process(data, addressPort[0])
+        except Exception as ex:
+            print("{}: invalid frame ({})".format(addressPort[0], ex))
+
+def _read_exactly(conn, size):
+    """@brief Read a number of bytes from a TCP connection.
+       @param conn The connected socket.
+       @param size The number of bytes to read.
+       @return The bytes or None if the connection was closed."""
+    data = b""
+    while len(data) < size:
+        rxData = conn.recv(size - len(data))
+        if not rxData:
+            return None
+        data += rxData
+    return data
+
+def _serve_tcp_client(collector, conn, address):
+    """@brief Receive the telemetry frames from a unit over TCP.
+       @param collector The Collector instance.
+       @param conn The connected socket.
+       @param address The address of the unit."""
+    print("{}: connected".format(address))
+    lengthSize = struct.calcsize(TCP_LENGTH_FMT)
+    try:
+        while True:
+            lengthData = _read_exactly(conn, lengthSize)
+            if lengthData is None:
+                break
+            data = _read_exactly(conn, struct.unpack(TCP_LENGTH_FMT, lengthData)[0])
+            if data is None:
+                break
+            collector.process(data, address)
+    except Exception as ex:
+        print("{}: {}".format(address, ex))
+    finally:
+        conn.close()
+    print("{}: disconnected".format(address))
+
+def run_tcp(collector, port):
+    """@brief Receive telemetry frames over TCP connections.
+       @param collector The Collector instance.
+       @param port The TCP port to listen on."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    sock.listen(5)
+    print("Listening on TCP port {}".format(port))
+    while True:
+        conn, addressPort = sock.accept()
+        thread = Thread(target=_serve_tcp_client, args=(collector, conn, addressPort[0]))
+        thread.daemon = True
+        thread.start()
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Receive and display the telemetry frames pushed by pico W units.')
+    opts.add_option("--port",       help="The port to listen on (default={}).".format(DEFAULT_PORT), type="int", default=DEFAULT_PORT)
+    opts.add_option("--tcp",        help="Receive frames over TCP connections (default=UDP).", action="store_true", default=False)
+    opts.add_option("--samples",    help="Display each sample.", action="store_true", default=False)
+    opts.add_option("--csv",        help="A CSV file to append the samples to.", default=None)
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        collector = Collector(options.samples, options.csv)
+        if options.tcp:
+            run_tcp(collector, options.port)
+        else:
+            run_udp(collector, options.port)
+
+    #If the program throws a system exit exception
+    except SystemExit:
+      pass
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import struct
+import binascii
+from   urllib.request import Request, urlopen
+from   optparse import OptionParser
+
+# This tool reads the spans recorded by the pico W (trace.py) using the /trace REST
+# command and saves them in Chrome Trace Event format. The file can be opened in a
+# trace viewer (E.G https://ui.perfetto.dev or chrome://tracing) to show a timeline
+# of the request phases, scheduled tasks, YView/mDNS responders, WiFi operations
+# and idle GC.
+
+EVENT_FMT           = "<IBBH"       # ticks_us, phase, name ID, track. This must match Tracer.EVENT_FMT (trace.py).
+PHASE_NAMES         = ("B", "E", "i")
+PHASE_BEGIN         = 0
+PHASE_END           = 1
+PHASE_INSTANT       = 2
+TICKS_PERIOD        = 1 << 30       # The pico W ticks_us values wrap at this value.
+
+def get(address, port, cmd):
+    """@brief Send a REST command to the pico W and read the response.
+       @param address The pico W address.
+       @param port The REST server port.
+       @param cmd The command and its arguments (E.G /trace?dump=1).
+       @return The value in the response."""
+    url = "http://{}:{}{}".format(address, port, cmd)
+    response = json.loads(urlopen(Request(url)).read())
+    if response.get("ERROR"):
+        raise Exception(response.get(cmd.split('?')[0]))
+    return response[cmd.split('?')[0]]
+
+def ticks_diff(ticks1, ticks2):
+    """@brief Get the difference between two pico W ticks_us values (as time.ticks_diff()).
+       @param ticks1 The later time.
+       @param ticks2 The earlier time.
+       @return The difference in microseconds."""
+    return ((ticks1 - ticks2 + TICKS_PERIOD // 2) % TICKS_PERIOD) - TICKS_PERIOD // 2
+
+def get_events(dump):
+    """@brief Get the events in a /trace?dump=1 response.
+       @param dump The response value.
+       @return A list of tuples each holding the time (us from the first event), phase, name and track."""
+    data = binascii.unhexlify(dump["events"])
+    size = struct.calcsize(EVENT_FMT)
+    events = []
+    ts = 0
+    lastTicks = None
+    for pos in range(0, len(data) - size + 1, size):
+        ticks, phase, nameId, track = struct.unpack_from(EVENT_FMT, data, pos)
+        if lastTicks is not None:
+            ts += ticks_diff(ticks, lastTicks)
+        lastTicks = ticks
+        events.append((ts, phase, dump["names"][nameId], track))
+    return events
+
+def to_chrome(dump):
+    """@brief Convert a /trace?dump=1 response to Chrome Trace Event format. End events
+              whose begin event has been overwritten are removed and spans left open
+              when an enclosing span ends are ended with it.
+       @param dump The response value.
+       @return A tuple containing the Chrome trace dict and a dict mapping each span name to
+               a list of its durations (us)."""
+    trackNames = {}
+    for track in dump["tracks"]:
+        trackNames[int(track)] = dump["tracks"][track]
+    traceEvents = []
+    durationDict = {}
+    stackDict = {}
+    for ts, phase, name, track in get_events(dump):
+        if track not in trackNames:
+            trackNames[track] = "connection {}".format(track)
+        stack = stackDict.setdefault(track, [])
+        if phase == PHASE_BEGIN:
+            stack.append((name, ts))
+        elif phase == PHASE_END:
+            names = [span[0] for span in stack]
+            if name not in names:
+                continue
+            while True:
+                spanName, startTs = stack.pop()
+                durationDict.setdefault(spanName, []).append(ts - startTs)
+                if spanName == name:
+                    break
+                traceEvents.append({"name": spanName, "ph": "E", "ts": ts, "pid": 1, "tid": track})
+        event = {"name": name, "ph": PHASE_NAMES[phase], "ts": ts, "pid": 1, "tid": track}
+        if phase == PHASE_INSTANT:
+            event["s"] = "t"
+        traceEvents.append(event)
+
+    metaEvents = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "pico W"}}]
+    for track in sorted(trackNames):
+        metaEvents.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": track, "args": {"name": trackNames[track]}})
+    return ({"traceEvents": metaEvents + traceEvents, "displayTimeUnit": "ms"}, durationDict)
+
+def show_summary(durationDict):
+    """@brief Show the number of times each span was recorded and its duration.
+       @param durationDict A dict mapping each span name to a list of its durations (us)."""
+    print("{: <24} {: >6} {: >10} {: >10} {: >10}".format("Span", "Count", "Avg us", "Max us", "Total us"))
+    for name in sorted(durationDict, key=lambda name: -sum(durationDict[name])):
+        durations = durationDict[name]
+        print("{: <24} {: >6} {: >10.0f} {: >10} {: >10}".format(name, len(durations), sum(durations) / len(durations), max(durations), sum(durations)))
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Read the spans recorded by the pico W and save them as a Chrome trace (JSON) file.')
+    opts.add_option("--address",    help="The address of the pico W.", default=None)
+    opts.add_option("--port",       help="The REST server port (default=8080).", type="int", default=8080)
+    opts.add_option("--enable",     help="Start recording spans in a ring of this many events and clear the recorded spans before waiting (see --wait).", type="int", default=0)
+    opts.add_option("--disable",    help="Stop recording spans after reading them.", action="store_true", default=False)
+    opts.add_option("--wait",       help="The time (seconds) to wait before reading the spans (default=0).", type="float", default=0)
+    opts.add_option("--out",        help="The Chrome trace file to save (default=trace.json).", default="trace.json")
+    opts.add_option("--summary",    help="Show the count and duration of each span.", action="store_true", default=False)
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+        if not options.address:
+            raise Exception("Please define the address of the pico W using the --address option.")
+
+        if options.enable:
+            get(options.address, options.port, "/trace?enable=1?events={}".format(options.enable))
+            get(options.address, options.port, "/trace?clear=1")
+        if options.wait:
+            time.sleep(options.wait)
+
+        dump = get(options.address, options.port, "/trace?dump=1")
+        if options.disable:
+            get(options.address, options.port, "/trace?enable=0")
+
+        chromeTrace, durationDict = to_chrome(dump)
+        with open(options.out, "w") as fd:
+            json.dump(chromeTrace, fd)
+        print("Saved {} events ({} overwritten) to {}".format(len(chromeTrace["traceEvents"]), dump["dropped"], options.out))
+        if options.summary:
+            show_summary(durationDict)
+
+    #If the program throws a system exit exception
+    except SystemExit:
+      pass
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except:
+     if options.debug:
+       raise
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
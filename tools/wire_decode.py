@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import struct
+import time
+from   urllib.request import Request, urlopen
+from   optparse import OptionParser
+
+# This tool reads REST responses from the pico W in the binary encodings provided
+# by wire_format.py (fmt=cbor or fmt=struct) and decodes them. The decode_cbor() and
+# decode_struct() functions may be used by other tools that read the REST interface.
+
+CONTENT_TYPE_CBOR   = "application/cbor"
+CONTENT_TYPE_STRUCT = "application/octet-stream"
+STRUCT_HEADER       = "<BB"     # The record ID and error flag at the start of each struct record.
+
+# The struct record layouts. These must match RestServer.STRUCT_LAYOUT_DICT (rest_server.py).
+# Each record ID maps to the command and the struct format of the value.
+STRUCT_LAYOUT_DICT = {1: ("/adc",           "H"),
+                      2: ("/temperature",   "f"),
+                      3: ("/set_gpio",      "B"),
+                      4: ("/get_gpios",     "I"),
+                      5: ("/cpu_freq",      "I")}
+
+class CBORDecoder(object):
+    """@brief Responsible for decoding CBOR (RFC 8949) data."""
+
+    def __init__(self, data):
+        """@brief Constructor
+           @param data The CBOR bytes."""
+        self._data = data
+        self._pos = 0
+
+    def _read(self, count):
+        """@brief Read bytes.
+           @param count The number of bytes to read.
+           @return The bytes."""
+        if self._pos + count > len(self._data):
+            raise ValueError("CBOR data is truncated.")
+        data = self._data[self._pos:self._pos+count]
+        self._pos += count
+        return data
+
+    def _read_arg(self, info):
+        """@brief Read the argument of a data item.
+           @param info The additional information (low 5 bits) of the initial byte.
+           @return The argument."""
+        if info < 24:
+            return info
+        if info == 24:
+            return self._read(1)[0]
+        if info == 25:
+            return struct.unpack(">H", self._read(2))[0]
+        if info == 26:
+            return struct.unpack(">I", self._read(4))[0]
+        if info == 27:
+            return struct.unpack(">Q", self._read(8))[0]
+        raise ValueError("Unsupported CBOR argument ({}).".format(info))
+
+    def decode(self):
+        """@brief Decode the next data item.
+           @return The decoded object."""
+        initial = self._read(1)[0]
+        major = initial >> 5
+        info = initial & 0x1f
+        if major == 7:
+            if info == 20:
+                return False
+            if info == 21:
+                return True
+            if info == 22:
+                return None
+            if info == 25:
+                return struct.unpack(">e", self._read(2))[0]
+            if info == 26:
+                return struct.unpack(">f", self._read(4))[0]
+            if info == 27:
+                return struct.unpack(">d", self._read(8))[0]
+            raise ValueError("Unsupported CBOR simple value ({}).".format(info))
+
+        arg = self._read_arg(info)
+        if major == 0:
+            return arg
+        if major == 1:
+            return -1 - arg
+        if major == 2:
+            return self._read(arg)
+        if major == 3:
+            return self._read(arg).decode()
+        if major == 4:
+            return [self.decode() for _ in range(arg)]
+        if major == 5:
+            obj = {}
+            for _ in range(arg):
+                key = self.decode()
+                obj[key] = self.decode()
+            return obj
+        # Tags (major type 6) are not used by the pico W so the tagged item is returned.
+        return self.decode()
+
+def decode_cbor(data):
+    """@brief Decode CBOR data.
+       @param data The CBOR bytes.
+       @return The decoded object."""
+    return CBORDecoder(data).decode()
+
+def decode_struct(data):
+    """@brief Decode a struct record.
+       @param data The record bytes.
+       @return A dict in the same form as the JSON response (the command and ERROR keys)."""
+    record_id, error = struct.unpack_from(STRUCT_HEADER, data)
+    if record_id not in STRUCT_LAYOUT_DICT:
+        raise ValueError("{} is an unknown struct record ID.".format(record_id))
+    cmd, value_fmt = STRUCT_LAYOUT_DICT[record_id]
+    value = struct.unpack_from("<" + value_fmt, data, struct.calcsize(STRUCT_HEADER))[0]
+    return {"ERROR": bool(error), cmd: value}
+
+def decode_response(content_type, data):
+    """@brief Decode a REST response in any of the encodings.
+       @param content_type The content type of the response.
+       @param data The response bytes.
+       @return The decoded response dict."""
+    if content_type.startswith(CONTENT_TYPE_CBOR):
+        return decode_cbor(data)
+    if content_type.startswith(CONTENT_TYPE_STRUCT):
+        return decode_struct(data)
+    return json.loads(data.decode())
+
+def read(address, port, cmd, fmt):
+    """@brief Send a REST command to the pico W and read the response.
+       @param address The pico W address.
+       @param port The REST server port.
+       @param cmd The command and its arguments (E.G /adc?adc=0).
+       @param fmt The encoding (json, cbor or struct).
+       @return A tuple containing the content type, the response bytes and the time taken in seconds."""
+    url = "http://{}:{}{}?fmt={}".format(address, port, cmd, fmt)
+    if cmd.find('?') >= 0:
+        url = "http://{}:{}{}&fmt={}".format(address, port, cmd, fmt)
+    startTime = time.time()
+    response = urlopen(Request(url))
+    data = response.read()
+    return (response.headers.get("Content-type", ""), data, time.time() - startTime)
+
+if __name__ == "__main__":
+    opts=OptionParser(usage='Read a REST command response from the pico W in a binary encoding and decode it.')
+    opts.add_option("--address",    help="The address of the pico W.", default=None)
+    opts.add_option("--port",       help="The REST server port (default=8080).", type="int", default=8080)
+    opts.add_option("--cmd",        help="The command and its arguments (default=/adc?adc=0).", default="/adc?adc=0")
+    opts.add_option("--fmt",        help="The encoding: json, cbor or struct (default=cbor).", default="cbor")
+    opts.add_option("--count",      help="The number of times to read the response (default=1).", type="int", default=1)
+    opts.add_option("--debug",      help="Enable debugging", action="store_true", default=False)
+
+    try:
+        (options, args) = opts.parse_args()
+
+        if not options.address:
+            raise Exception("Please define the address of the pico W using the --address option.")
+
+        for _ in range(options.count):
+            content_type, data, elapsed = read(options.address, options.port, options.cmd, options.fmt)
+            print("{} ({} bytes, {:.1f} ms): {}".format(content_type, len(data), elapsed*1000.0, decode_response(content_type, data)))
+
+    #If the program throws a system exit exception
+    except SystemExit:
+      pass
+    #Don't print error information if CTRL C pressed
+    except KeyboardInterrupt:
+      pass
+    except:
+     if options.debug:
+       raise
+
+     else:
+       print(str(sys.exc_info()[1]))
+       sys.exit(1)
@@ -0,0 +1,212 @@
+import time
+import struct
+import binascii
+
+# Spans (the time between a begin and an end event) are recorded by calling the
+# module functions begin() and end(). These do nothing until tracing is enabled
+# so they may be left in the code. Each span is recorded on a track (a row in
+# the trace viewer). Spans on a track must be nested, so code that runs
+# concurrently (E.G each HTTP connection) records its spans on its own track.
+
+TRACK_MAIN          = 0     # The track of the startup and scheduled tasks.
+TRACK_YDEV          = 1     # The track of the YView and mDNS responders.
+TRACK_WIFI          = 2     # The track of the WiFi operations.
+TRACK_GC            = 3     # The track of the garbage collections.
+FIRST_DYNAMIC_TRACK = 16    # The first track returned by new_track().
+TRACK_NAMES         = {TRACK_MAIN: "main",
+                       TRACK_YDEV: "ydev",
+                       TRACK_WIFI: "wifi",
+                       TRACK_GC:   "gc"}
+
+class Tracer(object):
+    """@brief Responsible for recording span begin/end events in a fixed size ring
+              buffer so that recording allocates no memory. Each event is 8 bytes
+              holding the ticks_us time, the phase, the name ID and the track. The
+              names are held once in a list. Once the ring is full the oldest
+              events are overwritten."""
+
+    DEFAULT_EVENTS  = 256           # The default number of events held.
+    EVENT_FMT       = "<IBBH"       # ticks_us, phase, name ID, track.
+    EVENT_SIZE      = 8
+    PHASE_BEGIN     = 0
+    PHASE_END       = 1
+    PHASE_INSTANT   = 2
+    PHASE_NAMES     = ("B", "E", "i") # The Chrome trace event phase of each phase.
+    OTHER_NAME_ID   = 255           # The name ID of the spans recorded once the name table is full (the max
+                                    # name ID the EVENT_FMT name field holds).
+    OTHER_NAME      = "<other>"
+    MAX_NAMES       = OTHER_NAME_ID # The max number of span names held (name IDs 0 - 254).
+
+    def __init__(self, events=DEFAULT_EVENTS):
+        """@brief Constructor
+           @param events The number of events held."""
+        self._events = events
+        self._buf = bytearray(events * Tracer.EVENT_SIZE)
+        self._names = []
+        self._nameDict = {}
+        self.clear()
+
+    def clear(self):
+        """@brief Remove all the events."""
+        self._pos = 0
+        self._count = 0
+
+    def _get_name_id(self, name):
+        """@brief Get the ID of a span name.
+           @param name The span name.
+           @return The ID."""
+        nameId = self._nameDict.get(name)
+        if nameId is None:
+            if len(self._names) >= Tracer.MAX_NAMES:
+                return Tracer.OTHER_NAME_ID
+            nameId = len(self._names)
+            self._names.append(name)
+            self._nameDict[name] = nameId
+        return nameId
+
+    def _get_names(self):
+        """@brief Get the span names.
+           @return A list of the span names indexed by name ID. Once the name table is
+                   full OTHER_NAME (name ID OTHER_NAME_ID) is included."""
+        names = list(self._names)
+        if len(names) >= Tracer.MAX_NAMES:
+            names.append(Tracer.OTHER_NAME)
+        return names
+
+    def record(self, phase, name, track):
+        """@brief Record an event.
+           @param phase PHASE_BEGIN, PHASE_END or PHASE_INSTANT.
+           @param name The span name.
+           @param track The track."""
+        struct.pack_into(Tracer.EVENT_FMT, self._buf, self._pos * Tracer.EVENT_SIZE,
+                         time.ticks_us(), phase, self._get_name_id(name), track & 0xffff)
+        self._pos += 1
+        if self._pos >= self._events:
+            self._pos = 0
+        self._count += 1
+
+    def getEvents(self):
+        """@brief Get the events held.
+           @return A list of tuples each holding the ticks_us time, phase, name ID and track, oldest first."""
+        events = []
+        held = min(self._count, self._events)
+        index = (self._pos - held) % self._events
+        for _ in range(held):
+            events.append(struct.unpack_from(Tracer.EVENT_FMT, self._buf, index * Tracer.EVENT_SIZE))
+            index += 1
+            if index >= self._events:
+                index = 0
+        return events
+
+    def getDump(self):
+        """@brief Get the events in a compact form (tools/trace_dump.py converts this to a Chrome trace).
+           @return A dict holding
+                   names: The span names (indexed by name ID).
+                   tracks: The names of the fixed tracks.
+                   events: The events as hex encoded EVENT_FMT records, oldest first.
+                   dropped: The number of events overwritten.
+                   ticks_us: The time the dump was taken."""
+        data = bytearray()
+        for event in self.getEvents():
+            data += struct.pack(Tracer.EVENT_FMT, *event)
+        return {"names": self._get_names(),
+                "tracks": TRACK_NAMES,
+                "events": binascii.hexlify(data).decode(),
+                "dropped": max(0, self._count - self._events),
+                "ticks_us": time.ticks_us()}
+
+    def getChromeTrace(self):
+        """@brief Get the events as a Chrome Trace Event format dict. The times are in
+                  microseconds from the oldest event. End events whose begin event has
+                  been overwritten are removed. Spans left open when an enclosing span
+                  ends (E.G on a timeout) are ended with it.
+           @return A dict holding the traceEvents list."""
+        traceEvents = []
+        for track in TRACK_NAMES:
+            traceEvents.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": track, "args": {"name": TRACK_NAMES[track]}})
+        names = self._get_names()
+        # The names of the open spans on each track.
+        stackDict = {}
+        ts = 0
+        lastTicks = None
+        for ticks, phase, nameId, track in self.getEvents():
+            if lastTicks is not None:
+                ts += time.ticks_diff(ticks, lastTicks)
+            lastTicks = ticks
+            name = names[nameId]
+            stack = stackDict.setdefault(track, [])
+            if phase == Tracer.PHASE_BEGIN:
+                stack.append(name)
+            elif phase == Tracer.PHASE_END:
+                if name not in stack:
+                    continue
+                while stack[-1] != name:
+                    traceEvents.append({"name": stack.pop(), "ph": "E", "ts": ts, "pid": 1, "tid": track})
+                stack.pop()
+            event = {"name": name, "ph": Tracer.PHASE_NAMES[phase], "ts": ts, "pid": 1, "tid": track}
+            if phase == Tracer.PHASE_INSTANT:
+                event["s"] = "t"
+            traceEvents.append(event)
+        return {"traceEvents": traceEvents, "displayTimeUnit": "ms"}
+
+    def getStats(self):
+        """@brief Get the tracer statistics.
+           @return A dict holding the ring size, the number of events held, the number
+                   recorded and the number of span names."""
+        return {"size": self._events,
+                "held": min(self._count, self._events),
+                "recorded": self._count,
+                "names": len(self._names)}
+
+_tracer = None
+_nextTrack = FIRST_DYNAMIC_TRACK
+
+def enable(events=Tracer.DEFAULT_EVENTS):
+    """@brief Start recording spans. If already enabled with the same number of events this does nothing.
+       @param events The number of events held.
+       @return The Tracer instance."""
+    global _tracer
+    if _tracer is None or _tracer.getStats()["size"] != events:
+        _tracer = Tracer(events)
+    return _tracer
+
+def disable():
+    """@brief Stop recording spans and free the ring buffer."""
+    global _tracer
+    _tracer = None
+
+def get_tracer():
+    """@brief Get the Tracer instance.
+       @return The Tracer instance or None if tracing is not enabled."""
+    return _tracer
+
+def new_track():
+    """@brief Get a track for code that runs concurrently with other traced code (E.G a connection).
+       @return The track."""
+    global _nextTrack
+    track = _nextTrack
+    _nextTrack += 1
+    if _nextTrack > 0xffff:
+        _nextTrack = FIRST_DYNAMIC_TRACK
+    return track
+
+def begin(name, track=TRACK_MAIN):
+    """@brief Record the start of a span.
+       @param name The span name (E.G http.headers).
+       @param track The track."""
+    if _tracer:
+        _tracer.record(Tracer.PHASE_BEGIN, name, track)
+
+def end(name, track=TRACK_MAIN):
+    """@brief Record the end of a span.
+       @param name The span name.
+       @param track The track."""
+    if _tracer:
+        _tracer.record(Tracer.PHASE_END, name, track)
+
+def instant(name, track=TRACK_MAIN):
+    """@brief Record an event that has no duration.
+       @param name The event name.
+       @param track The track."""
+    if _tracer:
+        _tracer.record(Tracer.PHASE_INSTANT, name, track)
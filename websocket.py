@@ -0,0 +1,166 @@
+import struct
+import hashlib
+import binascii
+import uasyncio as asyncio
+
+# The WebSocket (RFC 6455) opcodes.
+OP_CONT     = 0x0
+OP_TEXT     = 0x1
+OP_BINARY   = 0x2
+OP_CLOSE    = 0x8
+OP_PING     = 0x9
+OP_PONG     = 0xa
+
+# The close status codes.
+CLOSE_NORMAL        = 1000
+CLOSE_PROTOCOL      = 1002
+CLOSE_TOO_BIG       = 1009
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11" # Appended to the client key to create the accept key.
+
+def get_accept_key(key):
+    """@brief Get the Sec-WebSocket-Accept value for a handshake.
+       @param key The Sec-WebSocket-Key header value sent by the client.
+       @return The accept key string."""
+    digest = hashlib.sha1(key.encode() + WS_GUID).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+class WebSocket(object):
+    """@brief Responsible for sending and receiving WebSocket messages on a connection
+              once the HTTPServer has completed the upgrade handshake."""
+
+    MAX_MESSAGE_SIZE    = 1024      # The max size of a received message. Larger messages close the connection.
+    WRITE_TIMEOUT_MS    = 10000     # The max time (ms) to wait for the client to accept a message.
+
+    def __init__(self, reader, writer, pending=b''):
+        """@brief Constructor
+           @param reader The reader object used to receive data.
+           @param writer The writer object used to send data.
+           @param pending Data received after the handshake request headers."""
+        self._reader = reader
+        self._writer = writer
+        self._pending = pending
+        # Frames may be sent by more than one task (E.G a pong sent while data is
+        # pushed) and only one task may wait for the writer to drain.
+        self._sendLock = asyncio.Lock()
+        self.closed = False
+
+    async def _read_exactly(self, count):
+        """@brief Read bytes from the client.
+           @param count The number of bytes to read.
+           @return The bytes."""
+        if self._pending:
+            data = self._pending[:count]
+            self._pending = self._pending[count:]
+            if len(data) == count:
+                return data
+            return data + await self._reader.readexactly(count - len(data))
+        return await self._reader.readexactly(count)
+
+    async def _read_frame(self):
+        """@brief Read a frame. ValueError is raised (its argument is the close status code)
+                  if the frame is not masked (RFC 6455 requires clients to mask all frames)
+                  or is too large.
+           @return A tuple containing the FIN flag, the opcode and the unmasked payload."""
+        hdr = await self._read_exactly(2)
+        fin = hdr[0] & 0x80
+        opcode = hdr[0] & 0x0f
+        masked = hdr[1] & 0x80
+        length = hdr[1] & 0x7f
+        if not masked:
+            raise ValueError(CLOSE_PROTOCOL)
+        if length == 126:
+            length = struct.unpack(">H", await self._read_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await self._read_exactly(8))[0]
+        if length > WebSocket.MAX_MESSAGE_SIZE:
+            raise ValueError(CLOSE_TOO_BIG)
+        mask = await self._read_exactly(4)
+        payload = bytearray(await self._read_exactly(length))
+        for i in range(length):
+            payload[i] ^= mask[i & 3]
+        return (fin, opcode, payload)
+
+    async def recv(self):
+        """@brief Receive a message. Ping and close frames are answered.
+           @return The message (str for text messages, bytes for binary messages) or
+                   None if the connection was closed."""
+        message = None
+        message_opcode = None
+        while not self.closed:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except ValueError as ex:
+                await self.close(ex.args[0])
+                return None
+            except (OSError, EOFError):
+                self.closed = True
+                return None
+
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+
+            elif opcode == OP_PONG:
+                pass
+
+            elif opcode == OP_CLOSE:
+                await self.close()
+                return None
+
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONT):
+                if opcode == OP_CONT:
+                    if message is None:
+                        await self.close(CLOSE_PROTOCOL)
+                        return None
+                    if len(message) + len(payload) > WebSocket.MAX_MESSAGE_SIZE:
+                        await self.close(CLOSE_TOO_BIG)
+                        return None
+                    message += payload
+                else:
+                    message = payload
+                    message_opcode = opcode
+                if fin:
+                    if message_opcode == OP_TEXT:
+                        return bytes(message).decode()
+                    return bytes(message)
+
+            else:
+                await self.close(CLOSE_PROTOCOL)
+                return None
+
+        return None
+
+    async def _send_frame(self, opcode, payload):
+        """@brief Send a frame (servers do not mask frames).
+           @param opcode The opcode.
+           @param payload The payload bytes."""
+        length = len(payload)
+        if length < 126:
+            hdr = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 0x10000:
+            hdr = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            hdr = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        async with self._sendLock:
+            self._writer.write(hdr)
+            self._writer.write(payload)
+            await asyncio.wait_for_ms(self._writer.drain(), WebSocket.WRITE_TIMEOUT_MS)
+
+    async def send(self, data):
+        """@brief Send a message.
+           @param data The message. A str is sent as a text message and bytes as a binary message."""
+        if isinstance(data, str):
+            await self._send_frame(OP_TEXT, data.encode())
+        else:
+            await self._send_frame(OP_BINARY, data)
+
+    async def close(self, code=CLOSE_NORMAL):
+        """@brief Send a close frame, ignoring errors as the client may have gone.
+           @param code The close status code."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self._send_frame(OP_CLOSE, struct.pack(">H", code))
+        except Exception:
+            pass
@@ -1,11 +1,12 @@
-import os
 import network
 import time
 import binascii
-import json
 from   machine import Pin
 import machine
 
+from config import Config
+import trace
+
 class WiFi(object):
     """@brief Responsible for accessing the WiFi interface."""
 
@@ -14,7 +15,7 @@ class WiFi(object):
     AP_DEFAULT_SSID             = 'PICOW'         # The prefix of the WiFi of the AP SSID when configuring the WiFi. This will be followed by the AP MAC address to make each SSID unique.
     AP_DEFAULT_PASSWORD         = '12345678'      # The password to access the PICOWXXYYZZ network when setting up the WiFi from the web interface.
     WIFI_SETUP_BUTTON_HOLD_SECS = 5               # The number of seconds the WiFi button must be held down by the user to move to WiFi setup mode.
-    WIFI_CFG_FILE               = "/wifi.cfg"     # The config file to hold to WiFi configuration (E.G SSID, password etc).
+    WIFI_CFG_SECTION            = "wifi"          # The config section holding the WiFi configuration (E.G SSID, password etc).
     AP_CHANNEL                  = 3               # The WiFi channel used in setup mode.
 
     @staticmethod
@@ -29,6 +30,7 @@ class WiFi(object):
                    The bssid is returned as a string of 6 hex characters each one separated by a '0x' characters
         """
         wifi_network_list = []
+        trace.begin("wifi.scan", trace.TRACK_WIFI)
         wlan = network.WLAN(network.STA_IF)
         wlan.active(False)
         wlan.active(True)
@@ -56,29 +58,22 @@ class WiFi(object):
             wifi_network_str = "{}:{}:{}:{}:{}:{}".format(ssid, bssid, channel, rssi, security, hidden)
             wifi_network_list.append(wifi_network_str)
 
+        trace.end("wifi.scan", trace.TRACK_WIFI)
         return ",".join(wifi_network_list)
 
-    @staticmethod
-    def GetWifiCfgDict():
-        """@brief Get the the WiFi config dict fromm from the Wifi configuration file.
-           @return The WiFi configuration dict or None if not found."""
-        wiFiCfgDict = None
-        try:
-            with open(WiFi.WIFI_CFG_FILE, "r") as read_file:
-                wiFiCfgDict = json.load(read_file)
-        except:
-            pass
-
-        return wiFiCfgDict
-
-    def __init__(self, uo, wifiButtonGPIO, useOnBoardLED=True, wifiLEDPin=-1):
+    def __init__(self, uo, wifiButtonGPIO, useOnBoardLED=True, wifiLEDPin=-1, config=None):
         """@brief Constructor
            @param uo A UO instance.
            @param wifiButtonGPIO The GPIO pin with a button to GND that is used to setup the WiFi.
            @param useOnBoardLED Use the picow on board LED to indicate the WiFi state.
            @param wifiLEDPin If an external LED is connected to indicate WiFi state
-                             this should be set to the GPIO pin number with the LED connected."""
+                             this should be set to the GPIO pin number with the LED connected.
+           @param config The Config instance holding the WiFi configuration. If None the
+                         config is loaded from flash."""
         self._uo = uo
+        self._config = config
+        if self._config is None:
+            self._config = Config(uo)
         self._useOnBoardLED = useOnBoardLED
         self._setup_mode = True
         self._wifiButtonPressedTime = None
@@ -98,18 +93,6 @@ class WiFi(object):
 
         self._nextCheckSetupTime = time.time() + 1
 
-    def _loadWifiCfg(self):
-        """@brief Load the WiFi config from the Wifi configuration file.
-           @return The WiFi configuration dict or None if not set"""
-        wiFiCfgDict = None
-        try:
-            with open(WiFi.WIFI_CFG_FILE, "r") as read_file:
-                wiFiCfgDict = json.load(read_file)
-        except:
-            pass
-
-        return wiFiCfgDict
-
     def _configAP(self, ssid, password, add_mac=False, powerSaveMode=False):
         """@brief configure the WiFi in AP mode.
            @paraam ssid The AP's SSID.
@@ -117,6 +100,7 @@ class WiFi(object):
            @param add_mac If True add part of the AP MAC address to the SSID.
            @param powerSaveMode If True then run the wiFi in power save mode.
            @return A WLAN instance."""
+        trace.begin("wifi.ap", trace.TRACK_WIFI)
         # When in AP mode we set a fixed AP address
         ap = network.WLAN(network.AP_IF)
         if not powerSaveMode:
@@ -133,6 +117,7 @@ class WiFi(object):
         self._setWiFiLED(True)
         self._wifiConnected = True
         self._staMode = False
+        trace.end("wifi.ap", trace.TRACK_WIFI)
         return ap
 
     def _configSTA(self, ssid, password, powerSaveMode=False):
@@ -141,6 +126,7 @@ class WiFi(object):
            @param password The password for the network.
            @param powerSaveMode If True then run the wiFi in power save mode.
            @return A WLAN instance."""
+        trace.begin("wifi.connect", trace.TRACK_WIFI)
         sta = network.WLAN(network.STA_IF)
         sta.active(True)
         if not powerSaveMode:
@@ -167,6 +153,7 @@ class WiFi(object):
             self._setWiFiLED(True)
             self._wifiConnected = True
             self._staMode = True
+        trace.end("wifi.connect", trace.TRACK_WIFI)
         return sta
 
     def _configWifi(self, wifiCfgDict):
@@ -192,7 +179,7 @@ class WiFi(object):
     def setup(self):
         """@brief Setup the WiFi networking.
            @return An instance of network.WLAN."""
-        wifiCfgDict = WiFi.GetWifiCfgDict()
+        wifiCfgDict = self._config.getSection(WiFi.WIFI_CFG_SECTION)
         if wifiCfgDict:
             wlan = self._configWifi(wifiCfgDict)
             self._setup_mode = False
@@ -208,11 +195,19 @@ class WiFi(object):
            @return True if setup mode is active."""
         return self._setup_mode
 
+    def setButtonHandler(self, handler):
+        """@brief Set a function to be called when the WiFi setup button is pressed.
+                  This allows checkWiFiSetupMode() to be called only while the button is
+                  pressed rather than polling it.
+           @param handler The function to call (from IRQ context). This is passed the button Pin instance."""
+        self._wifiButton.irq(handler=handler, trigger=Pin.IRQ_FALLING)
+
     def checkWiFiSetupMode(self):
         """@brief Check for WiFi setup mode.
-                  This must be called periodically to see if the user is holding down the WiFi setup button."""
+                  This must be called periodically to see if the user is holding down the WiFi setup button.
+           @return True if the WiFi setup button is pressed and so this should continue to be called."""
         if time.time() < self._nextCheckSetupTime:
-            return
+            return self._isButtonActive()
 
         if self._wifiButtonPressedTime is None:
             if self._wifiButton.value() == 0:
@@ -229,17 +224,21 @@ class WiFi(object):
                 eleapseSeconds = time.time() - self._wifiButtonPressedTime
                 self._uo.debug('Button pressed for {} of {} seconds.'.format(eleapseSeconds, WiFi.WIFI_SETUP_BUTTON_HOLD_SECS))
                 if eleapseSeconds >= WiFi.WIFI_SETUP_BUTTON_HOLD_SECS:
-                    try:
-                        os.remove(WiFi.WIFI_CFG_FILE)
-                        self._uo.info("Removed {}".format(WiFi.WIFI_CFG_FILE))
-                    except:
-                        pass
+                    self._config.removeSection(WiFi.WIFI_CFG_SECTION)
+                    if self._config.save():
+                        self._uo.info("Removed the WiFi configuration.")
                     self._uo.debug("Rebooting into AP mode to allow the Wifi to be setup.")
                     time.sleep(1)
                     machine.reset()
 
         # Define the next time we should check the wifi setup
         self._nextCheckSetupTime = time.time() + 1
+        return self._isButtonActive()
+
+    def _isButtonActive(self):
+        """@brief Determine if the WiFi setup button is pressed or a press is being timed.
+           @return True if the button is active."""
+        return self._wifiButtonPressedTime is not None or self._wifiButton.value() == 0
 
     def toggleWiFiLED(self):
         """@brief Change the state of the WiFi LED."""
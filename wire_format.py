@@ -0,0 +1,127 @@
+import json
+import struct
+
+# The encodings available for REST responses. A client selects the encoding
+# using the fmt argument (E.G /adc?adc=0?fmt=cbor) or the HTTP Accept header.
+# tools/wire_decode.py decodes the binary encodings on a PC.
+FMT_JSON    = "json"            # JSON text (the default).
+FMT_CBOR    = "cbor"            # CBOR (RFC 8949) binary encoding of the response dict.
+FMT_STRUCT  = "struct"          # A fixed layout packed record holding a single value.
+
+CONTENT_TYPE_DICT = {FMT_JSON:   "application/json",
+                     FMT_CBOR:   "application/cbor",
+                     FMT_STRUCT: "application/octet-stream"}
+
+# A struct record is the record ID (byte), the error flag (byte) and the value,
+# all little endian. E.G an ADC value (H) is 4 bytes.
+STRUCT_HEADER = "<BB"
+
+def get_format(fmt, accept):
+    """@brief Get the encoding requested by a client.
+       @param fmt The fmt argument in the request or None.
+       @param accept The HTTP Accept header in the request or None.
+       @return The encoding (FMT_JSON, FMT_CBOR or FMT_STRUCT)."""
+    if fmt:
+        fmt = fmt.lower()
+        if fmt in CONTENT_TYPE_DICT:
+            return fmt
+    elif accept:
+        for _fmt in (FMT_CBOR, FMT_STRUCT):
+            if accept.find(CONTENT_TYPE_DICT[_fmt]) >= 0:
+                return _fmt
+    return FMT_JSON
+
+def encode_json(response_dict):
+    """@brief Encode a response as JSON. Numbers at the top level of the response
+              (E.G an ADC value) are sent as strings as clients expect these.
+       @param response_dict The response dict.
+       @return The JSON string."""
+    json_dict = {}
+    for key in response_dict:
+        value = response_dict[key]
+        if not isinstance(value, bool) and isinstance(value, (int, float)):
+            value = str(value)
+        json_dict[key] = value
+    return json.dumps(json_dict)
+
+def _cbor_head(buf, major, n):
+    """@brief Add a CBOR data item head.
+       @param buf The bytearray to add to.
+       @param major The major type (0 - 7).
+       @param n The argument (value, length or count)."""
+    major <<= 5
+    if n < 24:
+        buf.append(major | n)
+    elif n < 0x100:
+        buf.append(major | 24)
+        buf.append(n)
+    elif n < 0x10000:
+        buf.append(major | 25)
+        buf.extend(struct.pack(">H", n))
+    elif n < 0x100000000:
+        buf.append(major | 26)
+        buf.extend(struct.pack(">I", n))
+    else:
+        buf.append(major | 27)
+        buf.extend(struct.pack(">Q", n))
+
+def _cbor_add(buf, obj):
+    """@brief Add an object to a CBOR encoded buffer.
+       @param buf The bytearray to add to.
+       @param obj The object (None, bool, int, float, str, bytes, list, tuple or dict)."""
+    if obj is None:
+        buf.append(0xf6)
+    elif obj is True:
+        buf.append(0xf5)
+    elif obj is False:
+        buf.append(0xf4)
+    elif isinstance(obj, int):
+        if obj >= 0:
+            _cbor_head(buf, 0, obj)
+        else:
+            _cbor_head(buf, 1, -1 - obj)
+    elif isinstance(obj, float):
+        # Use single precision if no precision is lost (MicroPython on the
+        # pico W uses single precision floats).
+        f32 = struct.pack(">f", obj)
+        if struct.unpack(">f", f32)[0] == obj:
+            buf.append(0xfa)
+            buf.extend(f32)
+        else:
+            buf.append(0xfb)
+            buf.extend(struct.pack(">d", obj))
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _cbor_head(buf, 3, len(data))
+        buf.extend(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        _cbor_head(buf, 2, len(obj))
+        buf.extend(obj)
+    elif isinstance(obj, (list, tuple)):
+        _cbor_head(buf, 4, len(obj))
+        for item in obj:
+            _cbor_add(buf, item)
+    elif isinstance(obj, dict):
+        _cbor_head(buf, 5, len(obj))
+        for key in obj:
+            _cbor_add(buf, key)
+            _cbor_add(buf, obj[key])
+    else:
+        raise ValueError("Unable to CBOR encode {}".format(type(obj)))
+
+def encode_cbor(obj):
+    """@brief Encode an object as CBOR.
+       @param obj The object (None, bool, int, float, str, bytes, list, tuple or dict).
+       @return The CBOR bytes."""
+    buf = bytearray()
+    _cbor_add(buf, obj)
+    return buf
+
+def encode_struct(record_id, value_fmt, error, value):
+    """@brief Encode a value as a fixed layout struct record.
+       @param record_id The record ID that identifies the layout to the client (0 - 255).
+       @param value_fmt The struct format character of the value (E.G H, I or f).
+       @param error True if the response is an error.
+       @param value The value.
+       @return The record bytes."""
+    return struct.pack(STRUCT_HEADER + value_fmt, record_id, int(error), value)
@@ -3,18 +3,29 @@ import json
 import uasyncio as asyncio
 
 from uo import UOBase
+import trace
 
 class YDevConfig(object):
     """@brief holds the config for the Yview device."""
 
-    def __init__(self):
-        """@brief Constructor."""
+    CFG_SECTION = "ydev" # The config section whose values replace the defaults below.
+
+    def __init__(self, config=None):
+        """@brief Constructor.
+           @param config A Config instance. Any values (E.G unit_name) in its ydev section
+                         replace the defaults. If None the defaults are used."""
         self.unit_name     = 'A_UNIT_NAME'
         self.product_id    = 'A_PRODUCT_NAME'
         self.device_type   = 'PICOW'
         self.service_list  = "WEB:80"
         self.group_name    = ""
         self.os            = "micropython"
+        if config:
+            cfgDict = config.getSection(YDevConfig.CFG_SECTION)
+            if cfgDict:
+                for key in cfgDict:
+                    if hasattr(self, key):
+                        setattr(self, key, cfgDict[key])
 
 class YDev(UOBase):
     """brief A Yview device implementation using micro python.
@@ -23,6 +34,7 @@ class YDev(UOBase):
     UDP_RX_BUFFER_SIZE       = 2048 # The maximum AYT message size.
     UDP_DEV_DISCOVERY_PORT   = 2934 # The UDP port we expect to receive UDP broadcast
                                     # are you there (AYT) messages on.
+    MDNS_MAX_PER_LOOP        = 8    # The max number of mDNS packets handled each time around the loop.
     AYT_KEY                  = "AYT" # The key in the received JSON message.
     ID_STRING                = "-!#8[dkG^v\'s!dRznE}6}8sP9}QoIR#?O&pg)Qra" # The AYT key in the RX'ed JSON
                                                                            # message must hold this value in
@@ -38,14 +50,17 @@ class YDev(UOBase):
     SERVICE_LIST_KEY         = "SERVICE_LIST" # Details of the services provided by this device (E.G WEB:80)
     GROUP_NAME_KEY           = "GROUP_NAME"   # The group name for the device. Left unset if not restricted access is needed.
 
-    def __init__(self, yDevConfig, localIPAddress, uo):
+    def __init__(self, yDevConfig, localIPAddress, uo, mdnsResponder=None):
         """@brief Constructor.
            @param yDevConfig A YDevConfig instance holding the details to be sent in AYT response messages.
            @param localIPAddress The IP address of this device.s
-           @param uo A UO instance or None if no user output messages are needed."""
+           @param uo A UO instance or None if no user output messages are needed.
+           @param mdnsResponder An MDNSResponder instance that answers mDNS queries from
+                                the same loop as AYT messages or None."""
         super().__init__(uo=uo)
         self._yDevConfig = yDevConfig
         self._localIPAddress = localIPAddress
+        self._mdnsResponder = mdnsResponder
         self._running = False
         self.listen()
 
@@ -73,16 +88,32 @@ class YDev(UOBase):
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.bind(('', YDev.UDP_DEV_DISCOVERY_PORT))
         sock.setblocking(False)
+        if self._mdnsResponder:
+            self._mdnsResponder.open()
         self._running = True
         while self._running:
+            # Answer the pending mDNS queries before checking for AYT messages.
+            if self._mdnsResponder:
+                trace.begin("ydev.mdns", trace.TRACK_YDEV)
+                try:
+                    for _ in range(YDev.MDNS_MAX_PER_LOOP):
+                        if not self._mdnsResponder.poll():
+                            break
+                finally:
+                    trace.end("ydev.mdns", trace.TRACK_YDEV)
             try:
                 rxData, addressPort = sock.recvfrom(YDev.UDP_RX_BUFFER_SIZE)
-                rxDict = json.loads(rxData)
-                self._debug("rxDict = {}".format(rxDict))
-                if YDev.AYT_KEY in rxDict:
-                    id_str = rxDict[YDev.AYT_KEY]
-                    if id_str == YDev.ID_STRING:
-                        self._send_response(sock, addressPort)
+                trace.begin("ydev.ayt", trace.TRACK_YDEV)
+                try:
+                    rxDict = json.loads(rxData)
+                    self._debug("rxDict = {}".format(rxDict))
+                    if YDev.AYT_KEY in rxDict:
+                        id_str = rxDict[YDev.AYT_KEY]
+                        if id_str == YDev.ID_STRING:
+                            self._send_response(sock, addressPort)
+                finally:
+                    # End the span if the message is malformed so that later spans are not nested in it.
+                    trace.end("ydev.ayt", trace.TRACK_YDEV)
             except:
                 # We get here primarily when no data is present on the socket
                 # when recvfrom is called.